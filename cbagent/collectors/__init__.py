@@ -13,13 +13,20 @@ from cbagent.collectors.fts_stats import (
 )
 from cbagent.collectors.jts_stats import JTSCollector
 from cbagent.collectors.latency import Latency, KVLatency, QueryLatency
+from cbagent.collectors.memcached_stats import Fragmentation, MemcachedStats
 from cbagent.collectors.observe import (
     DurabilityLatency,
     ObserveIndexLatency,
     ObserveSecondaryIndexLatency,
 )
 from cbagent.collectors.n1ql_stats import N1QLStats
-from cbagent.collectors.ns_server import NSServer, NSServerOverview, NSServerSystem, XdcrStats
+from cbagent.collectors.ns_server import (
+    NSServer,
+    NSServerOverview,
+    NSServerPerNode,
+    NSServerSystem,
+    XdcrStats,
+)
 from cbagent.collectors.secondary_debugstats import (
     SecondaryDebugStats,
     SecondaryDebugStatsBucket,
@@ -34,9 +41,14 @@ from cbagent.collectors.system import (
     IO,
     Memory,
     Net,
+    NetPorts,
     PageCache,
+    PageCacheResidency,
+    ProcFS,
     PS,
+    Syscalls,
     Sysdig,
+    Threads,
     TypePerf,
 )
 from cbagent.collectors.xdcr_lag import XdcrLag
@@ -1,12 +1,16 @@
+import signal
 import socket
 import sys
 import time
-from threading import Thread
+from json import loads
+from threading import Thread, current_thread, main_thread
+from typing import Dict, Optional
 
 import requests
 
 from cbagent.metadata_client import MetadataClient
-from cbagent.stores import PerfStore
+from cbagent.overhead import Overhead
+from cbagent.stores import LocalStore, new_store
 from logger import logger
 
 
@@ -16,6 +20,7 @@ class Collector:
 
     def __init__(self, settings):
         self.session = requests.Session()
+        self.overhead = Overhead(self.__class__.__name__.lower())
 
         self.interval = settings.interval
 
@@ -30,17 +35,45 @@ class Collector:
         self.ssh_username = getattr(settings, 'ssh_username', None)
         self.ssh_password = getattr(settings, 'ssh_password', None)
 
-        self.store = PerfStore(settings.cbmonitor_host)
+        self.compress = getattr(settings, 'compress', False)
+        self.store = new_store(
+            backend=getattr(settings, 'store', 'cbmonitor'),
+            host=settings.cbmonitor_host,
+            root=getattr(settings, 'store_dir', None),
+            buffered=getattr(settings, 'buffered', False),
+            compress=self.compress,
+            spill_file=self.spill_file,
+        )
         self.mc = MetadataClient(settings)
 
         self.metrics = set()
         self.updater = None
 
+        self.http = None  # Shared node sessions, set by the async scheduler
+
+    @property
+    def offline(self) -> bool:
+        """Local stores need no metadata registered in cbmonitor."""
+        return isinstance(self.store, LocalStore)
+
+    @property
+    def spill_file(self) -> str:
+        return '{}_{}.spill.gz'.format(self.__class__.__name__.lower(),
+                                       self.cluster)
+
+    @property
+    def writer_stats(self) -> Optional[Dict[str, int]]:
+        writer = self.store.writer
+        if writer is not None:
+            with writer.lock:
+                return dict(writer.stats)
+
     def get_http(self, path, server=None, port=8091, json=True):
         server = server or self.master_node
         url = "http://{}:{}{}".format(server, port, path)
         try:
             r = self.session.get(url=url, auth=self.auth)
+            self.overhead.add_bytes(len(r.content))
             if r.status_code in (200, 201, 202):
                 return json and r.json() or r.text
             else:
@@ -50,6 +83,12 @@ class Collector:
             logger.warn("Connection error: {}".format(url))
             return self.refresh_nodes_and_retry(path, server, port, json)
 
+    async def get_http_async(self, path, server=None, port=8091, json=True):
+        server = server or self.master_node
+        body = await self.http.get(server, port, path, self.auth)
+        self.overhead.add_bytes(len(body))
+        return json and loads(body.decode()) or body.decode()
+
     def refresh_nodes_and_retry(self, path, server=None, port=8091, json=True):
         time.sleep(self.interval)
 
@@ -97,15 +136,29 @@ class Collector:
                 continue
             yield hostname
 
+    def get_kv_nodes(self):
+        pool = self.get_http(path="/pools/default")
+        for node in pool["nodes"]:
+            hostname = node["hostname"].split(":")[0]
+            if self.hostnames is not None and hostname not in self.hostnames:
+                continue
+            if "kv" in node.get("services", ["kv"]):
+                yield hostname
+
     def _update_metric_metadata(self, metrics, bucket=None, index=None, server=None):
+        new_metrics = []
         for metric in metrics:
             metric = metric.replace('/', '_')
             metric_hash = hash((metric, bucket, index, server))
             if metric_hash not in self.metrics:
                 self.metrics.add(metric_hash)
-                self.mc.add_metric(metric, bucket, index, server, self.COLLECTOR)
+                new_metrics.append(metric)
+        if new_metrics:
+            self.mc.add_metrics(new_metrics, bucket, index, server, self.COLLECTOR)
 
     def update_metric_metadata(self, *args, **kwargs):
+        if self.offline:
+            return
         if self.updater is None or not self.updater.is_alive():
             self.updater = Thread(
                 target=self._update_metric_metadata, args=args, kwargs=kwargs
@@ -116,17 +169,45 @@ class Collector:
     def sample(self):
         raise NotImplementedError
 
+    def report_overhead(self):
+        if not self.overhead.due:
+            return
+        data = self.overhead.summary(self.writer_stats)
+        try:
+            if not self.overhead.registered and not self.offline:
+                self.mc.add_index(self.overhead.name)
+                self.mc.add_metrics(list(data), index=self.overhead.name,
+                                    collector=Overhead.COLLECTOR)
+                self.overhead.registered = True
+            self.store.append(data,
+                              cluster=self.cluster,
+                              index=self.overhead.name,
+                              collector=Overhead.COLLECTOR)
+        except Exception as e:
+            logger.warn('Failed to report overhead stats: {}'.format(e))
+
+    @staticmethod
+    def terminate(*args):
+        raise KeyboardInterrupt
+
     def collect(self):
+        if self.store.writer is not None and current_thread() is main_thread():
+            signal.signal(signal.SIGTERM, self.terminate)  # Flush on stop
+
         while True:
             try:
                 t0 = time.time()
                 self.sample()
                 delta = time.time() - t0
+                self.overhead.add_sample(delta, int(delta // self.interval))
+                self.report_overhead()
                 if delta >= self.interval:
                     continue
                 time.sleep(self.interval - delta)
             except KeyboardInterrupt:
+                self.store.close()
                 sys.exit()
             except Exception as e:
+                self.overhead.add_error()
                 logger.warn("Unexpected exception in {}: {}"
                             .format(self.__class__.__name__, e))
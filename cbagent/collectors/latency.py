@@ -1,11 +1,9 @@
-import asyncio
 import csv
 import glob
 from typing import Iterator
 
-from aiohttp import ClientSession
-
 from cbagent.collectors import Collector
+from cbagent.stores import PerfStore
 
 
 class Latency(Collector):
@@ -18,9 +16,8 @@ class Latency(Collector):
         self.mc.add_cluster()
         for bucket in self.get_buckets():
             self.mc.add_bucket(bucket)
-            for metric in self.METRICS:
-                self.mc.add_metric(metric, bucket=bucket,
-                                   collector=self.COLLECTOR)
+            self.mc.add_metrics(self.METRICS, bucket=bucket,
+                                collector=self.COLLECTOR)
 
     def sample(self):
         pass
@@ -44,29 +41,32 @@ class KVLatency(Latency):
                 for operation, timestamp, latency in reader:
                     yield operation, timestamp, latency
 
-    async def post_results(self, bucket: str):
-        async with ClientSession() as self.store.async_session:
-            for operation, timestamp, latency in self.read_stats():
-                data = {
-                    'latency_' + operation: float(latency) * 1000,  # Latency in ms
-                }
-                await self.store.append_async(data=data,
-                                              timestamp=int(timestamp),
-                                              cluster=self.cluster,
-                                              bucket=bucket,
-                                              collector=self.COLLECTOR)
+    def post_results(self, store: PerfStore, bucket: str):
+        for operation, timestamp, latency in self.read_stats():
+            data = {
+                'latency_' + operation: float(latency) * 1000,  # Latency in ms
+            }
+            store.append(data=data,
+                         timestamp=int(timestamp),
+                         cluster=self.cluster,
+                         bucket=bucket,
+                         collector=self.COLLECTOR)
 
     def reconstruct(self):
-        loop = asyncio.get_event_loop()
+        store = self.store
+        if isinstance(store, PerfStore):
+            store = PerfStore(store.host, buffered=True,
+                              spill_file=self.spill_file,
+                              compress=self.compress)
         for bucket in self.get_buckets():
-            loop.run_until_complete(self.post_results(bucket))
-        loop.close()
+            self.post_results(store, bucket)
+        store.close()
 
 
 class QueryLatency(KVLatency):
 
     COLLECTOR = "spring_query_latency"
 
-    METRICS = "latency_query",
+    METRICS = "latency_query", "latency_query_first_row"
 
     PATTERN = 'query-worker-*'
@@ -0,0 +1,253 @@
+import json
+import shlex
+import socket
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import List, Tuple
+
+import paramiko
+
+from logger import logger
+
+SAMPLER = r'''
+import glob
+import json
+import subprocess
+import sys
+import threading
+import time
+
+lock = threading.Lock()
+
+
+def send(response):
+    with lock:
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+
+def read(path):
+    try:
+        with open(path) as fh:
+            return fh.read()
+    except (IOError, OSError):
+        return ''
+
+
+def find_pid(process):
+    pid, max_rss = None, -1
+    for path in glob.glob('/proc/[0-9]*/status'):
+        status = dict(line.split(':', 1) for line in read(path).splitlines()
+                      if ':' in line)
+        if process in status.get('Name', ''):
+            rss = int((status.get('VmRSS') or '0').split()[0])
+            if rss > max_rss:
+                pid, max_rss = path.split('/')[2], rss
+    return pid
+
+
+def read_proc(processes):
+    sections = (
+        ('uptime', ['/proc/uptime']),
+        ('diskstats', ['/proc/diskstats']),
+        ('net_dev', ['/proc/net/dev']),
+        ('tcp', ['/proc/net/tcp', '/proc/net/tcp6']),
+        ('meminfo', ['/proc/meminfo']),
+    )
+    output = []
+    for name, paths in sections:
+        output.append('==> {}\n'.format(name))
+        output.extend(read(path) for path in paths)
+    for process in processes:
+        output.append('==> pid {}\n'.format(process))
+        pid = find_pid(process)
+        if pid is not None:
+            output.extend(read('/proc/{}/{}'.format(pid, name))
+                          for name in ('stat', 'status'))
+    return ''.join(output)
+
+
+def stream(request):
+    while True:
+        send({'id': request['id'], 'stdout': read_proc(request['processes']),
+              'rc': 0})
+        time.sleep(request['interval'])
+
+
+for line in iter(sys.stdin.readline, ''):
+    request = json.loads(line)
+    if 'processes' in request:
+        thread = threading.Thread(target=stream, args=(request,))
+        thread.daemon = True
+        thread.start()
+        continue
+
+    proc = subprocess.Popen(['/bin/bash', '-l', '-c', '-o', 'pipefail',
+                             request['cmd']],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    stdout = proc.communicate()[0].decode('utf-8', 'replace')
+    send({'id': request['id'], 'stdout': stdout, 'rc': proc.returncode})
+'''
+
+
+class AgentOutput(str):
+
+    """Command output with the attributes of the Fabric run result."""
+
+    def __new__(cls, stdout: str, return_code: int):
+        output = super().__new__(cls, stdout.strip())
+        output.return_code = return_code
+        output.succeeded = return_code == 0
+        output.failed = not output.succeeded
+        return output
+
+
+class AgentChannel:
+
+    """Long-lived SSH session to a host that runs a small sampler.
+
+    The sampler reads newline-delimited JSON requests and writes
+    newline-delimited JSON responses tagged with the request id. A reader
+    thread dispatches the responses by id, so a response that arrives after
+    its request timed out is simply skipped and the session is kept.
+
+    The /proc counters are read by the sampler itself, without forking any
+    process, and streamed on an interval. Other metrics still run a command
+    per request, in a single round trip over the open session.
+    """
+
+    TIMEOUT = 60  # seconds
+
+    KEEPALIVE = 60  # seconds
+
+    def __init__(self, host: str, user: str, password: str):
+        self.host = host
+        self.user = user
+        self.password = password
+
+        self.lock = Lock()
+        self.client = None
+        self.stdin = None
+        self.request_id = 0
+        self.pending = {}  # Request id -> queue of the response
+        self.streams = {}  # Stream parameters -> request id
+
+    @property
+    def connected(self) -> bool:
+        return self.client is not None and \
+            self.client.get_transport().is_active()
+
+    def connect(self):
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(self.host, username=self.user,
+                            password=self.password, timeout=self.TIMEOUT)
+        self.client.get_transport().set_keepalive(self.KEEPALIVE)
+
+        cmd = 'exec $(command -v python3 || command -v python) -u -c {}'\
+            .format(shlex.quote(SAMPLER))
+        self.stdin, stdout, _ = self.client.exec_command(cmd)
+
+        reader = Thread(target=self.read_responses, args=(self.client, stdout))
+        reader.daemon = True
+        reader.start()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+
+        for queue in self.pending.values():
+            try:
+                queue.put_nowait(None)  # Wake up the waiting requests
+            except Full:
+                pass
+        self.pending = {}
+        self.streams = {}
+
+    def read_responses(self, client: paramiko.SSHClient, stdout):
+        try:
+            for line in stdout:
+                response = json.loads(line)
+                with self.lock:
+                    is_stream = response['id'] in self.streams.values()
+                    if is_stream:
+                        queue = self.pending.get(response['id'])
+                    else:
+                        queue = self.pending.pop(response['id'], None)
+                if queue is None:
+                    continue  # The request timed out
+                try:
+                    if is_stream:
+                        queue.get_nowait()  # Keep only the latest reading
+                except Empty:
+                    pass
+                try:
+                    queue.put_nowait(response)
+                except Full:  # Closed in the meantime
+                    pass
+        except (socket.error, ValueError, paramiko.SSHException) as e:
+            logger.warn('Agent channel to {} failed: {}'.format(self.host, e))
+
+        with self.lock:
+            if self.client is client:
+                self.close()
+
+    def send(self, request: dict, stream: tuple = None) -> Tuple[int, Queue]:
+        """Send the request, return its id and the queue of its responses."""
+        with self.lock:
+            if not self.connected:
+                self.close()
+                self.connect()
+
+            self.request_id += 1
+            request['id'] = self.request_id
+            queue = self.pending[self.request_id] = Queue(maxsize=1)
+            if stream is not None:
+                self.streams[stream] = self.request_id
+            try:
+                self.stdin.write(json.dumps(request) + '\n')
+                self.stdin.flush()
+            except (socket.error, paramiko.SSHException) as e:
+                logger.warn('Agent channel to {} failed: {}'.format(self.host,
+                                                                    e))
+                self.close()  # Reconnect on the next request
+                raise
+            return self.request_id, queue
+
+    def receive(self, request_id: int, queue: Queue,
+                timeout: float = None) -> AgentOutput:
+        try:
+            response = queue.get(timeout=timeout or self.TIMEOUT)
+        except Empty:
+            with self.lock:
+                if request_id not in self.streams.values():
+                    self.pending.pop(request_id, None)  # Skip the late response
+            raise socket.timeout('No response from {} to request {}'
+                                 .format(self.host, request_id))
+
+        if response is None:
+            raise socket.error('Agent channel to {} closed'.format(self.host))
+        return AgentOutput(response['stdout'], response['rc'])
+
+    def run(self, cmd: str, timeout: int = None, **kwargs) -> AgentOutput:
+        request_id, queue = self.send({'cmd': cmd})
+        return self.receive(request_id, queue, timeout)
+
+    def read_proc(self, processes: List[str], interval: float) -> AgentOutput:
+        """Return the next /proc reading streamed by the sampler.
+
+        The stream is started on the first call and after a reconnect. The
+        output has the same sections as the output of ProcStats.composite_cmd.
+        """
+        stream = tuple(processes), interval
+        with self.lock:
+            request_id = self.streams.get(stream)
+            queue = self.pending.get(request_id)
+
+        if queue is None:
+            request_id, queue = self.send({'processes': list(processes),
+                                           'interval': interval},
+                                          stream=stream)
+
+        return self.receive(request_id, queue, timeout=interval + self.TIMEOUT)
@@ -0,0 +1,178 @@
+import base64
+import json
+import shlex
+from typing import Dict
+
+from cbagent.collectors.libstats.remotestats import RemoteStats, parallel_task
+
+HELPER = r'''
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import sys
+import time
+
+lease, pidfile, output, interval, budget, partitions = sys.argv[1:7]
+interval, budget = float(interval), int(budget)
+partitions = json.loads(partitions)
+
+libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+libc.mmap.restype = ctypes.c_void_p
+libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                      ctypes.c_int, ctypes.c_int, ctypes.c_long]
+libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                         ctypes.POINTER(ctypes.c_ubyte)]
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+MAP_FAILED = ctypes.c_void_p(-1).value
+COUCHSTORE = re.compile(r'\d+\.couch\.\d+$')
+
+
+def kind(path):
+    if COUCHSTORE.search(path):
+        return 'couchstore'
+    if 'magma' in path:
+        return 'magma'
+    if 'plasma' in path or '@2i' in path:
+        return 'plasma'
+    return 'other'
+
+
+def resident_pages(path, size):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, 1, 1, fd, 0)  # PROT_READ, MAP_SHARED
+    finally:
+        os.close(fd)
+    if addr is None or addr == MAP_FAILED:
+        return 0
+    try:
+        num_pages = (size + PAGE_SIZE - 1) // PAGE_SIZE
+        vec = (ctypes.c_ubyte * num_pages)()
+        if libc.mincore(addr, size, vec):
+            return 0
+        return num_pages - bytes(vec).count(b'\0')
+    finally:
+        libc.munmap(addr, size)
+
+
+with open(pidfile, 'w') as fh:
+    fh.write(str(os.getpid()))
+
+files = {}  # path -> [mtime, size, resident pages, purpose]
+queue = []  # Unchanged files waiting for a refresh
+
+while time.time() - os.stat(lease).st_mtime < 60:
+    t0 = time.time()
+    seen = set()
+    scanned = 0
+    for purpose, root in partitions.items():
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                entry = files.get(path)
+                if entry and entry[:2] == [st.st_mtime, st.st_size]:
+                    continue
+                try:
+                    pages = st.st_size and resident_pages(path, st.st_size)
+                except OSError:
+                    continue
+                files[path] = [st.st_mtime, st.st_size, pages, purpose]
+                scanned += st.st_size
+
+    for path in set(files) - seen:
+        del files[path]
+
+    # Refresh unchanged files round-robin within the budget
+    if not queue:
+        queue = list(files)
+    while queue and scanned < budget:
+        path = queue.pop()
+        entry = files.get(path)
+        if entry is None:
+            continue
+        try:
+            entry[2] = entry[1] and resident_pages(path, entry[1])
+        except OSError:
+            continue
+        scanned += entry[1] or PAGE_SIZE
+
+    stats = {}
+    for path, (_, size, pages, purpose) in files.items():
+        for key in purpose, '{}_{}'.format(purpose, kind(path)):
+            totals = stats.setdefault(key, [0, 0])
+            totals[0] += size
+            totals[1] += min(pages * PAGE_SIZE, size)
+
+    with open(output + '.tmp', 'w') as fh:
+        json.dump({'stats': stats, 'scan_time': time.time() - t0}, fh)
+    os.rename(output + '.tmp', output)
+
+    time.sleep(max(interval - (time.time() - t0), 0))
+
+os.remove(output)
+'''
+
+
+class MincoreStats(RemoteStats):
+
+    """Track the page cache residency of data and index files.
+
+    A helper process on every host maps the files and calls mincore. It
+    keeps the residency of every file between samples: files that changed
+    are rescanned on every pass, unchanged files are refreshed round-robin
+    within a fixed budget of bytes per pass. The residency is weighted by
+    the file size.
+
+    The helper is started on the first sample and exits on its own once the
+    samples stop renewing its lease.
+    """
+
+    LEASE = '/tmp/cbagent_mincore.lease'
+
+    PIDFILE = '/tmp/cbagent_mincore.pid'
+
+    OUTPUT = '/tmp/cbagent_mincore.json'
+
+    SCRIPT = '/tmp/cbagent_mincore.py'
+
+    SCAN_BUDGET = 16 * 1024 ** 3  # Bytes of unchanged files per pass
+
+    def helper_cmd(self, partitions: Dict[str, str], interval: float) -> str:
+        args = [self.LEASE, self.PIDFILE, self.OUTPUT, str(interval),
+                str(self.SCAN_BUDGET), json.dumps(partitions)]
+        script = base64.b64encode(HELPER.encode()).decode()
+        return \
+            'touch {lease}; kill -0 $(cat {pidfile} 2>/dev/null) 2>/dev/null || ' \
+            '{{ echo {b64} | base64 -d > {script}; ' \
+            'nohup $(command -v python3 || command -v python) {script} {args} ' \
+            '> /dev/null 2>&1 & }}; cat {output} 2>/dev/null; true'.format(
+                lease=self.LEASE, pidfile=self.PIDFILE, script=self.SCRIPT,
+                b64=script,
+                args=' '.join(shlex.quote(arg) for arg in args),
+                output=self.OUTPUT)
+
+    @parallel_task(server_side=True)
+    def get_samples(self, partitions: Dict[str, str]) -> dict:
+        stdout = self.run(self.helper_cmd(partitions, self.interval or 5),
+                          quiet=True)
+        if not stdout.strip():
+            return {}
+
+        samples = {}
+        data = json.loads(stdout)
+        for key, (total_bytes, resident_bytes) in data['stats'].items():
+            samples[key + '_page_cache_total_bytes'] = total_bytes
+            samples[key + '_page_cache_resident_bytes'] = resident_bytes
+            samples[key + '_page_cache_rr'] = \
+                total_bytes and 100 * resident_bytes / total_bytes
+        samples['page_cache_scan_time'] = data['scan_time']
+        return samples
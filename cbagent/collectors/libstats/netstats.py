@@ -0,0 +1,224 @@
+import socket
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from cbagent.collectors.libstats.procstats import (
+    ProcStats,
+    parse_net_dev,
+    parse_uptime,
+    split_sections,
+)
+from cbagent.collectors.libstats.remotestats import RemoteStats, parallel_task
+
+SERVICE_PORTS = {
+    'kv': (11209, 11210, 11207),
+    'rest': (8091, 18091),
+    'views': (8092, 18092),
+    'query': (8093, 18093),
+    'fts': (8094, 18094),
+    'analytics': (8095, 18095),
+    'eventing': (8096, 18096),
+    'index': tuple(range(9100, 9106)),
+}
+
+XDCR_PORTS = 11210, 11207, 8092, 18092  # Ports of the remote cluster
+
+PORT_GROUPS = {port: group
+               for group, ports in SERVICE_PORTS.items() for port in ports}
+
+
+def resolve_hosts(hosts: Iterable[str]) -> Set[str]:
+    """Resolve the hostnames of the cluster spec to the IPs reported by ss."""
+    addresses = set()
+    for host in hosts:
+        try:
+            addresses.add(socket.gethostbyname(host))
+        except socket.error:
+            addresses.add(host)  # IPv6 addresses are kept as is
+    return addresses
+
+
+def parse_snmp(lines: List[str]) -> Dict[str, int]:
+    """Parse the "Tcp:" header and value lines of /proc/net/snmp."""
+    tcp = [line.split()[1:] for line in lines if line.startswith('Tcp:')]
+    if len(tcp) < 2:
+        return {}
+    return {name: int(value) for name, value in zip(tcp[0], tcp[1])}
+
+
+def split_address(address: str) -> Tuple[str, int]:
+    host, port = address.rsplit(':', 1)
+    host = host.strip('[]')
+    if host.startswith('::ffff:'):
+        host = host[len('::ffff:'):]
+    return host, int(port)
+
+
+def parse_ss(lines: List[str]) -> Dict[tuple, dict]:
+    """Parse "ss -tin" output by (local address, peer address).
+
+    Every connection has a line with the state, the queues and the
+    addresses followed by an indented line with the TCP info.
+    """
+    connections = {}
+    conn = None
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0] == 'State':
+            continue
+        if not line[0].isspace() and len(fields) >= 5:
+            state, recv_q, send_q, local, peer = fields[:5]
+            try:
+                conn = {
+                    'state': state,
+                    'recv_q': int(recv_q),
+                    'send_q': int(send_q),
+                    'local': split_address(local),
+                    'peer': split_address(peer),
+                    'bytes_sent': 0,
+                    'bytes_received': 0,
+                    'retrans': 0,
+                }
+            except ValueError:
+                conn = None
+                continue
+            connections[conn['local'], conn['peer']] = conn
+        elif conn is not None:
+            for field in fields:
+                if field.startswith('bytes_acked:'):
+                    conn['bytes_sent'] = int(field.split(':')[1])
+                elif field.startswith('bytes_received:'):
+                    conn['bytes_received'] = int(field.split(':')[1])
+                elif field.startswith('retrans:'):
+                    conn['retrans'] = int(field.split('/')[-1])
+    return connections
+
+
+def service_group(conn: dict, cluster_hosts: set) -> str:
+    local_port, (peer_host, peer_port) = conn['local'][1], conn['peer']
+    if peer_port in XDCR_PORTS and peer_host not in cluster_hosts:
+        return 'xdcr'
+    if local_port in PORT_GROUPS:
+        return PORT_GROUPS[local_port]
+    if peer_port in PORT_GROUPS:
+        return PORT_GROUPS[peer_port]
+    return 'other'
+
+
+class NetPortStats(RemoteStats):
+
+    """Sample network traffic by service port without sleeping.
+
+    Bytes, retransmits and socket queues are read from "ss -tin", interface
+    and protocol totals from /proc/net/dev and /proc/net/snmp. The counters
+    are differenced against the previous sample in the calling process.
+    Connections opened since the previous sample are counted in full.
+
+    Outgoing connections to the data or CAPI ports of hosts outside of the
+    cluster are attributed to XDCR.
+    """
+
+    SNMP_COUNTERS = (
+        ('tcp_in_segs', 'InSegs'),
+        ('tcp_out_segs', 'OutSegs'),
+        ('tcp_retrans_segs', 'RetransSegs'),
+        ('tcp_in_errs', 'InErrs'),
+        ('tcp_active_opens', 'ActiveOpens'),
+        ('tcp_passive_opens', 'PassiveOpens'),
+    )
+
+    CMD = "echo '==> uptime'; cat /proc/uptime; " \
+        "echo '==> net_dev'; cat /proc/net/dev; " \
+        "echo '==> snmp'; cat /proc/net/snmp; " \
+        "echo '==> ss'; ss -tin; true"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.ifaces = {}
+        self.previous = {}
+        self.cluster_hosts = resolve_hosts(self.hosts)
+
+    @parallel_task(server_side=True)
+    def detect_iface(self) -> str:
+        stdout = self.run('ip route list | grep default')
+        return stdout.strip().split()[4]
+
+    @parallel_task(server_side=True)
+    def get_counters(self) -> str:
+        return self.run(self.CMD, quiet=True)
+
+    def get_samples(self) -> Dict[str, dict]:
+        if not self.ifaces:
+            self.ifaces = self.detect_iface()
+
+        samples = {}
+        for host, stdout in self.get_counters().items():
+            curr = {}
+            for header, lines in split_sections(stdout):
+                if header[0] == 'uptime':
+                    curr['uptime'] = parse_uptime(lines)
+                elif header[0] == 'net_dev':
+                    curr['ifaces'] = parse_net_dev(lines)
+                elif header[0] == 'snmp':
+                    curr['snmp'] = parse_snmp(lines)
+                elif header[0] == 'ss':
+                    curr['connections'] = parse_ss(lines)
+
+            prev = self.previous.get(host)
+            self.previous[host] = curr
+            if prev is not None and curr['uptime'] > prev['uptime']:
+                samples[host] = self.compute_rates(host, prev, curr)
+        return samples
+
+    def compute_rates(self, host: str, prev: dict, curr: dict) -> dict:
+        dt = curr['uptime'] - prev['uptime']
+        stats = {}
+
+        iface = self.ifaces[host]
+        if iface in curr['ifaces'] and iface in prev['ifaces']:
+            for metric, column in ProcStats.NET_METRICS:
+                delta = curr['ifaces'][iface][column] - \
+                    prev['ifaces'][iface][column]
+                stats[metric] = delta / dt
+
+        snmp, prev_snmp = curr['snmp'], prev['snmp']
+        for metric, counter in self.SNMP_COUNTERS:
+            if counter in snmp and counter in prev_snmp:
+                stats[metric + '_per_sec'] = \
+                    (snmp[counter] - prev_snmp[counter]) / dt
+        out_segs = stats.get('tcp_out_segs_per_sec')
+        if out_segs:
+            stats['tcp_retrans_ratio'] = \
+                100 * stats['tcp_retrans_segs_per_sec'] / out_segs
+        stats['tcp_curr_estab'] = snmp.get('CurrEstab', 0)
+
+        stats.update(self.port_rates(prev, curr, dt))
+        return stats
+
+    def port_rates(self, prev: dict, curr: dict, dt: float) -> Dict[str, float]:
+        groups = defaultdict(lambda: defaultdict(float))
+        for key, conn in curr['connections'].items():
+            group = groups[service_group(conn, self.cluster_hosts)]
+            if conn['state'] == 'ESTAB':
+                group['connections'] += 1
+            elif conn['state'] == 'TIME-WAIT':
+                group['time_wait'] += 1
+            group['send_q'] += conn['send_q']
+            group['recv_q'] += conn['recv_q']
+
+            prev_conn = prev['connections'].get(key, {})
+            for counter in 'bytes_sent', 'bytes_received', 'retrans':
+                delta = conn[counter] - prev_conn.get(counter, 0)
+                group[counter] += max(delta, 0)
+
+        stats = {}
+        for name, group in groups.items():
+            stats[name + '_connections'] = group['connections']
+            stats[name + '_time_wait'] = group['time_wait']
+            stats[name + '_send_q'] = group['send_q']
+            stats[name + '_recv_q'] = group['recv_q']
+            stats[name + '_bytes_sent_per_sec'] = group['bytes_sent'] / dt
+            stats[name + '_bytes_received_per_sec'] = group['bytes_received'] / dt
+            stats[name + '_retrans_per_sec'] = group['retrans'] / dt
+        return stats
@@ -0,0 +1,289 @@
+from typing import Dict, Iterator, List, Tuple
+
+from cbagent.collectors.libstats.remotestats import RemoteStats, parallel_task
+
+SECTOR_SIZE = 512  # /proc/diskstats always counts 512-byte sectors
+
+TCP_STATES = {
+    '01': 'ESTABLISHED',
+    '06': 'TIME_WAIT',
+}
+
+
+def split_sections(stdout: str) -> Iterator[Tuple[List[str], List[str]]]:
+    """Split the output of the composite command by "==> name args" headers."""
+    header, lines = None, []
+    for line in stdout.splitlines():
+        if line.startswith('==> '):
+            if header is not None:
+                yield header, lines
+            header, lines = line.split()[1:], []
+        elif header is not None:
+            lines.append(line)
+    if header is not None:
+        yield header, lines
+
+
+def parse_uptime(lines: List[str]) -> float:
+    return float(lines[0].split()[0])
+
+
+def parse_diskstats(lines: List[str]) -> Dict[str, List[int]]:
+    """Return the I/O counters by device name.
+
+    https://www.kernel.org/doc/Documentation/ABI/testing/procfs-diskstats
+    """
+    stats = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 14:
+            stats[fields[2]] = [int(v) for v in fields[3:14]]
+    return stats
+
+
+def parse_net_dev(lines: List[str]) -> Dict[str, List[int]]:
+    stats = {}
+    for line in lines:
+        if ':' in line:
+            iface, counters = line.split(':', 1)
+            stats[iface.strip()] = [int(v) for v in counters.split()]
+    return stats
+
+
+def parse_tcp(lines: List[str]) -> Dict[str, int]:
+    stats = dict.fromkeys(TCP_STATES.values(), 0)
+    for line in lines:
+        fields = line.split()
+        if len(fields) > 3 and fields[3] in TCP_STATES:
+            stats[TCP_STATES[fields[3]]] += 1
+    return stats
+
+
+def parse_meminfo(lines: List[str]) -> Dict[str, int]:
+    stats = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 2:
+            stats[fields[0].rstrip(':')] = int(fields[1]) * 1024  # kB -> B
+    return stats
+
+
+def parse_pid_stat(line: str) -> int:
+    """Return the CPU time (user + system) of a process in clock ticks.
+
+    The command name may contain spaces, so the fields are counted from the
+    closing parenthesis.
+    """
+    fields = line.rsplit(')', 1)[1].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def parse_pid_status(lines: List[str]) -> Dict[str, int]:
+    stats = {}
+    for line in lines:
+        fields = line.split()
+        if fields and fields[0] in ('VmRSS:', 'VmSize:'):
+            stats[fields[0].rstrip(':')] = int(fields[1]) * 1024  # kB -> B
+    return stats
+
+
+def parse_sample(stdout: str) -> dict:
+    sample = {'processes': {}}
+    for header, lines in split_sections(stdout):
+        name = header[0]
+        if name == 'uptime':
+            sample['uptime'] = parse_uptime(lines)
+        elif name == 'diskstats':
+            sample['disks'] = parse_diskstats(lines)
+        elif name == 'net_dev':
+            sample['ifaces'] = parse_net_dev(lines)
+        elif name == 'tcp':
+            sample['tcp'] = parse_tcp(lines)
+        elif name == 'meminfo':
+            sample['meminfo'] = parse_meminfo(lines)
+        elif name == 'pid' and len(lines) > 1:
+            process = header[1]
+            stats = parse_pid_status(lines[1:])
+            stats['cpu_ticks'] = parse_pid_stat(lines[0])
+            sample['processes'][process] = stats
+    return sample
+
+
+class ProcStats(RemoteStats):
+
+    """Sample processes, disks, network and memory from /proc directly.
+
+    All counters of a host are read by a single command that does not
+    sleep. The rates are computed by differencing consecutive samples
+    against the uptime of the host, so the sampling interval is only bounded
+    by the round trip to the host.
+
+    The samples are kept in the calling process because Fabric runs every
+    task in a forked process. In the agent mode the sampler on the host reads
+    the same counters itself and streams them on the sampling interval.
+    """
+
+    DISK_METRICS = (
+        ('rps', 0),      # Reads completed
+        ('wps', 4),      # Writes completed
+        ('rbps', 2),     # Sectors read
+        ('wbps', 6),     # Sectors written
+    )
+
+    NET_METRICS = (
+        ('in_bytes_per_sec', 0),
+        ('in_packets_per_sec', 1),
+        ('out_bytes_per_sec', 8),
+        ('out_packets_per_sec', 9),
+    )
+
+    PID_CMD = "pid=$(ps -eo rss,pid,comm | grep '{0}' | grep -v grep | " \
+        "sort -n | tail -n 1 | awk '{{print $2}}'); echo '==> pid {0}'; " \
+        "[ -n \"$pid\" ] && cat /proc/$pid/stat /proc/$pid/status"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.devices = {}
+        self.ifaces = {}
+        self.clk_tck = {}
+        self.previous = {}
+
+    def composite_cmd(self, processes: List[str]) -> str:
+        cmds = [
+            "echo '==> uptime'; cat /proc/uptime",
+            "echo '==> diskstats'; cat /proc/diskstats",
+            "echo '==> net_dev'; cat /proc/net/dev",
+            "echo '==> tcp'; cat /proc/net/tcp /proc/net/tcp6 2>/dev/null",
+            "echo '==> meminfo'; cat /proc/meminfo",
+        ]
+        cmds += [self.PID_CMD.format(process) for process in processes]
+        return '; '.join(cmds) + '; true'
+
+    def get_device_name(self, path: str) -> str:
+        stdout = self.run("basename $(readlink -f $(df '{}' | tail -n 1 | "
+                          "awk '{{print $1}}'))".format(path), quiet=True)
+        return stdout.strip()
+
+    def detect_iface(self) -> str:
+        stdout = self.run('ip route list | grep default')
+        return stdout.strip().split()[4]
+
+    def get_host_info(self, paths: Dict[str, str]) -> dict:
+        return {
+            'devices': {purpose: self.get_device_name(path)
+                        for purpose, path in paths.items()},
+            'iface': self.detect_iface(),
+            'clk_tck': int(self.run('getconf CLK_TCK')),
+        }
+
+    @parallel_task(server_side=True)
+    def get_server_info(self, partitions: dict) -> dict:
+        return self.get_host_info(partitions['server'])
+
+    @parallel_task(server_side=False)
+    def get_client_info(self, partitions: dict) -> dict:
+        return self.get_host_info(partitions['client'])
+
+    def read_counters(self, processes: List[str]) -> str:
+        if self.remote_mode == 'agent':
+            return self.channel(self.current.host).read_proc(processes,
+                                                             self.interval)
+        return self.run(self.composite_cmd(processes), quiet=True)
+
+    @parallel_task(server_side=True)
+    def get_server_counters(self, processes: List[str]) -> str:
+        return self.read_counters(processes)
+
+    @parallel_task(server_side=False)
+    def get_client_counters(self, processes: List[str]) -> str:
+        return self.read_counters(processes)
+
+    def update_host_info(self, info: Dict[str, dict]):
+        for host, host_info in info.items():
+            self.devices[host] = host_info['devices']
+            self.ifaces[host] = host_info['iface']
+            self.clk_tck[host] = host_info['clk_tck']
+
+    def get_samples(self, partitions: dict, server_processes: List[str],
+                    client_processes: List[str]) -> Dict[str, dict]:
+        if not self.clk_tck:
+            self.update_host_info(self.get_server_info(partitions))
+            if self.workers:
+                self.update_host_info(self.get_client_info(partitions))
+
+        samples = {}
+        for host, stdout in self.get_server_counters(server_processes).items():
+            samples.update(self.compute_samples(host, stdout, server=True))
+        if self.workers:
+            for host, stdout in self.get_client_counters(client_processes).items():
+                samples.update(self.compute_samples(host, stdout, server=False))
+        return samples
+
+    def compute_samples(self, host: str, stdout: str, server: bool) -> dict:
+        """Compute the metrics of the atop, iostat, net and meminfo collectors.
+
+        Only the process and disk metrics are reported for the clients.
+        """
+        curr = parse_sample(stdout)
+        prev = self.previous.get(host)
+        self.previous[host] = curr
+        if prev is None or curr['uptime'] <= prev['uptime']:
+            return {}
+
+        dt = curr['uptime'] - prev['uptime']
+        samples = {
+            'atop': self.process_rates(host, prev, curr, dt),
+            'iostat': self.disk_rates(host, prev, curr, dt),
+        }
+        if server:
+            samples['net'] = dict(self.net_rates(host, prev, curr, dt),
+                                  **curr['tcp'])
+            samples['meminfo'] = curr['meminfo']
+        return {host: samples}
+
+    def process_rates(self, host: str, prev: dict, curr: dict,
+                      dt: float) -> Dict[str, float]:
+        stats = {}
+        for process, curr_stats in curr['processes'].items():
+            stats[process + '_rss'] = curr_stats.get('VmRSS', 0)
+            stats[process + '_vsize'] = curr_stats.get('VmSize', 0)
+
+            prev_stats = prev['processes'].get(process)
+            if prev_stats is not None:
+                ticks = curr_stats['cpu_ticks'] - prev_stats['cpu_ticks']
+                if ticks >= 0:  # The process may have restarted
+                    cpu = 100 * ticks / self.clk_tck[host] / dt
+                    stats[process + '_cpu'] = cpu
+        return stats
+
+    def disk_rates(self, host: str, prev: dict, curr: dict,
+                   dt: float) -> Dict[str, float]:
+        stats = {}
+        for purpose, device in self.devices[host].items():
+            if device not in curr['disks'] or device not in prev['disks']:
+                continue
+            delta = [c - p for c, p in zip(curr['disks'][device],
+                                           prev['disks'][device])]
+            for metric, column in self.DISK_METRICS:
+                rate = delta[column] / dt
+                if metric in ('rbps', 'wbps'):
+                    rate *= SECTOR_SIZE
+                stats['{}_{}'.format(purpose, metric)] = rate
+
+            num_ios = delta[0] + delta[4]
+            io_time = delta[3] + delta[7]  # ms
+            stats[purpose + '_await'] = num_ios and io_time / num_ios
+            stats[purpose + '_avgqusz'] = delta[10] / 1000 / dt
+            stats[purpose + '_util'] = min(100 * delta[9] / 1000 / dt, 100)
+        return stats
+
+    def net_rates(self, host: str, prev: dict, curr: dict,
+                  dt: float) -> Dict[str, float]:
+        iface = self.ifaces[host]
+        if iface not in curr['ifaces'] or iface not in prev['ifaces']:
+            return {}
+        delta = [c - p for c, p in zip(curr['ifaces'][iface],
+                                       prev['ifaces'][iface])]
+        return {metric: delta[column] / dt
+                for metric, column in self.NET_METRICS}
@@ -1,13 +1,19 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
 
 from decorator import decorator
 from fabric.api import env, hide, parallel, run, settings
 from fabric.tasks import execute
 
+from cbagent.collectors.libstats.agent import AgentChannel
+
 env.shell = '/bin/bash -l -c -o pipefail'
 env.keepalive = 60
 env.timeout = 60
 
+fabric_lock = Lock()  # The Fabric environment is shared by all threads
+
 
 def parallel_task(server_side=True):
 
@@ -20,24 +26,53 @@ def parallel_task(server_side=True):
         else:
             hosts = self.workers
 
-        with settings(user=self.user, password=self.password, warn_only=True):
-            with hide("running", "output"):
-                return execute(parallel(task), *args, hosts=hosts, **kargs)
+        if self.remote_mode == 'agent':
+            return self.execute_on_channels(task, hosts, *args, **kargs)
+
+        with fabric_lock:
+            with settings(user=self.user, password=self.password, warn_only=True):
+                with hide("running", "output"):
+                    return execute(parallel(task), *args, hosts=hosts, **kargs)
 
     return _parallel_task
 
 
 class RemoteStats:
 
-    def __init__(self, hosts, workers, user, password, interval=None):
+    def __init__(self, hosts, workers, user, password, interval=None,
+                 remote_mode='fabric'):
         self.hosts = hosts
         self.user = user
         self.password = password
         self.workers = workers
         self.interval = interval
 
+        self.remote_mode = remote_mode
+        self.channels = {}
+        self.current = local()  # The host of the task in the current thread
+        self.executor = None
+
+    def channel(self, host: str) -> AgentChannel:
+        if host not in self.channels:
+            self.channels[host] = AgentChannel(host, self.user, self.password)
+        return self.channels[host]
+
+    def execute_on_channels(self, task, hosts, *args, **kwargs) -> dict:
+        """Run the task for all hosts in threads using the agent channels."""
+        if self.executor is None:
+            num_hosts = len(set(self.hosts) | set(self.workers))
+            self.executor = ThreadPoolExecutor(max_workers=max(num_hosts, 1))
+
+        def _execute(host):
+            self.current.host = host
+            return task(*args, **kwargs)
+
+        return dict(zip(hosts, self.executor.map(_execute, hosts)))
+
     def run(self, *args, **kwargs):
         try:
+            if self.remote_mode == 'agent':
+                return self.channel(self.current.host).run(*args, **kwargs)
             return run(*args, **kwargs)
         except KeyboardInterrupt:
             sys.exit()
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from typing import Dict, List
+
+from cbagent.collectors.libstats.procstats import parse_uptime, split_sections
+from cbagent.collectors.libstats.remotestats import RemoteStats, parallel_task
+
+PERF_EVENTS = (
+    'pread64',
+    'pwrite64',
+    'read',
+    'write',
+    'fsync',
+    'fdatasync',
+)
+
+
+def parse_pid_io(lines: List[str]) -> Dict[str, int]:
+    stats = {}
+    for line in lines:
+        if ':' in line:
+            counter, value = line.split(':', 1)
+            stats[counter] = int(value)
+    return stats
+
+
+def parse_perf_intervals(lines: List[str]) -> Dict[str, float]:
+    """Return the counts of the last complete interval of "perf stat -I -x,".
+
+    The last interval may still be written, so the one before it is used.
+    Counters that are not supported by the kernel have no numeric count.
+    """
+    intervals = defaultdict(dict)
+    for line in lines:
+        fields = line.split(',')
+        if len(fields) < 4 or line.startswith('#'):
+            continue
+        try:
+            timestamp, count = float(fields[0]), float(fields[1])
+        except ValueError:
+            continue
+        event = fields[3].split(':sys_enter_')[-1]
+        intervals[timestamp][event] = count
+
+    timestamps = sorted(intervals)
+    if len(timestamps) < 2:
+        return {}
+    return intervals[timestamps[-2]]
+
+
+class SyscallStats(RemoteStats):
+
+    """Sample I/O system call rates from /proc/<pid>/io.
+
+    Optionally, the rates of individual system calls are counted by a
+    "perf stat" helper that keeps running on the host between samples. The
+    helper is restarted when the process changes, and it exits on its own
+    once the samples stop renewing its lease.
+    """
+
+    IO_COUNTERS = (
+        'syscr',        # Read system calls
+        'syscw',        # Write system calls
+        'rchar',        # Bytes passed to read calls
+        'wchar',        # Bytes passed to write calls
+        'read_bytes',   # Bytes fetched from the storage layer
+        'write_bytes',  # Bytes sent to the storage layer
+    )
+
+    PERF_INTERVAL = 1000  # ms
+
+    PERF_LEASE = 60  # seconds
+
+    PID_CMD = "pid=$(ps -eo rss,pid,comm | grep '{0}' | grep -v grep | " \
+        "sort -n | tail -n 1 | awk '{{print $2}}'); echo '==> io {0}'; " \
+        "[ -n \"$pid\" ] && cat /proc/$pid/io"
+
+    PERF_CMD = \
+        "out=/tmp/cbagent_perf_{0}_$pid.csv; lease=/tmp/cbagent_perf_{0}.lease; " \
+        "touch $lease; " \
+        "if [ -n \"$pid\" ] && ! pgrep -f \"perf stat .*$out\" > /dev/null; then " \
+        "nohup bash -c \"perf stat -x, -I {1} -e {2} -p $pid -o $out & p=\\$!; " \
+        "while kill -0 \\$p && [ \\$((\\$(date +%s) - \\$(stat -c %Y $lease))) " \
+        "-lt {3} ]; do sleep 5; done; kill \\$p; rm -f $out\" " \
+        "> /dev/null 2>&1 & fi; " \
+        "echo '==> perf {0}'; tail -n {4} $out 2>/dev/null"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.previous = {}
+
+    def composite_cmd(self, processes: List[str], perf: bool) -> str:
+        events = ','.join('syscalls:sys_enter_{}'.format(event)
+                          for event in PERF_EVENTS)
+        cmds = ["echo '==> uptime'; cat /proc/uptime"]
+        for process in processes:
+            cmds.append(self.PID_CMD.format(process))
+            if perf:
+                cmds.append(self.PERF_CMD.format(
+                    process, self.PERF_INTERVAL, events, self.PERF_LEASE,
+                    3 * len(PERF_EVENTS)))
+        return '; '.join(cmds) + '; true'
+
+    @parallel_task(server_side=True)
+    def get_counters(self, processes: List[str], perf: bool) -> str:
+        return self.run(self.composite_cmd(processes, perf), quiet=True)
+
+    def get_samples(self, processes: List[str], perf: bool = False) -> Dict[str, dict]:
+        samples = {}
+        for host, stdout in self.get_counters(processes, perf).items():
+            curr = {'io': {}, 'perf': {}}
+            for header, lines in split_sections(stdout):
+                if header[0] == 'uptime':
+                    curr['uptime'] = parse_uptime(lines)
+                elif header[0] == 'io' and lines:
+                    curr['io'][header[1]] = parse_pid_io(lines)
+                elif header[0] == 'perf':
+                    curr['perf'][header[1]] = parse_perf_intervals(lines)
+
+            prev = self.previous.get(host)
+            self.previous[host] = curr
+            if prev is not None and curr['uptime'] > prev['uptime']:
+                samples[host] = self.compute_rates(prev, curr)
+        return samples
+
+    def compute_rates(self, prev: dict, curr: dict) -> Dict[str, float]:
+        dt = curr['uptime'] - prev['uptime']
+        stats = {}
+        for process, counters in curr['io'].items():
+            prev_counters = prev['io'].get(process, {})
+            for counter in self.IO_COUNTERS:
+                if counter not in counters or counter not in prev_counters:
+                    continue
+                delta = counters[counter] - prev_counters[counter]
+                if delta >= 0:  # The process may have restarted
+                    stats['{}_{}'.format(process, counter)] = delta / dt
+
+        for process, counts in curr['perf'].items():
+            for event, count in counts.items():
+                rate = count / (self.PERF_INTERVAL / 1000)
+                stats['{}_{}'.format(process, event)] = rate
+        return stats
@@ -1,3 +1,4 @@
+import socket
 from typing import List
 
 from fabric.exceptions import CommandTimeout
@@ -19,7 +20,7 @@ class SysdigStat(RemoteStats):
 
         try:
             stdout = self.run(cmd, timeout=5, quiet=True)
-        except CommandTimeout:
+        except (CommandTimeout, socket.timeout):  # Fabric or agent channel
             return 0
         else:
             num_calls = int(stdout)
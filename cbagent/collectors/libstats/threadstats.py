@@ -0,0 +1,124 @@
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+from cbagent.collectors.libstats.procstats import parse_uptime, split_sections
+from cbagent.collectors.libstats.remotestats import RemoteStats, parallel_task
+
+
+def thread_group(name: str) -> str:
+    """Strip the thread index so that the threads of a pool share a name.
+
+    Examples: "mc:worker_12" -> "mc_worker", "ReaderPool3" -> "ReaderPool".
+    """
+    name = re.sub(r'[-_:.#]?\d+$', '', name)
+    return re.sub(r'\W+', '_', name).strip('_') or 'unnamed'
+
+
+def parse_threads(lines: List[str]) -> Dict[str, dict]:
+    """Parse "stat|schedstat|voluntary nonvoluntary" lines by thread id."""
+    threads = {}
+    for line in lines:
+        try:
+            stat, schedstat, ctx_switches = line.rsplit('|', 2)
+            tid, rest = stat.split(' (', 1)
+            name, fields = rest.rsplit(') ', 1)
+            fields = fields.split()
+            voluntary, involuntary = ctx_switches.split()
+            threads[tid] = {
+                'group': thread_group(name),
+                'cpu_ticks': int(fields[11]) + int(fields[12]),
+                'runq_wait_ns': int(schedstat.split()[1]),
+                'voluntary': int(voluntary),
+                'involuntary': int(involuntary),
+            }
+        except (IndexError, ValueError):
+            continue  # The thread exited while being read
+    return threads
+
+
+class ThreadStats(RemoteStats):
+
+    """Sample CPU usage, context switches and run queue wait per thread.
+
+    The threads are grouped by name with the index stripped, so the metrics
+    describe thread pools rather than individual threads. The rates are
+    computed in the calling process, see ProcStats for details.
+    """
+
+    # Only shell builtins inside the loop, processes have hundreds of threads
+    THREADS_CMD = \
+        "pid=$(ps -eo rss,pid,comm | grep '{0}' | grep -v grep | " \
+        "sort -n | tail -n 1 | awk '{{print $2}}'); echo '==> threads {0}'; " \
+        "[ -n \"$pid\" ] && for t in /proc/$pid/task/*; do " \
+        "read -r stat < $t/stat; read -r sched < $t/schedstat; v=; n=; " \
+        "while read -r k val; do case $k in " \
+        "voluntary_ctxt_switches:) v=$val;; " \
+        "nonvoluntary_ctxt_switches:) n=$val;; esac; done < $t/status; " \
+        "echo \"$stat|$sched|$v $n\"; done"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.clk_tck = {}
+        self.previous = {}
+
+    def composite_cmd(self, processes: List[str]) -> str:
+        cmds = ["echo '==> uptime'; cat /proc/uptime"]
+        cmds += [self.THREADS_CMD.format(process) for process in processes]
+        return '; '.join(cmds) + '; true'
+
+    @parallel_task(server_side=True)
+    def get_clk_tck(self) -> int:
+        return int(self.run('getconf CLK_TCK'))
+
+    @parallel_task(server_side=True)
+    def get_counters(self, processes: List[str]) -> str:
+        return self.run(self.composite_cmd(processes), quiet=True)
+
+    def get_samples(self, processes: List[str]) -> Dict[str, dict]:
+        if not self.clk_tck:
+            self.clk_tck = self.get_clk_tck()
+
+        samples = {}
+        for host, stdout in self.get_counters(processes).items():
+            curr = {'processes': {}}
+            for header, lines in split_sections(stdout):
+                if header[0] == 'uptime':
+                    curr['uptime'] = parse_uptime(lines)
+                elif header[0] == 'threads':
+                    curr['processes'][header[1]] = parse_threads(lines)
+
+            prev = self.previous.get(host)
+            self.previous[host] = curr
+            if prev is not None and curr['uptime'] > prev['uptime']:
+                samples[host] = self.compute_rates(host, prev, curr)
+        return samples
+
+    def compute_rates(self, host: str, prev: dict, curr: dict) -> dict:
+        dt = curr['uptime'] - prev['uptime']
+        stats = {}
+        for process, threads in curr['processes'].items():
+            prev_threads = prev['processes'].get(process, {})
+
+            groups = defaultdict(lambda: defaultdict(float))
+            for tid, thread in threads.items():
+                group = groups[thread['group']]
+                group['threads'] += 1
+
+                prev_thread = prev_threads.get(tid)
+                if prev_thread is None or prev_thread['group'] != thread['group']:
+                    continue  # A new thread or a reused thread id
+                for counter in 'cpu_ticks', 'runq_wait_ns', 'voluntary', 'involuntary':
+                    group[counter] += thread[counter] - prev_thread[counter]
+
+            for name, group in groups.items():
+                prefix = '{}_{}'.format(process, name)
+                stats[prefix + '_threads'] = group['threads']
+                stats[prefix + '_cpu'] = \
+                    100 * group['cpu_ticks'] / self.clk_tck[host] / dt
+                stats[prefix + '_runq_wait'] = \
+                    100 * group['runq_wait_ns'] / 10 ** 9 / dt  # % of a core
+                stats[prefix + '_voluntary_ctxsw'] = group['voluntary'] / dt
+                stats[prefix + '_involuntary_ctxsw'] = group['involuntary'] / dt
+        return stats
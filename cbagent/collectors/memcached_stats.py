@@ -0,0 +1,223 @@
+import re
+import socket
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from mc_bin_client.mc_bin_client import MemcachedClient, MemcachedError
+
+from cbagent.collectors import Collector
+from cbagent.histograms import histogram_percentiles
+from logger import logger
+
+HISTOGRAM_BUCKET = re.compile(r'^(.+)_(\d+),(\d+)$')
+
+TCMALLOC_CLASS = re.compile(r'class\s+\d+\s+\[\s*(\d+) bytes \]\s*:\s*(\d+) objs')
+
+SIZE_BANDS = 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384  # bytes
+
+
+def decode_stats(stats: dict) -> dict:
+    """Decode the bytes keys and values returned by the memcached client."""
+    return {
+        key.decode() if isinstance(key, bytes) else key:
+        value.decode() if isinstance(value, bytes) else value
+        for key, value in stats.items()
+    }
+
+
+def parse_histograms(stats: dict) -> Dict[str, Dict[Tuple[int, int], int]]:
+    """Group the "<name>_<low>,<high>" timing stats by histogram name."""
+    histograms = defaultdict(dict)
+    for key, value in stats.items():
+        match = HISTOGRAM_BUCKET.match(key)
+        if match:
+            name, low, high = match.groups()
+            histograms[name][int(low), int(high)] = int(value)
+    return histograms
+
+
+def parse_size_classes(text: str) -> Dict[int, Tuple[int, int]]:
+    """Parse the allocated and wasted bytes by size class.
+
+    jemalloc reports the used and the total regions of every bin, only the
+    first (merged) bins table is used. tcmalloc reports the free objects
+    in its caches, the allocated bytes are unknown.
+    """
+    size_classes = {}
+    lines = iter(text.splitlines())
+    for line in lines:
+        if line.lstrip().startswith('bins:'):
+            columns = line.split()[1:]
+            for row in lines:
+                fields = row.split()
+                if fields == ['---']:  # Skipped size classes
+                    continue
+                if len(fields) < len(columns) or not fields[0].isdigit():
+                    break
+                row = dict(zip(columns, fields))
+                size, used = int(row['size']), int(row['curregs'])
+                total = int(row['curslabs']) * int(row['regs'])
+                size_classes[size] = size * used, size * (total - used)
+            return size_classes
+
+    for size, objects in TCMALLOC_CLASS.findall(text):
+        size_classes[int(size)] = 0, int(size) * int(objects)
+    return size_classes
+
+
+def size_band(size: int) -> str:
+    for band in SIZE_BANDS:
+        if size <= band:
+            return 'le_{}'.format(band)
+    return 'gt_{}'.format(SIZE_BANDS[-1])
+
+
+class MemcachedStats(Collector):
+
+    """Stream selected stat groups over the memcached binary protocol.
+
+    A connection is kept open per node and bucket and re-established on the
+    next sample after a failure. The timing histograms are cumulative, so the
+    percentiles are computed over the difference between two consecutive
+    samples. Numeric stats are stored as they are.
+    """
+
+    COLLECTOR = "memcached_stats"
+
+    PORT = 11210
+
+    STAT_GROUPS = 'memory', 'timings', 'dispatcher', 'kvtimings'
+
+    PERCENTILES = 50, 95, 99
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.password = settings.bucket_password
+
+        self.clients = {}
+        self.histograms = {}
+        self.unsupported_groups = set()
+
+    def connect(self, host: str, bucket: str) -> MemcachedClient:
+        if (host, bucket) not in self.clients:
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+            mc = MemcachedClient(host=host, port=self.PORT, family=family)
+            mc.sasl_auth_plain(user=bucket, password=self.password)
+            self.clients[host, bucket] = mc
+        return self.clients[host, bucket]
+
+    def disconnect(self, host: str, bucket: str):
+        mc = self.clients.pop((host, bucket), None)
+        if mc is not None:
+            mc.close()
+
+    def get_stats(self, host: str, bucket: str) -> dict:
+        mc = self.connect(host, bucket)
+        stats = {}
+        for group in self.STAT_GROUPS:
+            if group in self.unsupported_groups:
+                continue
+            try:
+                stats.update(decode_stats(mc.stats(group)))
+            except MemcachedError:
+                logger.warn('Unsupported stat group: {}'.format(group))
+                self.unsupported_groups.add(group)
+        return stats
+
+    def compute_stats(self, host: str, bucket: str, stats: dict) -> dict:
+        histograms = parse_histograms(stats)
+        prev_histograms = self.histograms.get((host, bucket))
+        self.histograms[host, bucket] = histograms
+
+        samples = {}
+        for key, value in stats.items():
+            if HISTOGRAM_BUCKET.match(key):
+                continue
+            try:
+                samples[re.sub(r'\W', '_', key)] = float(value)
+            except ValueError:
+                continue
+
+        if prev_histograms is None:
+            return samples
+
+        for name, histogram in histograms.items():
+            prev_histogram = prev_histograms.get(name, {})
+            bounds = sorted(histogram)
+            counts = [max(histogram[b] - prev_histogram.get(b, 0), 0)
+                      for b in bounds]
+            if not sum(counts):
+                continue
+            lows, highs = zip(*bounds)
+            name = re.sub(r'\W', '_', name)
+            values = histogram_percentiles(lows, highs, counts, self.PERCENTILES)
+            for percentile, value in zip(self.PERCENTILES, values):
+                samples['{}_{}th'.format(name, percentile)] = float(value)
+        return samples
+
+    def sample(self):
+        nodes = list(self.get_kv_nodes())
+        for bucket in self.get_buckets():
+            for node in nodes:
+                try:
+                    stats = self.get_stats(node, bucket)
+                except (EOFError, socket.error, MemcachedError) as e:
+                    logger.warn('Failed to read stats from {}/{}: {}'
+                                .format(node, bucket, e))
+                    self.disconnect(node, bucket)
+                    continue
+
+                stats = self.compute_stats(node, bucket, stats)
+                if not stats:
+                    continue
+                self.update_metric_metadata(stats.keys(), bucket, server=node)
+                self.store.append(stats, cluster=self.cluster, bucket=bucket,
+                                  server=node, collector=self.COLLECTOR)
+
+    def update_metadata(self):
+        self.mc.add_cluster()
+
+        for bucket in self.get_buckets():
+            self.mc.add_bucket(bucket)
+        for node in self.get_kv_nodes():
+            self.mc.add_server(node)
+
+
+class Fragmentation(MemcachedStats):
+
+    """Track the heap fragmentation and the waste by allocator size class.
+
+    The fragmentation ratio is computed like in the fragmentation tests,
+    from the memory stats of the bucket. The size classes are reported by
+    the allocator for the whole process and summed up in fixed bands, so
+    that the series are the same for any allocator.
+    """
+
+    COLLECTOR = "memcached_fragmentation"
+
+    STAT_GROUPS = 'memory', 'allocator'
+
+    MEMORY_STATS = (
+        'mem_used',
+        'total_allocated_bytes',
+        'total_fragmentation_bytes',
+        'total_free_mapped_bytes',
+        'total_free_unmapped_bytes',
+        'total_heap_bytes',
+    )
+
+    def compute_stats(self, host: str, bucket: str, stats: dict) -> dict:
+        samples = {key: float(stats[key])
+                   for key in self.MEMORY_STATS if key in stats}
+        if samples.get('total_heap_bytes') and 'mem_used' in samples:
+            samples['fragmentation_ratio'] = \
+                100 * (1 - samples['mem_used'] / samples['total_heap_bytes'])
+
+        size_classes = parse_size_classes(stats.get('detailed', ''))
+        for size, (allocated, wasted) in size_classes.items():
+            band = size_band(size)
+            for metric, value in ('allocated', allocated), ('wasted', wasted):
+                key = '{}_{}_bytes'.format(metric, band)
+                samples[key] = samples.get(key, 0) + value
+        return samples
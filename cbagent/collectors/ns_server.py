@@ -1,10 +1,29 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 from cbagent.collectors import Collector
 
 
 class NSServer(Collector):
 
+    """Collect the bucket stats of ns_server.
+
+    By default, only the most recent of the samples returned by ns_server is
+    stored. In the incremental mode, the timestamp of the last sample is
+    tracked per bucket and every newer sample is stored with its original
+    timestamp, so the interval may exceed the ns_server resolution.
+    """
+
     COLLECTOR = "ns_server"
 
+    MAX_MINUTE_INTERVAL = 60  # seconds, longer intervals need the hour zoom
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.incremental = getattr(settings, 'ns_server_mode', 'last') == 'incremental'
+        self.last_timestamps = {}
+
     def _get_stats_uri(self):
         for bucket, stats in self.get_buckets(with_stats=True):
             uri = stats["uri"]
@@ -12,6 +31,9 @@ class NSServer(Collector):
 
     def _get_stats(self, uri):
         samples = self.get_http(path=uri)  # get last minute samples
+        return self._parse_samples(samples)
+
+    def _parse_samples(self, samples):
         stats = {}
 
         if samples["op"]["lastTStamp"] == 0:
@@ -23,8 +45,47 @@ class NSServer(Collector):
             stats[metric] = values[-1]  # only the most recent sample
         return stats
 
+    def _incremental_uri(self, uri, bucket):
+        zoom = 'minute' if self.interval < self.MAX_MINUTE_INTERVAL else 'hour'
+        uri = '{}?zoom={}'.format(uri, zoom)
+        if bucket in self.last_timestamps:
+            uri += '&haveTStamp={}'.format(self.last_timestamps[bucket])
+        return uri
+
+    def _parse_points(self, bucket, samples):
+        """Return the samples newer than the last one seen as (ts, stats) pairs.
+
+        Only the most recent sample is used on the first request, the older
+        samples predate the collection.
+        """
+        if samples["op"]["lastTStamp"] == 0:
+            return []
+
+        samples = samples['op']['samples']
+        timestamps = samples.pop('timestamp', [])
+        if bucket not in self.last_timestamps:
+            first = max(len(timestamps) - 1, 0)
+        else:
+            first = 0
+
+        points = []
+        last_timestamp = self.last_timestamps.get(bucket, 0)
+        for i, timestamp in enumerate(timestamps[first:], start=first):
+            if timestamp <= last_timestamp:
+                continue
+            stats = {}
+            for metric, values in samples.items():
+                if i < len(values):
+                    stats[metric.replace('/', '_')] = values[i]
+            points.append((timestamp * 10 ** 6, stats))  # ms -> ns
+            self.last_timestamps[bucket] = timestamp
+        return points
+
     def sample(self):
         for uri, bucket in self._get_stats_uri():
+            if self.incremental:
+                self._sample_incremental(uri, bucket)
+                continue
             stats = self._get_stats(uri)
             if not stats:
                 continue
@@ -32,6 +93,41 @@ class NSServer(Collector):
             self.store.append(stats, cluster=self.cluster, bucket=bucket,
                               collector=self.COLLECTOR)
 
+    def _sample_incremental(self, uri, bucket):
+        samples = self.get_http(path=self._incremental_uri(uri, bucket))
+        for timestamp, stats in self._parse_points(bucket, samples):
+            self.update_metric_metadata(stats.keys(), bucket)
+            self.store.append(stats, cluster=self.cluster, bucket=bucket,
+                              collector=self.COLLECTOR, timestamp=timestamp)
+
+    async def _sample_incremental_async(self, uri, bucket):
+        samples = await self.get_http_async(
+            path=self._incremental_uri(uri, bucket))
+        for timestamp, stats in self._parse_points(bucket, samples):
+            self.update_metric_metadata(stats.keys(), bucket)
+            await self.store.append_async(stats, cluster=self.cluster,
+                                          bucket=bucket,
+                                          collector=self.COLLECTOR,
+                                          timestamp=timestamp)
+
+    async def sample_async(self):
+        buckets = await self.get_http_async(path='/pools/default/buckets')
+        for bucket in buckets:
+            if self.buckets is not None and bucket['name'] not in self.buckets:
+                continue
+            if self.incremental:
+                await self._sample_incremental_async(bucket['stats']['uri'],
+                                                     bucket['name'])
+                continue
+            samples = await self.get_http_async(path=bucket['stats']['uri'])
+            stats = self._parse_samples(samples)
+            if not stats:
+                continue
+            self.update_metric_metadata(stats.keys(), bucket['name'])
+            await self.store.append_async(stats, cluster=self.cluster,
+                                          bucket=bucket['name'],
+                                          collector=self.COLLECTOR)
+
     def update_metadata(self):
         self.mc.add_cluster()
 
@@ -45,7 +141,10 @@ class NSServerOverview(NSServer):
 
     def _get_overview_stats(self):
         overview = self.get_http(path='/pools/default/overviewStats')
+        return self._parse_overview(overview)
 
+    @staticmethod
+    def _parse_overview(overview):
         stats = {}
         for metric, values in overview.items():
             stats[metric] = values[-1]  # only the most recent sample
@@ -59,10 +158,91 @@ class NSServerOverview(NSServer):
         self.store.append(overview, cluster=self.cluster,
                           collector=self.COLLECTOR)
 
+    async def sample_async(self):
+        overview = await self.get_http_async(path='/pools/default/overviewStats')
+        overview = self._parse_overview(overview)
+        if not overview:
+            return
+
+        await self.store.append_async(overview, cluster=self.cluster,
+                                      collector=self.COLLECTOR)
+
     def update_metadata(self):
         self.update_metric_metadata(self.METRICS)
 
 
+class NSServerPerNode(NSServer):
+
+    """Collect the bucket stats of every data node.
+
+    The stats of all buckets and nodes are fetched concurrently from the
+    nodes themselves, using a bounded pool of threads. Besides the series of
+    every server, the skew between the nodes is stored per bucket as the
+    ratio of the maximum to the mean value.
+    """
+
+    COLLECTOR = "ns_server_per_node"
+
+    MAX_THREADS = 8
+
+    IMBALANCE_METRICS = 'ops', 'mem_used', 'disk_write_queue'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.executor = None
+
+    def _get_node_stats(self, bucket, server):
+        uri = '/pools/default/buckets/{}/nodes/{}:8091/stats'.format(bucket,
+                                                                     server)
+        stats = self._parse_samples(self.get_http(path=uri, server=server))
+        if stats:
+            stats['disk_write_queue'] = \
+                stats.get('ep_queue_size', 0) + stats.get('ep_flusher_todo', 0)
+        return bucket, server, stats
+
+    def _get_imbalance(self, server_stats):
+        stats = {}
+        for metric in self.IMBALANCE_METRICS:
+            values = [s[metric] for s in server_stats if metric in s]
+            if not values:
+                continue
+            mean = sum(values) / len(values)
+            stats[metric + '_max'] = max(values)
+            stats[metric + '_imbalance'] = mean and max(values) / mean
+        return stats
+
+    def sample(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.MAX_THREADS)
+
+        nodes = list(self.get_kv_nodes())
+        tasks = [(bucket, node) for bucket in self.get_buckets() for node in nodes]
+
+        bucket_stats = defaultdict(list)
+        for bucket, server, stats in self.executor.map(
+                lambda task: self._get_node_stats(*task), tasks):
+            if not stats:
+                continue
+            bucket_stats[bucket].append(stats)
+
+            self.update_metric_metadata(stats.keys(), bucket, server=server)
+            self.store.append(stats, cluster=self.cluster, server=server,
+                              bucket=bucket, collector=self.COLLECTOR)
+
+        for bucket, server_stats in bucket_stats.items():
+            stats = self._get_imbalance(server_stats)
+            self.update_metric_metadata(stats.keys(), bucket)
+            self.store.append(stats, cluster=self.cluster, bucket=bucket,
+                              collector=self.COLLECTOR)
+
+    def update_metadata(self):
+        super().update_metadata()
+
+        for node in self.get_kv_nodes():
+            self.mc.add_server(node)
+
+
 class NSServerSystem(NSServer):
 
     COLLECTOR = "ns_server_system"
@@ -1,42 +1,111 @@
 import os
+import re
+import time
+from typing import Dict
+
+import numpy as np
 
 from cbagent.collectors import Collector
+from cbagent.stores import PerfStore
+
+STATS_LINE = re.compile(r'duration:\s*(\d+),\s*Nth-latency:\s*(\d+)')
+
+
+def parse_statsfile(text: str) -> Dict[str, np.ndarray]:
+    """Parse the duration and the Nth latency of every line at once.
+
+    Format for statsfile is-
+    id:1, rows:0, duration:8632734534, Nth-latency:16686556
+    """
+    points = np.array(STATS_LINE.findall(text), dtype=np.int64).reshape(-1, 2)
+    return {'duration': points[:, 0], 'Nth-latency': points[:, 1]}
+
+
+def read_statsfile(path: str) -> Dict[str, np.ndarray]:
+    with open(path) as fh:
+        return parse_statsfile(fh.read())
+
+
+class StatsFileTail:
+
+    """Read the lines appended to the file since the previous read.
+
+    The offset is kept between reads and an incomplete last line is left for
+    the next read. The offset is reset if the file is truncated or replaced.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+
+    def read(self) -> str:
+        try:
+            with open(self.path, 'rb') as fh:
+                if os.fstat(fh.fileno()).st_size < self.offset:
+                    self.offset = 0
+                fh.seek(self.offset)
+                chunk = fh.read()
+        except IOError:
+            return ''
+
+        end = chunk.rfind(b'\n') + 1
+        self.offset += end
+        return chunk[:end].decode()
 
 
 class SecondaryLatencyStats(Collector):
 
+    """Push every scan recorded in the stats file since the last sample.
+
+    A sample can carry thousands of points, so they are appended in bulk to
+    the local store or batched by a buffered writer for cbmonitor.
+    """
+
     COLLECTOR = "secondaryscan_latency"
 
+    METRICS = "duration", "Nth-latency"
+
     SECONDARY_STATS_FILE = '/root/statsfile'
 
     def __init__(self, settings):
         super().__init__(settings)
         self.interval = settings.lat_interval
+        self.tail = StatsFileTail(self.SECONDARY_STATS_FILE)
+        self.last_sample = None
 
-    def _get_secondaryscan_latency(self):
-        stats = {}
-        if os.path.isfile(self.SECONDARY_STATS_FILE):
-            with open(self.SECONDARY_STATS_FILE, 'rb') as fh:
-                try:
-                    next(fh).decode()
-                    fh.seek(-200, 2)
-                    last = fh.readlines()[-1].decode()
-                    duration = last.split(',')[-1]
-                    stats = {}
-                    latency = duration.split(':')[1]
-                    latency = latency.rstrip()
-                    latency_key = duration.split(':')[0]
-                    latency_key = latency_key.strip()
-                    stats[latency_key] = int(latency)
-                except (StopIteration, IOError):
-                    pass
-        return stats
+        if isinstance(self.store, PerfStore) and self.store.writer is None:
+            self.store = PerfStore(self.store.host, buffered=True,
+                                   spill_file=self.spill_file,
+                                   compress=self.compress)
+
+    def _get_secondaryscan_latency(self) -> Dict[str, np.ndarray]:
+        return parse_statsfile(self.tail.read())
 
     def sample(self):
+        now = int(time.time() * 10 ** 9)
+        start = self.last_sample or now - int(self.interval * 10 ** 9)
+        self.last_sample = now
+
         stats = self._get_secondaryscan_latency()
-        if stats:
-            self.update_metric_metadata(stats.keys())
-            self.store.append(stats, cluster=self.cluster, collector=self.COLLECTOR)
+        num_points = stats['duration'].size
+        if not num_points:
+            return
+
+        # The lines carry no time, spread them evenly over the interval
+        timestamps = np.linspace(start, now, num_points + 1)[1:].astype(np.int64)
+
+        self.update_metric_metadata(self.METRICS)
+        if self.offline:
+            for metric, values in stats.items():
+                self.store.append_series(metric, timestamps, values,
+                                         cluster=self.cluster,
+                                         collector=self.COLLECTOR)
+            return
+
+        for i, timestamp in enumerate(timestamps.tolist()):
+            data = {metric: int(values[i]) for metric, values in stats.items()}
+            self.store.append(data, timestamp=timestamp,
+                              cluster=self.cluster, collector=self.COLLECTOR)
 
     def update_metadata(self):
         self.mc.add_cluster()
@@ -1,10 +1,15 @@
 from cbagent.collectors import Collector
 from cbagent.collectors.libstats.iostat import DiskStats, IOStat
 from cbagent.collectors.libstats.meminfo import MemInfo
+from cbagent.collectors.libstats.mincore import MincoreStats
 from cbagent.collectors.libstats.net import NetStat
+from cbagent.collectors.libstats.netstats import NetPortStats
 from cbagent.collectors.libstats.pcstat import PCStat
+from cbagent.collectors.libstats.procstats import ProcStats
 from cbagent.collectors.libstats.psstats import PSStats
+from cbagent.collectors.libstats.syscalls import SyscallStats
 from cbagent.collectors.libstats.sysdig import SysdigStat
+from cbagent.collectors.libstats.threadstats import ThreadStats
 from cbagent.collectors.libstats.typeperfstats import TPStats
 
 
@@ -30,6 +35,7 @@ class System(Collector):
 
     def __init__(self, settings):
         self.settings = settings
+        self.remote_mode = getattr(settings, 'remote_mode', 'fabric')
 
         super().__init__(settings)
 
@@ -45,7 +51,8 @@ class PS(System):
                                workers=self.workers,
                                user=self.ssh_username,
                                password=self.ssh_password,
-                               interval=self.interval)
+                               interval=self.interval,
+                               remote_mode=self.remote_mode)
 
     def sample(self):
         for process in self.settings.server_processes:
@@ -69,7 +76,8 @@ class IO(System):
         self.sampler = IOStat(hosts=self.nodes,
                               workers=self.workers,
                               user=self.ssh_username,
-                              password=self.ssh_password)
+                              password=self.ssh_password,
+                              remote_mode=self.remote_mode)
 
     def sample(self):
         for node, stats in self.sampler.get_server_samples(self.partitions).items():
@@ -91,7 +99,8 @@ class Disk(System):
         self.sampler = DiskStats(hosts=self.nodes,
                                  workers=self.workers,
                                  user=self.ssh_username,
-                                 password=self.ssh_password)
+                                 password=self.ssh_password,
+                                 remote_mode=self.remote_mode)
 
         self.initial_stats = {}
 
@@ -116,7 +125,8 @@ class PageCache(System):
         self.sampler = PCStat(hosts=self.nodes,
                               workers=self.workers,
                               user=self.ssh_username,
-                              password=self.ssh_password)
+                              password=self.ssh_password,
+                              remote_mode=self.remote_mode)
 
     def sample(self):
         for node, stats in self.sampler.get_samples(self.partitions).items():
@@ -133,7 +143,8 @@ class Net(System):
         self.sampler = NetStat(hosts=self.nodes,
                                workers=self.workers,
                                user=self.ssh_username,
-                               password=self.ssh_password)
+                               password=self.ssh_password,
+                               remote_mode=self.remote_mode)
 
     def sample(self):
         for node, stats in self.sampler.get_samples().items():
@@ -161,7 +172,8 @@ class Sysdig(System):
         self.sampler = SysdigStat(hosts=self.nodes,
                                   workers=self.workers,
                                   user=self.ssh_username,
-                                  password=self.ssh_password)
+                                  password=self.ssh_password,
+                                  remote_mode=self.remote_mode)
 
     def sample(self):
         processes = self.settings.traced_processes
@@ -179,7 +191,127 @@ class Memory(System):
         self.sampler = MemInfo(hosts=self.nodes,
                                workers=self.workers,
                                user=self.ssh_username,
-                               password=self.ssh_password)
+                               password=self.ssh_password,
+                               remote_mode=self.remote_mode)
+
+    def sample(self):
+        for node, stats in self.sampler.get_samples().items():
+            self.add_stats(node, stats)
+
+
+class ProcFS(System):
+
+    """Replace the atop, iostat, net and meminfo collectors.
+
+    The metrics are stored under the names of the replaced collectors, so
+    the reports and the KPIs do not depend on the sampler in use.
+    """
+
+    COLLECTOR = 'procfs'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.partitions = settings.partitions
+
+        self.sampler = ProcStats(hosts=self.nodes,
+                                 workers=self.workers,
+                                 user=self.ssh_username,
+                                 password=self.ssh_password,
+                                 interval=self.interval,
+                                 remote_mode=self.remote_mode)
+
+    def add_stats(self, node, stats):
+        for collector, collector_stats in stats.items():
+            if collector_stats:
+                if not self.offline:
+                    self.mc.add_metrics(collector_stats.keys(), server=node,
+                                        collector=collector)
+                self.store.append(collector_stats,
+                                  cluster=self.cluster, server=node,
+                                  collector=collector)
+
+    def sample(self):
+        samples = self.sampler.get_samples(self.partitions,
+                                           self.settings.server_processes,
+                                           self.settings.client_processes)
+        for node, stats in samples.items():
+            self.add_stats(node, stats)
+
+
+class Threads(System):
+
+    COLLECTOR = 'threads'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.sampler = ThreadStats(hosts=self.nodes,
+                                   workers=self.workers,
+                                   user=self.ssh_username,
+                                   password=self.ssh_password,
+                                   remote_mode=self.remote_mode)
+
+    def sample(self):
+        processes = self.settings.server_processes
+        for node, stats in self.sampler.get_samples(processes).items():
+            self.add_stats(node, stats)
+
+
+class Syscalls(System):
+
+    COLLECTOR = 'syscalls'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.perf = getattr(settings, 'perf_counters', False)
+
+        self.sampler = SyscallStats(hosts=self.nodes,
+                                    workers=self.workers,
+                                    user=self.ssh_username,
+                                    password=self.ssh_password,
+                                    remote_mode=self.remote_mode)
+
+    def sample(self):
+        processes = self.settings.server_processes
+        for node, stats in self.sampler.get_samples(processes, self.perf).items():
+            self.add_stats(node, stats)
+
+
+class PageCacheResidency(System):
+
+    COLLECTOR = 'page_cache'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.partitions = settings.partitions['server']
+
+        self.sampler = MincoreStats(hosts=self.nodes,
+                                    workers=self.workers,
+                                    user=self.ssh_username,
+                                    password=self.ssh_password,
+                                    interval=self.interval,
+                                    remote_mode=self.remote_mode)
+
+    def sample(self):
+        for node, stats in self.sampler.get_samples(self.partitions).items():
+            self.add_stats(node, stats)
+
+
+class NetPorts(System):
+
+    COLLECTOR = 'net_ports'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+
+        self.sampler = NetPortStats(hosts=self.nodes,
+                                    workers=self.workers,
+                                    user=self.ssh_username,
+                                    password=self.ssh_password,
+                                    remote_mode=self.remote_mode)
 
     def sample(self):
         for node, stats in self.sampler.get_samples().items():
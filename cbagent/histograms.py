@@ -0,0 +1,30 @@
+from typing import Iterable, Sequence
+
+import numpy as np
+
+
+def histogram_percentiles(lows: Sequence[float], highs: Sequence[float],
+                          counts: Sequence[int],
+                          percentiles: Iterable[float]) -> np.ndarray:
+    """Interpolate the percentiles linearly within their histogram buckets.
+
+    The buckets are given by their bounds and counts, sorted by the lower
+    bound. All percentiles are located with a single pass over the
+    cumulative counts. A percentile that falls into an empty bucket is
+    reported as the upper bound of that bucket.
+    """
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    if not counts.sum():
+        raise ValueError('Cannot compute a percentile of an empty histogram')
+
+    cumulative = np.cumsum(counts)
+    ranks = cumulative[-1] * np.asarray(list(percentiles), dtype=np.float64) / 100
+    buckets = np.minimum(np.searchsorted(cumulative, ranks), counts.size - 1)
+
+    seen = cumulative[buckets] - counts[buckets]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = np.where(counts[buckets] > 0,
+                             (ranks - seen) / counts[buckets], 1)
+    return lows[buckets] + (highs[buckets] - lows[buckets]) * fractions
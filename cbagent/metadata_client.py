@@ -1,8 +1,15 @@
+from threading import Lock
+from typing import Iterable, Set
+
 import requests
 from decorator import decorator
 
 from logger import logger
 
+cache = {}  # Metadata shared by all clients in the process
+
+cache_lock = Lock()
+
 
 class InternalServerError(Exception):
 
@@ -31,6 +38,7 @@ class RestClient:
         r = self.session.post(url=url, data=data)
         if r.status_code == 500:
             raise InternalServerError(url)
+        return r.status_code
 
     @interrupt
     def get(self, url, params):
@@ -66,47 +74,111 @@ class MetadataClient(RestClient):
         params = {"cluster": self.settings.cluster}
         return self.get(url, params)
 
+    def get_metrics(self, bucket=None, index=None, server=None):
+        url = self.base_url + "/get_metrics/"
+        params = {"cluster": self.settings.cluster}
+        for extra_param in ("bucket", "index", "server"):
+            if eval(extra_param) is not None:
+                params[extra_param] = eval(extra_param)
+        return self.get(url, params)
+
+    def cached(self, *key) -> Set:
+        """Return the cached entries for the key, creating an empty set."""
+        key = (self.base_url, ) + key
+        if key not in cache:
+            cache[key] = set()
+        return cache[key]
+
+    def members(self, kind: str, fetch) -> Set:
+        """Fetch the membership list once per cluster and kind."""
+        key = (self.base_url, self.settings.cluster, kind)
+        if kind == 'clusters':
+            key = (self.base_url, kind)
+        if key not in cache:
+            cache[key] = set(fetch() or ())
+        return cache[key]
+
     def add_cluster(self):
-        if self.settings.cluster in self.get_clusters():
-            return
+        with cache_lock:
+            clusters = self.members('clusters', self.get_clusters)
+            if self.settings.cluster in clusters:
+                return
 
-        url = self.base_url + "/add_cluster/"
-        data = {"name": self.settings.cluster}
+            url = self.base_url + "/add_cluster/"
+            data = {"name": self.settings.cluster}
 
-        self.post(url, data)
+            self.post(url, data)
+            clusters.add(self.settings.cluster)
 
     def add_server(self, address):
-        if address in self.get_servers():
-            return
+        with cache_lock:
+            servers = self.members('servers', self.get_servers)
+            if address in servers:
+                return
 
-        url = self.base_url + "/add_server/"
-        data = {"address": address, "cluster": self.settings.cluster}
+            url = self.base_url + "/add_server/"
+            data = {"address": address, "cluster": self.settings.cluster}
 
-        self.post(url, data)
+            self.post(url, data)
+            servers.add(address)
 
     def add_bucket(self, name):
-        if name in self.get_buckets():
-            return
+        with cache_lock:
+            buckets = self.members('buckets', self.get_buckets)
+            if name in buckets:
+                return
 
-        url = self.base_url + "/add_bucket/"
-        data = {"name": name, "cluster": self.settings.cluster}
-        self.post(url, data)
+            url = self.base_url + "/add_bucket/"
+            data = {"name": name, "cluster": self.settings.cluster}
+            self.post(url, data)
+            buckets.add(name)
 
     def add_index(self, name):
-        if name in self.get_indexes():
-            return
+        with cache_lock:
+            indexes = self.members('indexes', self.get_indexes)
+            if name in indexes:
+                return
 
-        url = self.base_url + "/add_index/"
-        data = {"name": name, "cluster": self.settings.cluster}
-        self.post(url, data)
+            url = self.base_url + "/add_index/"
+            data = {"name": name, "cluster": self.settings.cluster}
+            self.post(url, data)
+            indexes.add(name)
 
     def add_metric(self, name, bucket=None, index=None, server=None, collector=None):
-        url = self.base_url + "/add_metric/"
-        data = {"name": name, "cluster": self.settings.cluster}
-        for extra_param in ("bucket", "index", "server", "collector"):
-            if eval(extra_param) is not None:
-                data[extra_param] = eval(extra_param)
-        self.post(url, data)
+        self.add_metrics([name], bucket, index, server, collector)
+
+    def add_metrics(self, names: Iterable[str], bucket=None, index=None,
+                    server=None, collector=None):
+        """Register all metrics of a collector in a single request.
+
+        Servers without the bulk endpoint get one request per metric, the
+        registered metrics are cached so that every metric goes up once.
+        """
+        with cache_lock:
+            registered = self.cached(self.settings.cluster, bucket, index,
+                                     server, collector)
+            names = [name for name in names if name not in registered]
+            if not names:
+                return
+
+            data = {"cluster": self.settings.cluster}
+            for extra_param in ("bucket", "index", "server", "collector"):
+                if eval(extra_param) is not None:
+                    data[extra_param] = eval(extra_param)
+
+            bulk_unsupported = self.cached('bulk_unsupported')
+            if not bulk_unsupported:
+                url = self.base_url + "/add_metrics/"
+                status_code = self.post(url, dict(data, name=names))
+                if status_code == 404:
+                    bulk_unsupported.add(True)
+
+            if bulk_unsupported:
+                url = self.base_url + "/add_metric/"
+                for name in names:
+                    self.post(url, dict(data, name=name))
+
+            registered.update(names)
 
     def add_snapshot(self, name):
         url = self.base_url + "/add_snapshot/"
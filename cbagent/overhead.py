@@ -0,0 +1,114 @@
+import resource
+import time
+from typing import Dict, List
+
+
+class Overhead:
+
+    """Account for the cost of a collector between reports.
+
+    The sample durations are counted in a histogram with fixed buckets. The
+    histogram, the HTTP traffic and the CPU usage describe the last report
+    window, the missed intervals and errors are counted since the start.
+
+    The CPU usage and the peak RSS are tracked per process, so they are only
+    meaningful when a process runs a single collector. Every collector
+    reports to its own database, the name is used as the index dimension.
+    """
+
+    COLLECTOR = 'cbagent_self'
+
+    BUCKETS = 10, 50, 100, 500, 1000, 5000  # ms
+
+    REPORT_INTERVAL = 30  # seconds
+
+    def __init__(self, name: str, track_process: bool = True):
+        self.name = name
+        self.track_process = track_process
+
+        self.missed_intervals = 0
+        self.errors = 0
+        self.registered = False
+
+        self.reset()
+
+    def reset(self):
+        self.durations = [0] * (len(self.BUCKETS) + 1)
+        self.total_duration = 0
+        self.max_duration = 0
+        self.http_bytes = 0
+
+        self.started = time.time()
+        self.cpu_time = self.get_cpu_time()
+
+    @staticmethod
+    def get_cpu_time() -> float:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    @staticmethod
+    def get_max_rss() -> int:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KB
+
+    def add_sample(self, duration: float, missed_intervals: int = 0):
+        duration *= 1000  # ms
+        for i, bucket in enumerate(self.BUCKETS):
+            if duration <= bucket:
+                self.durations[i] += 1
+                break
+        else:
+            self.durations[-1] += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.missed_intervals += missed_intervals
+
+    def add_error(self):
+        self.errors += 1
+
+    def add_bytes(self, num_bytes: int):
+        self.http_bytes += num_bytes
+
+    @property
+    def due(self) -> bool:
+        return time.time() - self.started >= self.REPORT_INTERVAL
+
+    @property
+    def metrics(self) -> List[str]:
+        labels = ['le_{}ms'.format(bucket) for bucket in self.BUCKETS]
+        labels.append('gt_{}ms'.format(self.BUCKETS[-1]))
+        metrics = ['{}_samples_{}'.format(self.name, label) for label in labels]
+        metrics += ['{}_{}'.format(self.name, metric) for metric in (
+            'sample_time_avg',
+            'sample_time_max',
+            'missed_intervals',
+            'errors',
+            'http_bytes_per_sec',
+        )]
+        if self.track_process:
+            metrics += ['{}_cpu'.format(self.name), '{}_max_rss'.format(self.name)]
+        return metrics
+
+    def summary(self, writer_stats: Dict[str, int] = None) -> Dict[str, float]:
+        """Return the metrics of the current window and start a new one.
+
+        The counters of the buffered writer, if any, are reported as is.
+        """
+        dt = time.time() - self.started
+        num_samples = sum(self.durations)
+
+        values = self.durations + [
+            num_samples and self.total_duration / num_samples,
+            self.max_duration,
+            self.missed_intervals,
+            self.errors,
+            self.http_bytes / dt,
+        ]
+        if self.track_process:
+            cpu = 100 * (self.get_cpu_time() - self.cpu_time) / dt
+            values += [cpu, self.get_max_rss()]
+
+        summary = dict(zip(self.metrics, values))
+        for key, value in (writer_stats or {}).items():
+            summary['{}_{}'.format(self.name, key)] = value
+        self.reset()
+        return summary
@@ -0,0 +1,278 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Thread
+from typing import Any, List, Tuple
+
+from aiohttp import BasicAuth, ClientSession, TCPConnector
+
+from cbagent.collectors import Collector
+from cbagent.overhead import Overhead
+from logger import logger
+
+
+class TimerWheel:
+
+    """Hashed timer wheel with a fixed tick resolution.
+
+    Deadlines are hashed into slots by their tick number. Advancing the wheel
+    visits all slots between the previous and the current tick, entries that
+    belong to later rotations stay in place.
+    """
+
+    def __init__(self, tick: float = 0.1, num_slots: int = 600):
+        self.tick = tick
+        self.slots = [[] for _ in range(num_slots)]
+        self.current_tick = None
+
+    def _to_tick(self, t: float) -> int:
+        return int(t / self.tick)
+
+    def schedule(self, deadline: float, item: Any):
+        slot = self._to_tick(deadline) % len(self.slots)
+        self.slots[slot].append((deadline, item))
+
+    def advance(self, now: float) -> List[Tuple[float, Any]]:
+        """Remove and return all entries with deadlines up to now."""
+        now_tick = self._to_tick(now)
+        if self.current_tick is None:
+            num_ticks = len(self.slots)
+        else:
+            num_ticks = min(now_tick - self.current_tick + 1, len(self.slots))
+        expired = []
+        for tick in range(now_tick - num_ticks + 1, now_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if any(deadline <= now for deadline, _ in slot):
+                expired += [entry for entry in slot if entry[0] <= now]
+                slot[:] = [entry for entry in slot if entry[0] > now]
+
+        self.current_tick = now_tick  # The current slot may get more entries
+        return sorted(expired, key=lambda entry: entry[0])
+
+
+class NodeSessions:
+
+    """Keep one HTTP session with keep-alive connections per node.
+
+    The number of concurrent requests to a single node is bounded so that
+    a slow node cannot take all the connections.
+    """
+
+    MAX_CONCURRENCY = 4
+
+    TIMEOUT = 30  # seconds
+
+    def __init__(self):
+        self.sessions = {}
+        self.semaphores = {}
+
+    def _session(self, server: str) -> ClientSession:
+        if server not in self.sessions:
+            connector = TCPConnector(limit=self.MAX_CONCURRENCY)
+            self.sessions[server] = ClientSession(connector=connector)
+            self.semaphores[server] = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        return self.sessions[server]
+
+    async def get(self, server: str, port: int, path: str,
+                  auth: tuple) -> bytes:
+        session = self._session(server)
+        url = 'http://{}:{}{}'.format(server, port, path)
+        async with self.semaphores[server]:
+            async with session.get(url, auth=BasicAuth(*auth),
+                                   timeout=self.TIMEOUT) as response:
+                if response.status not in (200, 201, 202):
+                    raise RuntimeError('Bad response: {}'.format(url))
+                return await response.read()
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+
+class Job:
+
+    def __init__(self, collector: Collector):
+        self.collector = collector
+        self.interval = collector.interval
+        self.name = collector.__class__.__name__.lower()
+
+        self.missed_deadlines = 0
+        self.registered = False
+
+    @property
+    def metrics(self) -> Tuple[str, str, str]:
+        return (
+            '{}_sample_latency'.format(self.name),
+            '{}_sample_lag'.format(self.name),
+            '{}_missed_deadlines'.format(self.name),
+        )
+
+
+class CollectorScheduler:
+
+    """Run all collectors of a test in a single process.
+
+    Collectors that implement the sample_async coroutine share the event loop
+    and the per-node HTTP sessions. Legacy collectors run their blocking
+    sample method in a bounded thread pool.
+
+    Deadlines are anchored to the original schedule rather than to the end of
+    the previous sample, so the sampling intervals do not drift. Samples that
+    take longer than an interval skip the missed deadlines. The latency, lag
+    and missed deadlines of every collector are stored as separate metrics.
+
+    All collectors share the process, so the CPU usage and the memory are
+    accounted for the scheduler as a whole rather than per collector.
+    """
+
+    COLLECTOR = 'cbagent_scheduler'
+
+    MAX_THREADS = 16
+
+    TICK = 0.1  # seconds
+
+    def __init__(self, collectors: List[Collector]):
+        self.jobs = []
+        self.legacy_collectors = []
+        for collector in collectors:
+            collector.overhead.track_process = False
+            if type(collector).collect is not Collector.collect:
+                self.legacy_collectors.append(collector)
+            else:
+                self.jobs.append(Job(collector))
+
+        self.wheel = TimerWheel(tick=self.TICK)
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_THREADS)
+        self.node_sessions = None
+        self.store_session = None
+
+        self.overhead = Overhead('scheduler')
+
+    def start_legacy_collectors(self):
+        for collector in self.legacy_collectors:
+            thread = Thread(target=collector.collect)
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def is_async(collector: Collector) -> bool:
+        """Check that the coroutine is not shadowed by a derived sample method."""
+        for cls in type(collector).__mro__:
+            if 'sample_async' in vars(cls):
+                return True
+            if 'sample' in vars(cls):
+                return False
+        return False
+
+    async def sample(self, job: Job):
+        collector = job.collector
+        if self.is_async(collector):
+            await collector.sample_async()
+        else:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.executor, collector.sample)
+
+    async def report(self, job: Job, latency: float, lag: float):
+        collector = job.collector
+        if not job.registered and not collector.offline:
+            loop = asyncio.get_event_loop()
+            add_metrics = partial(collector.mc.add_metrics, job.metrics,
+                                  collector=self.COLLECTOR)
+            await loop.run_in_executor(self.executor, add_metrics)
+            job.registered = True
+
+        data = dict(zip(job.metrics, (latency, lag, job.missed_deadlines)))
+        await collector.store.append_async(data,
+                                           cluster=collector.cluster,
+                                           collector=self.COLLECTOR)
+
+    async def report_overhead(self, collector: Collector, overhead: Overhead):
+        if not overhead.due:
+            return
+        writer_stats = None
+        if overhead is collector.overhead:
+            writer_stats = collector.writer_stats
+        data = overhead.summary(writer_stats)
+        if not overhead.registered and not collector.offline:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.executor, collector.mc.add_index,
+                                       overhead.name)
+            add_metrics = partial(collector.mc.add_metrics, list(data),
+                                  index=overhead.name,
+                                  collector=Overhead.COLLECTOR)
+            await loop.run_in_executor(self.executor, add_metrics)
+            overhead.registered = True
+
+        await collector.store.append_async(data,
+                                           cluster=collector.cluster,
+                                           index=overhead.name,
+                                           collector=Overhead.COLLECTOR)
+
+    async def run_job(self, job: Job, deadline: float):
+        loop = asyncio.get_event_loop()
+        collector = job.collector
+
+        t0 = loop.time()
+        try:
+            await self.sample(job)
+        except Exception as e:
+            collector.overhead.add_error()
+            self.overhead.add_error()
+            logger.warn('Unexpected exception in {}: {}'.format(job.name, e))
+        t1 = loop.time()
+
+        missed_deadlines = 0
+        next_deadline = deadline + job.interval
+        while next_deadline <= t1:
+            next_deadline += job.interval
+            missed_deadlines += 1
+        job.missed_deadlines += missed_deadlines
+        self.wheel.schedule(next_deadline, job)
+
+        for overhead in collector.overhead, self.overhead:
+            overhead.add_sample(t1 - t0, missed_deadlines)
+
+        try:
+            await self.report(job, latency=t1 - t0, lag=t0 - deadline)
+            await self.report_overhead(collector, collector.overhead)
+            await self.report_overhead(collector, self.overhead)
+        except Exception as e:
+            logger.warn('Failed to report scheduling stats: {}'.format(e))
+
+    async def run_forever(self):
+        loop = asyncio.get_event_loop()
+
+        self.node_sessions = NodeSessions()
+        self.store_session = ClientSession()
+        for job in self.jobs:
+            job.collector.http = self.node_sessions
+            job.collector.store.async_session = self.store_session
+
+        now = loop.time()
+        for job in self.jobs:
+            self.wheel.schedule(now, job)
+
+        while True:
+            for deadline, job in self.wheel.advance(loop.time()):
+                loop.create_task(self.run_job(job, deadline))
+            await asyncio.sleep(self.TICK)
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        signal.signal(signal.SIGTERM, Collector.terminate)  # Flush on stop
+
+        self.start_legacy_collectors()
+        try:
+            loop.run_until_complete(self.run_forever())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.node_sessions is not None:
+                self.node_sessions.close()
+                self.store_session.close()
+            for job in self.jobs:
+                job.collector.store.close()
+            loop.close()
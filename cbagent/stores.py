@@ -1,17 +1,206 @@
+import fcntl
+import glob
+import gzip
 import json
-from typing import List
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Event, Lock, Thread
+from typing import Iterator, List, Tuple, Union
 
+import numpy as np
 from requests import Session
+from requests.adapters import HTTPAdapter
+
+from logger import logger
+
+
+class BufferedWriter:
+
+    """Batch points per database and deliver them in the background.
+
+    A database is flushed once it accumulates MAX_BATCH_SIZE points or once
+    its oldest point waits for MAX_AGE seconds. The store has no bulk
+    endpoint, so a flush sends the batch through a small pool of keep-alive
+    connections instead of issuing blocking requests one by one.
+
+    Points that cannot be delivered are spilled to a gzip-compressed file
+    and replayed after the next successful flush. When neither the buffer
+    nor the spill file can take more points, new points are dropped. The
+    number of sent, delayed, spilled and dropped points is exposed via the
+    stats attribute and reported with the collector overhead. The payloads
+    can be gzip-compressed if the store accepts it.
+    """
+
+    MAX_BATCH_SIZE = 100
+
+    MAX_AGE = 5  # seconds
+
+    MAX_BUFFERED = 10 ** 5  # points
+
+    MAX_CONNECTIONS = 4
+
+    TIMEOUT = 10  # seconds
+
+    def __init__(self, base_url: str, spill_file: str = None,
+                 compress: bool = False):
+        self.base_url = base_url
+        self.spill_file = spill_file
+        self.compress = compress
+
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self.MAX_CONNECTIONS)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_CONNECTIONS)
+
+        self.pending = set()
+        self.lock = Lock()
+        self.buffers = defaultdict(list)
+        self.num_buffered = 0
+        self.stats = {
+            'points_sent': 0,
+            'points_delayed': 0,
+            'points_spilled': 0,
+            'points_dropped': 0,
+        }
+
+        self.stopped = Event()
+        self.flusher = None
+
+    def start(self):
+        """Start the flusher thread in the process that appends the points."""
+        self.flusher = Thread(target=self.flush_periodically)
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def add(self, db: str, data: dict, timestamp: int = None):
+        if self.flusher is None:
+            self.start()
+        if timestamp is None:
+            timestamp = int(time.time() * 10 ** 9)  # Nanosecond granularity
+        point = (time.time(), data, timestamp)
+
+        with self.lock:
+            if self.num_buffered >= self.MAX_BUFFERED:
+                if self.spill_file:
+                    self.spill([(db, point)])
+                else:
+                    self.stats['points_dropped'] += 1
+                return
+            self.buffers[db].append(point)
+            self.num_buffered += 1
+            if len(self.buffers[db]) < self.MAX_BATCH_SIZE:
+                return
+            batch = [(db, point) for point in self.buffers.pop(db)]
+            self.num_buffered -= len(batch)
+
+        self.submit(batch)
+
+    def submit(self, batch: List[tuple]):
+        future = self.executor.submit(self.send, batch)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+
+    def due_batches(self, force: bool = False) -> List[tuple]:
+        now = time.time()
+        batch = []
+        with self.lock:
+            for db in list(self.buffers):
+                points = self.buffers[db]
+                if force or now - points[0][0] >= self.MAX_AGE:
+                    batch += [(db, point) for point in self.buffers.pop(db)]
+            self.num_buffered -= len(batch)
+        return batch
+
+    def flush_periodically(self):
+        while not self.stopped.wait(1):
+            batch = self.due_batches()
+            if batch:
+                self.submit(batch)
+
+    def post(self, db: str, data: dict, timestamp: int):
+        url = '{}/{}?ts={}'.format(self.base_url, db, timestamp)
+        body = json.dumps(data).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        response = self.session.post(url=url, data=body, headers=headers,
+                                     timeout=self.TIMEOUT)
+        response.raise_for_status()
+
+    def send(self, batch: List[tuple]):
+        failed = []
+        for i, (db, point) in enumerate(batch):
+            created, data, timestamp = point
+            try:
+                self.post(db, data, timestamp)
+            except Exception:
+                failed = batch[i:]  # Do not wait for every point to time out
+                break
+            with self.lock:
+                self.stats['points_sent'] += 1
+                if time.time() - created > 2 * self.MAX_AGE:
+                    self.stats['points_delayed'] += 1
+
+        if failed:
+            logger.warn('Failed to deliver {} points'.format(len(failed)))
+            with self.lock:
+                if self.spill_file:
+                    self.spill(failed)
+                else:
+                    self.stats['points_dropped'] += len(failed)
+        elif batch:
+            self.replay()
+
+    def spill(self, batch: List[tuple]):
+        with gzip.open(self.spill_file, 'at') as fh:
+            for db, (created, data, timestamp) in batch:
+                fh.write(json.dumps([db, created, data, timestamp]) + '\n')
+        self.stats['points_spilled'] += len(batch)
+
+    def replay(self):
+        with self.lock:
+            if not self.spill_file or not os.path.exists(self.spill_file):
+                return
+            batch = []
+            with gzip.open(self.spill_file, 'rt') as fh:
+                for line in fh:
+                    db, created, data, timestamp = json.loads(line)
+                    batch.append((db, (created, data, timestamp)))
+            os.remove(self.spill_file)
+
+        logger.info('Replaying {} spilled points'.format(len(batch)))
+        self.send(batch)
+
+    def flush(self):
+        """Deliver all buffered points and wait for pending requests."""
+        self.send(self.due_batches(force=True))
+        wait(list(self.pending))
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        self.executor.shutdown(wait=True)
+        logger.info('Buffered writer stats: {}'.format(self.stats))
 
 
 class PerfStore:
 
-    def __init__(self, host: str):
+    def __init__(self, host: str, buffered: bool = False,
+                 spill_file: str = None, compress: bool = False):
         self.session = Session()
         self.async_session = None
+        self.host = host
         self.base_url = 'http://{}:8080'.format(host)
         self.dbs = set()
 
+        self.writer = None
+        if buffered:
+            self.writer = BufferedWriter(self.base_url, spill_file, compress)
+
     @staticmethod
     def build_dbname(cluster: str,
                      server: str = None,
@@ -41,6 +230,17 @@ class PerfStore:
         data = self.session.get(url).json()
         return [d[1] for d in data]
 
+    def get_series(self, db: str, metric) -> Tuple[np.ndarray, np.ndarray]:
+        url = '{}/{}/{}'.format(self.base_url, db, metric)
+        data = self.session.get(url).json()
+        timestamps = np.array([d[0] for d in data], dtype=np.int64)
+        values = np.array([d[1] for d in data], dtype=np.float64)
+        return timestamps, values
+
+    def iter_values(self, db: str, metric) -> Iterator[np.ndarray]:
+        """Yield the values of the metric, cbmonitor returns them at once."""
+        yield self.get_series(db, metric)[1]
+
     def find_dbs(self, db: str) -> List[str]:
         urls = []
         for name in self.session.get(self.base_url).json():
@@ -52,9 +252,194 @@ class PerfStore:
     def append(self, data, cluster=None, server=None, bucket=None, index=None,
                collector=None, timestamp=None):
         db = self.build_dbname(cluster, server, bucket, index, collector)
-        self.push(db, data, timestamp)
+        if self.writer is not None:
+            self.writer.add(db, data, timestamp)
+        else:
+            self.push(db, data, timestamp)
 
     async def append_async(self, data, cluster=None, server=None, bucket=None,
                            index=None, collector=None, timestamp=None):
         db = self.build_dbname(cluster, server, bucket, index, collector)
+        if self.writer is not None:
+            return self.writer.add(db, data, timestamp)
         return await self.async_push(db, data, timestamp)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class LocalStore:
+
+    """Store time series in local append-only columnar files.
+
+    Every database is a directory with an index and a pair of files per
+    metric: int64 timestamps in nanoseconds and float64 values. Points are
+    appended as raw arrays, readers map the files into memory. The index
+    keeps the database dimensions so that the series can be uploaded to
+    cbmonitor later. Several processes may add metrics to a database, the
+    columns are allocated under a file lock, but every metric is expected
+    to have a single writer.
+    """
+
+    INDEX = 'index.json'
+
+    LOCK = 'index.lock'
+
+    CHUNK_SIZE = 10 ** 6  # Values read at once by iter_values
+
+    writer = None
+
+    def __init__(self, root: str):
+        self.root = root
+        self.indexes = {}
+        self.files = {}
+
+    build_dbname = staticmethod(PerfStore.build_dbname)
+
+    def db_dir(self, db: str) -> str:
+        return os.path.join(self.root, db)
+
+    def read_index(self, db: str) -> dict:
+        index_file = os.path.join(self.db_dir(db), self.INDEX)
+        if not os.path.exists(index_file):
+            return {'metrics': {}}
+        with open(index_file) as fh:
+            return json.load(fh)
+
+    def write_index(self, db: str, index: dict):
+        index_file = os.path.join(self.db_dir(db), self.INDEX)
+        with open(index_file + '.tmp', 'w') as fh:
+            json.dump(index, fh)
+        os.rename(index_file + '.tmp', index_file)
+
+    def column(self, db: str, metric: str, dimensions: dict) -> str:
+        index = self.indexes.get(db)
+        if index is None or metric not in index['metrics']:
+            os.makedirs(self.db_dir(db), exist_ok=True)
+            with open(os.path.join(self.db_dir(db), self.LOCK), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # Released on close
+                index = self.indexes[db] = self.read_index(db)
+                if metric not in index['metrics']:
+                    index.update(dimensions)
+                    index['metrics'][metric] = 'c{}'.format(len(index['metrics']))
+                    self.write_index(db, index)
+        return index['metrics'][metric]
+
+    def open_column(self, db: str, column: str) -> tuple:
+        if (db, column) not in self.files:
+            path = os.path.join(self.db_dir(db), column)
+            self.files[db, column] = open(path + '.ts', 'ab'), \
+                open(path + '.val', 'ab')
+        return self.files[db, column]
+
+    def append(self, data, cluster=None, server=None, bucket=None, index=None,
+               collector=None, timestamp=None):
+        db = self.build_dbname(cluster, server, bucket, index, collector)
+        dimensions = {'cluster': cluster, 'server': server, 'bucket': bucket,
+                      'index': index, 'collector': collector}
+        if timestamp is None:
+            timestamp = int(time.time() * 10 ** 9)  # Nanosecond granularity
+        timestamp = np.array([timestamp], dtype='<i8').tobytes()
+
+        for metric, value in data.items():
+            try:
+                value = np.array([value], dtype='<f8').tobytes()
+            except (TypeError, ValueError):
+                continue
+            column = self.column(db, metric, dimensions)
+            ts_fh, val_fh = self.open_column(db, column)
+            ts_fh.write(timestamp)
+            val_fh.write(value)
+            ts_fh.flush()
+            val_fh.flush()
+
+    async def append_async(self, data, cluster=None, server=None, bucket=None,
+                           index=None, collector=None, timestamp=None):
+        self.append(data, cluster, server, bucket, index, collector, timestamp)
+
+    def append_series(self, metric: str, timestamps: np.ndarray,
+                      values: np.ndarray, cluster=None, server=None,
+                      bucket=None, index=None, collector=None):
+        """Append a whole series of a metric at once."""
+        db = self.build_dbname(cluster, server, bucket, index, collector)
+        dimensions = {'cluster': cluster, 'server': server, 'bucket': bucket,
+                      'index': index, 'collector': collector}
+        column = self.column(db, metric, dimensions)
+        ts_fh, val_fh = self.open_column(db, column)
+        ts_fh.write(np.asarray(timestamps, dtype='<i8').tobytes())
+        val_fh.write(np.asarray(values, dtype='<f8').tobytes())
+        ts_fh.flush()
+        val_fh.flush()
+
+    @staticmethod
+    def map_file(path: str, dtype: str) -> Union[np.memmap, np.ndarray]:
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def get_series(self, db: str, metric) -> Tuple[np.ndarray, np.ndarray]:
+        column = self.read_index(db)['metrics'].get(metric)
+        if column is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        path = os.path.join(self.db_dir(db), column)
+        timestamps = self.map_file(path + '.ts', '<i8')
+        values = self.map_file(path + '.val', '<f8')
+        size = min(timestamps.size, values.size)  # Skip a torn write
+
+        order = np.argsort(timestamps[:size], kind='mergesort')
+        return timestamps[order], values[order]
+
+    def get_values(self, db: str, metric) -> List[float]:
+        _, values = self.get_series(db, metric)
+        return values.tolist()
+
+    def iter_values(self, db: str, metric) -> Iterator[np.ndarray]:
+        """Yield the values of the metric in the order they were written.
+
+        The column is mapped into memory and read chunk by chunk, so a long
+        series is never loaded or sorted as a whole.
+        """
+        column = self.read_index(db)['metrics'].get(metric)
+        if column is None:
+            return
+
+        path = os.path.join(self.db_dir(db), column)
+        values = self.map_file(path + '.val', '<f8')
+        size = min(values.size, self.map_file(path + '.ts', '<i8').size)
+        for start in range(0, size, self.CHUNK_SIZE):
+            yield values[start:start + self.CHUNK_SIZE]
+
+    def list_dbs(self) -> List[str]:
+        pattern = os.path.join(self.root, '*', self.INDEX)
+        return sorted(os.path.basename(os.path.dirname(index_file))
+                      for index_file in glob.glob(pattern))
+
+    def find_dbs(self, db: str) -> List[str]:
+        return [self.db_dir(name) for name in self.list_dbs() if db in name]
+
+    def flush(self):
+        for ts_fh, val_fh in self.files.values():
+            ts_fh.flush()
+            val_fh.flush()
+
+    def close(self):
+        for ts_fh, val_fh in self.files.values():
+            ts_fh.close()
+            val_fh.close()
+        self.files = {}
+
+
+def new_store(backend: str, host: str, root: str = None,
+              buffered: bool = False,
+              spill_file: str = None,
+              compress: bool = False) -> Union[PerfStore, LocalStore]:
+    if backend == 'local':
+        return LocalStore(root)
+    return PerfStore(host, buffered=buffered, spill_file=spill_file,
+                     compress=compress)
@@ -0,0 +1,151 @@
+import glob
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from typing import List, Union
+
+from cbagent.metadata_client import MetadataClient
+from cbagent.stores import LocalStore, PerfStore
+from logger import logger
+from perfrunner.settings import CBMONITOR_HOST
+
+VERSION = 1
+
+MANIFEST = 'manifest.json'
+
+STORE_DIR = 'perfstore'
+
+LOGS_DIR = 'logs'
+
+TEST_CONFIG = 'test.test'
+
+CLUSTER_SPEC = 'cluster.spec'
+
+WORKER_DUMPS = (
+    '*-worker-*',
+    'YCSB/ycsb_run_*.log',
+    'celery/worker_*.log',
+)
+
+
+def export_series(store: PerfStore, local_store: LocalStore, cluster: str):
+    """Download all series of the cluster registered in cbmonitor."""
+    settings = type('settings', (object,), {
+        'cbmonitor_host': CBMONITOR_HOST,
+        'cluster': cluster,
+    })()
+    mc = MetadataClient(settings)
+
+    dimensions = [{}]
+    dimensions += [{'server': server} for server in mc.get_servers() or ()]
+    dimensions += [{'bucket': bucket} for bucket in mc.get_buckets() or ()]
+    dimensions += [{'index': index} for index in mc.get_indexes() or ()]
+
+    for dims in dimensions:
+        for metric in mc.get_metrics(**dims) or ():
+            collector, name = metric.get('collector'), metric['name']
+            db = store.build_dbname(cluster=cluster, collector=collector,
+                                    **dims)
+            timestamps, values = store.get_series(db, name)
+            if timestamps.size:
+                local_store.append_series(name, timestamps, values,
+                                          cluster=cluster, collector=collector,
+                                          **dims)
+    local_store.close()
+
+
+def manifest(test) -> dict:
+    return {
+        'version': VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'test': test.test_config.name,
+        'cluster': test.cluster_spec.name,
+        'build': test.build,
+        'clusters': test.cbmonitor_clusters,
+        'collectors': test.COLLECTORS,
+        'phase_markers': test.phase_markers,
+        'worker_dumps': WORKER_DUMPS,
+    }
+
+
+def create_bundle(test, store: Union[LocalStore, PerfStore],
+                  archive_dir: str) -> str:
+    """Save the series of the current phase and the worker dumps.
+
+    The bundle is a gzipped tarball with a manifest, the test config and the
+    cluster spec, the series in the local store format and the latency dumps
+    of the workers.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir,
+                        '{}.tar.gz'.format(test.cbmonitor_clusters[0]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            tarfile.open(path, 'w:gz') as tar:
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as fh:
+            json.dump(manifest(test), fh, indent=4, sort_keys=True)
+        with open(os.path.join(tmp_dir, TEST_CONFIG), 'w') as fh:
+            test.test_config.config.write(fh)
+        with open(os.path.join(tmp_dir, CLUSTER_SPEC), 'w') as fh:
+            test.cluster_spec.config.write(fh)
+        for name in MANIFEST, TEST_CONFIG, CLUSTER_SPEC:
+            tar.add(os.path.join(tmp_dir, name), arcname=name)
+
+        if isinstance(store, PerfStore):
+            local_store = LocalStore(os.path.join(tmp_dir, STORE_DIR))
+            for cluster in test.cbmonitor_clusters:
+                export_series(store, local_store, cluster)
+            store = local_store
+
+        for cluster in test.cbmonitor_clusters:
+            for db_dir in store.find_dbs(cluster):
+                tar.add(db_dir, arcname=os.path.join(STORE_DIR,
+                                                     os.path.basename(db_dir)))
+
+        for pattern in WORKER_DUMPS:
+            for filename in glob.glob(pattern):
+                tar.add(filename, arcname=os.path.join(LOGS_DIR, filename))
+    return path
+
+
+def update_phase_markers(path: str, phase_markers: List[tuple]):
+    """Rewrite the manifest with the phases marked after the bundle was made.
+
+    Some tests mark their phases while reporting the KPIs, e.g. the failover
+    tests, after the stats collection is over.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, os.path.basename(path))
+        with tarfile.open(path, 'r:gz') as src, \
+                tarfile.open(tmp_path, 'w:gz') as dst:
+            for member in src.getmembers():
+                if member.name == MANIFEST:
+                    data = json.load(src.extractfile(member))
+                    data['phase_markers'] = phase_markers
+                    content = json.dumps(data, indent=4, sort_keys=True).encode()
+                    member.size = len(content)
+                    dst.addfile(member, io.BytesIO(content))
+                elif member.isfile():
+                    dst.addfile(member, src.extractfile(member))
+                else:
+                    dst.addfile(member)
+        shutil.move(tmp_path, path)
+
+
+def extract_bundle(path: str, target_dir: str) -> dict:
+    with tarfile.open(path, 'r:gz') as tar:
+        tar.extractall(target_dir)
+    with open(os.path.join(target_dir, MANIFEST)) as fh:
+        data = json.load(fh)
+    if data['version'] > VERSION:
+        logger.interrupt('Unsupported bundle version: {}'.format(
+            data['version']))
+    return data
+
+
+def find_bundles(archive_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(archive_dir, '*.tar.gz')))
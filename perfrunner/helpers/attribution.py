@@ -0,0 +1,101 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+Series = Tuple[np.ndarray, np.ndarray]  # Timestamps and values
+
+SPIKE_THRESHOLD = 5  # Robust z-score of the log of the window percentile
+
+
+def window_indices(timestamps: np.ndarray, boundaries: List[int]) -> np.ndarray:
+    return np.searchsorted(boundaries, timestamps, side='right')
+
+
+def window_percentiles(series: List[Series], boundaries: List[int],
+                       percentile: float) -> np.ndarray:
+    """Return the percentile of all series per window, NaN if empty."""
+    chunks = [[] for _ in range(len(boundaries) + 1)]
+    for timestamps, values in series:
+        windows = window_indices(timestamps, boundaries)
+        for window, chunk in enumerate(chunks):
+            chunk.append(values[windows == window])
+
+    percentiles = np.full(len(chunks), np.nan)
+    for window, chunk in enumerate(chunks):
+        values = np.concatenate(chunk or [[]])
+        if values.size:
+            percentiles[window] = np.percentile(values, percentile)
+    return percentiles
+
+
+def window_means(series: Series, boundaries: List[int]) -> np.ndarray:
+    """Return the mean of the series per window, NaN if empty."""
+    timestamps, values = series
+    windows = window_indices(timestamps, boundaries)
+    counts = np.bincount(windows, minlength=len(boundaries) + 1)
+    sums = np.bincount(windows, weights=values, minlength=len(boundaries) + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def robust_zscores(values: np.ndarray) -> np.ndarray:
+    """Scale the deviations from the median by the median absolute deviation."""
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return np.full(values.size, np.nan)
+    median = np.median(finite)
+    mad = 1.4826 * np.median(np.abs(finite - median))  # Consistent with std
+    if not mad:
+        mad = np.std(finite) or 1
+    return (values - median) / mad
+
+
+def rank_correlation(x: np.ndarray, y: np.ndarray) -> float:
+    """Return Spearman's correlation over the windows where both are known."""
+    mask = np.isfinite(x) & np.isfinite(y)
+    if mask.sum() < 3:
+        return np.nan
+    x_ranks = np.argsort(np.argsort(x[mask]))
+    y_ranks = np.argsort(np.argsort(y[mask]))
+    if not x_ranks.std() or not y_ranks.std():
+        return np.nan
+    return float(np.corrcoef(x_ranks, y_ranks)[0, 1])
+
+
+def attribute(latency: np.ndarray,
+              resources: Dict[str, np.ndarray]) -> Tuple[Dict[str, float],
+                                                         List[dict]]:
+    """Attribute the latency spikes to the resources.
+
+    Every resource is correlated with the latency percentile across all
+    windows. A window is a spike if the log of its percentile is
+    SPIKE_THRESHOLD robust standard deviations above the median. Among the positively correlated
+    resources, the spike is attributed to the one furthest above its own
+    median in that window.
+    """
+    correlations = {name: rank_correlation(latency, values)
+                    for name, values in resources.items()}
+    candidates = {name: robust_zscores(values)
+                  for name, values in resources.items()
+                  if correlations[name] > 0}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        latency_zscores = robust_zscores(np.log(latency))
+        spike_windows = np.flatnonzero(latency_zscores > SPIKE_THRESHOLD)
+
+    spikes = []
+    for window in spike_windows:
+        scores = {name: round(float(zscores[window]), 1)
+                  for name, zscores in candidates.items()
+                  if np.isfinite(zscores[window])}
+        spikes.append({
+            'window': int(window),
+            'latency': round(float(latency[window]), 2),
+            'resource': max(scores, key=scores.get) if scores else None,
+            'scores': scores,
+        })
+
+    correlations = {name: round(value, 2)
+                    for name, value in correlations.items()
+                    if np.isfinite(value)}
+    return correlations, spikes
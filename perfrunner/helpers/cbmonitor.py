@@ -18,18 +18,24 @@ from cbagent.collectors import (
     EventingConsumerStats,
     EventingPerNodeStats,
     EventingStats,
+    Fragmentation,
     FTSCollector,
     JTSCollector,
     KVLatency,
+    MemcachedStats,
     Memory,
     N1QLStats,
     Net,
+    NetPorts,
     NSServer,
     NSServerOverview,
+    NSServerPerNode,
     NSServerSystem,
     ObserveIndexLatency,
     ObserveSecondaryIndexLatency,
     PageCache,
+    PageCacheResidency,
+    ProcFS,
     QueryLatency,
     SecondaryDebugStats,
     SecondaryDebugStatsBucket,
@@ -38,14 +44,18 @@ from cbagent.collectors import (
     SecondaryStats,
     SecondaryStorageStats,
     SecondaryStorageStatsMM,
+    Syscalls,
     Sysdig,
+    Threads,
     TypePerf,
     XdcrLag,
     XdcrStats,
 )
 from cbagent.metadata_client import MetadataClient
-from cbagent.stores import PerfStore
+from cbagent.scheduler import CollectorScheduler
+from cbagent.stores import new_store
 from logger import logger
+from perfrunner.helpers.archive import create_bundle
 from perfrunner.helpers.misc import pretty_dict, uhex
 from perfrunner.settings import CBMONITOR_HOST
 from perfrunner.tests import PerfTest
@@ -81,6 +91,13 @@ def new_cbagent_settings(test: PerfTest):
         'cbmonitor_host': CBMONITOR_HOST,
         'interval': test.test_config.stats_settings.interval,
         'lat_interval': test.test_config.stats_settings.lat_interval,
+        'buffered': test.test_config.stats_settings.buffered,
+        'compress': test.test_config.stats_settings.compress,
+        'store': test.test_config.stats_settings.store,
+        'store_dir': test.test_config.stats_settings.store_dir,
+        'remote_mode': test.test_config.stats_settings.remote_mode,
+        'perf_counters': test.test_config.stats_settings.perf_counters,
+        'ns_server_mode': test.test_config.stats_settings.ns_server_mode,
         'buckets': buckets,
         'indexes': {},
         'hostnames': hostnames,
@@ -115,7 +132,8 @@ class CbAgent:
         if self.test.test_config.stats_settings.enabled:
             self.init_clusters(phase=phase)
             self.add_collectors(**test.COLLECTORS)
-            self.update_metadata()
+            if self.settings.store != 'local':
+                self.update_metadata()
             self.start()
 
     def __enter__(self):
@@ -127,6 +145,7 @@ class CbAgent:
             self.reconstruct()
             self.find_time_series()
             self.add_snapshots()
+            self.archive()
 
     def init_clusters(self, phase: str):
         self.cluster_map = OrderedDict()
@@ -145,17 +164,22 @@ class CbAgent:
                        durability=False,
                        elastic_stats=False,
                        eventing_stats=False,
+                       fragmentation=False,
                        fts_stats=False,
                        index_latency=False,
                        iostat=True,
                        jts_stats=False,
                        latency=False,
+                       memcached_stats=False,
                        memory=True,
                        n1ql_latency=False,
                        n1ql_stats=False,
                        net=True,
+                       net_ports=False,
+                       ns_server_per_node=False,
                        ns_server_system=False,
                        page_cache=False,
+                       page_cache_residency=False,
                        query_latency=False,
                        secondary_debugstats_bucket=False,
                        secondary_debugstats=False,
@@ -165,6 +189,8 @@ class CbAgent:
                        secondary_stats=False,
                        secondary_storage_stats=False,
                        secondary_storage_stats_mm=False,
+                       syscall_stats=False,
+                       thread_stats=False,
                        xdcr_lag=False,
                        xdcr_stats=False):
         self.collectors = []
@@ -174,19 +200,33 @@ class CbAgent:
         self.add_collector(NSServerOverview)
         self.add_collector(ActiveTasks)
 
+        if ns_server_per_node:
+            self.add_collector(NSServerPerNode)
+
         if self.test.remote.os != 'Cygwin':
-            self.add_collector(PS)
+            if self.test.test_config.stats_settings.sampler == 'procfs':
+                self.add_io_collector(ProcFS)
+            else:
+                self.add_collector(PS)
+                if memory:
+                    self.add_collector(Memory)
+                if net:
+                    self.add_collector(Net)
+                if iostat:
+                    self.add_io_collector(IO)
             self.add_collector(Sysdig)
-            if memory:
-                self.add_collector(Memory)
-            if net:
-                self.add_collector(Net)
             if disk:
                 self.add_io_collector(Disk)
-            if iostat:
-                self.add_io_collector(IO)
             if page_cache:
                 self.add_io_collector(PageCache)
+            if page_cache_residency:
+                self.add_page_cache_collector()
+            if thread_stats:
+                self.add_collector(Threads)
+            if syscall_stats:
+                self.add_collector(Syscalls)
+            if net_ports:
+                self.add_collector(NetPorts)
         else:
             self.add_collector(TypePerf)
 
@@ -194,6 +234,10 @@ class CbAgent:
             self.add_collector(KVLatency)
         if durability:
             self.add_durability_collector()
+        if memcached_stats:
+            self.add_collector(MemcachedStats)
+        if fragmentation:
+            self.add_collector(Fragmentation)
 
         if query_latency or n1ql_latency:
             self.add_collector(QueryLatency)
@@ -273,6 +317,20 @@ class CbAgent:
             collector = cls(settings)
             self.collectors.append(collector)
 
+    def add_page_cache_collector(self):
+        partitions = {'server': {'data': self.test.cluster_spec.data_path}}
+        if self.test.cluster_spec.index_path != self.test.cluster_spec.data_path:
+            partitions['server']['index'] = self.test.cluster_spec.index_path
+
+        for cluster_id, master_node in self.cluster_map.items():
+            settings = copy(self.settings)
+            settings.cluster = cluster_id
+            settings.master_node = master_node
+            settings.partitions = partitions
+
+            collector = PageCacheResidency(settings)
+            self.collectors.append(collector)
+
     def add_durability_collector(self):
         for cluster_id, master_node in self.cluster_map.items():
             settings = copy(self.settings)
@@ -304,7 +362,11 @@ class CbAgent:
 
     def start(self):
         logger.info('Starting stats collectors')
-        self.processes = [Process(target=c.collect) for c in self.collectors]
+        if self.test.test_config.stats_settings.scheduler == 'asyncio':
+            scheduler = CollectorScheduler(self.collectors)
+            self.processes = [Process(target=scheduler.run)]
+        else:
+            self.processes = [Process(target=c.collect) for c in self.collectors]
         for p in self.processes:
             p.start()
 
@@ -328,6 +390,9 @@ class CbAgent:
     def add_snapshots(self):
         self.test.cbmonitor_snapshots = []
         for cluster_id in self.test.cbmonitor_clusters:
+            if self.settings.store == 'local':  # Uploaded to cbmonitor later
+                self.test.cbmonitor_snapshots.append(cluster_id)
+                continue
             self.settings.cluster = cluster_id
             md_client = MetadataClient(self.settings)
             md_client.add_snapshot(cluster_id)
@@ -335,8 +400,21 @@ class CbAgent:
 
             self.test.cbmonitor_snapshots.append(cluster_id)
 
+    def archive(self):
+        archive_dir = self.test.test_config.stats_settings.archive_dir
+        if not archive_dir:
+            return
+        store = new_store(backend=self.settings.store,
+                          host=CBMONITOR_HOST,
+                          root=self.settings.store_dir)
+        path = create_bundle(self.test, store, archive_dir)
+        self.test.archives.append(path)
+        logger.info('Archived the raw data to {}'.format(path))
+
     def find_time_series(self):
-        store = PerfStore(host=CBMONITOR_HOST)
+        store = new_store(backend=self.settings.store,
+                          host=CBMONITOR_HOST,
+                          root=self.settings.store_dir)
         dbs = []
         for cluster_id in self.test.cbmonitor_clusters:
             dbs += store.find_dbs(cluster_id)
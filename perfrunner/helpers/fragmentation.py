@@ -0,0 +1,61 @@
+from typing import Dict, List
+
+import numpy as np
+
+from perfrunner.helpers.quantiles import NS_PER_HOUR
+
+
+def resample(timestamps: np.ndarray, values: np.ndarray,
+             num_points: int) -> np.ndarray:
+    """Interpolate the series at evenly spaced fractions of its duration."""
+    if not timestamps.size:
+        return np.empty(0)
+    points = np.linspace(timestamps[0], timestamps[-1], num_points)
+    return np.interp(points, timestamps, values)
+
+
+def curve_shape(timestamps: np.ndarray, values: np.ndarray,
+                num_points: int = 11) -> Dict[str, object]:
+    """Describe the curve by its key points, its trend and its resampling.
+
+    The resampled curve has the same number of points for any duration, so
+    the curves of different runs can be compared point by point.
+    """
+    if timestamps.size < 2:
+        return {}
+    hours = (timestamps - timestamps[0]) / NS_PER_HOUR
+    slope, _ = np.polyfit(hours, values, 1)
+    return {
+        'start': round(float(values[0]), 1),
+        'end': round(float(values[-1]), 1),
+        'peak': round(float(values.max()), 1),
+        'slope_per_hour': round(float(slope), 2),
+        'curve': [round(value, 1)
+                  for value in resample(timestamps, values, num_points).tolist()],
+    }
+
+
+def size_class_waste(allocated: Dict[str, np.ndarray],
+                     wasted: Dict[str, np.ndarray]) -> List[dict]:
+    """Summarize the waste of every size band, the most wasteful band first.
+
+    The waste ratio is the share of the bytes reserved by the band that are
+    not allocated, at the end of the test and at the peak of the waste.
+    """
+    summary = []
+    for band, waste in wasted.items():
+        if not waste.size:
+            continue
+        used = allocated.get(band, np.zeros(waste.size))[:waste.size]
+        reserved = used + waste
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratios = np.where(reserved > 0, 100 * waste / reserved, 0)
+        peak = int(np.argmax(waste))
+        summary.append({
+            'band': band,
+            'wasted_mb': round(float(waste[-1]) / 2 ** 20, 1),
+            'peak_wasted_mb': round(float(waste[peak]) / 2 ** 20, 1),
+            'waste_ratio': round(float(ratios[-1]), 1),
+            'peak_waste_ratio': round(float(ratios[peak]), 1),
+        })
+    return sorted(summary, key=lambda band: band['wasted_mb'], reverse=True)
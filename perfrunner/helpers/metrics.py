@@ -1,11 +1,32 @@
 import glob
 import os
-from typing import Dict, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 
 import numpy as np
 
-from cbagent.stores import PerfStore
+from cbagent.collectors.memcached_stats import SIZE_BANDS, size_band
+from cbagent.histograms import histogram_percentiles
+from cbagent.metadata_client import MetadataClient
+from cbagent.stores import new_store
 from logger import logger
+from perfrunner.helpers.attribution import (
+    attribute,
+    window_means,
+    window_percentiles,
+)
+from perfrunner.helpers.fragmentation import curve_shape, size_class_waste
+from perfrunner.helpers.misc import pretty_dict
+from perfrunner.helpers.quantiles import (
+    NS_PER_HOUR,
+    LogHistogram,
+    window_boundaries,
+    windowed_histograms,
+)
+from perfrunner.helpers.steady_state import (
+    confidence_interval,
+    find_steady_state,
+)
 from perfrunner.settings import CBMONITOR_HOST
 from perfrunner.workloads.bigfun.query_gen import Query
 
@@ -35,14 +56,87 @@ def strip(s: str) -> str:
     return s.lower()
 
 
+class SeriesCache:
+
+    """Keep the series downloaded from a store by (db, metric).
+
+    Every series is fetched only once per test, no matter how many KPIs use
+    it. The prefetch method downloads many series concurrently.
+    """
+
+    MAX_THREADS = 8
+
+    def __init__(self, store):
+        self.store = store
+        self.series = {}
+
+    def build_dbname(self, *args, **kwargs) -> str:
+        return self.store.build_dbname(*args, **kwargs)
+
+    def prefetch(self, keys: Iterable[Tuple[str, str]]):
+        keys = [key for key in set(keys) if key not in self.series]
+        if not keys:
+            return
+        with ThreadPoolExecutor(max_workers=self.MAX_THREADS) as executor:
+            all_series = executor.map(lambda key: self.store.get_series(*key),
+                                      keys)
+            self.series.update(zip(keys, all_series))
+
+    def get_series(self, db: str, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        if (db, metric) not in self.series:
+            self.series[db, metric] = self.store.get_series(db, metric)
+        return self.series[db, metric]
+
+    def get_values(self, db: str, metric: str) -> List[float]:
+        return self.get_series(db, metric)[1].tolist()
+
+    def iter_values(self, db: str, metric: str) -> Iterator[np.ndarray]:
+        """Yield the values in chunks, a series is not cached if not yet."""
+        if (db, metric) in self.series:
+            yield self.series[db, metric][1]
+        else:
+            yield from self.store.iter_values(db, metric)
+
+    def append(self, *args, **kwargs):
+        self.store.append(*args, **kwargs)
+        self.store.flush()
+
+
 class MetricHelper:
 
+    MAX_EXACT_SAMPLES = 10 ** 6  # Larger series use log histograms
+
+    PHASE_COLLECTOR = 'phases'
+
+    PHASE_KPIS = (
+        ('ops', 'ns_server', 'ops'),
+        ('cpu_utilization', 'ns_server', 'cpu_utilization_rate'),
+        ('disk_write_queue', 'ns_server', 'disk_write_queue'),
+        ('get_latency', 'spring_latency', 'latency_get'),
+    )
+
+    ATTRIBUTION_WINDOW = 10 * 10 ** 9  # 10 seconds
+
+    ATTRIBUTION_RESOURCES = (  # Resource, collector, metric, dimensions
+        ('frontend', 'memcached_stats', '{cmd}_99th', 'node'),
+        ('bg_fetch', 'memcached_stats', 'bg_wait_99th', 'node'),
+        ('flusher', 'memcached_stats', 'disk_commit_99th', 'node'),
+        ('disk_write_queue', 'ns_server', 'disk_write_queue', 'bucket'),
+        ('cpu', 'atop', 'memcached_cpu', 'server'),
+        ('disk', 'iostat', 'data_util', 'server'),
+        ('network', 'net_ports', 'kv_retrans_per_sec', 'server'),
+        ('compaction', 'active_tasks', 'bucket_compaction_progress', 'bucket'),
+    )
+
     def __init__(self, test):
         self.test = test
         self.test_config = test.test_config
         self.cluster_spec = test.cluster_spec
 
-        self.store = PerfStore(CBMONITOR_HOST)
+        store = new_store(backend=test.test_config.stats_settings.store,
+                          host=CBMONITOR_HOST,
+                          root=test.test_config.stats_settings.store_dir)
+        self.store = SeriesCache(store)
 
     @property
     def _title(self) -> str:
@@ -63,13 +157,203 @@ class MetricHelper:
     def _metric_info(self,
                      metric_id: str = None,
                      title: str = None,
-                     order_by: str = None) -> Dict[str, str]:
+                     order_by: str = None,
+                     higher_is_better: bool = True) -> Dict[str, str]:
         return {
             'id': metric_id or self.test_config.name,
             'title': title or self._title,
             'orderBy': order_by or self._order_by,
+            'higherIsBetter': higher_is_better,
         }
 
+    def _bucket_dbs(self, collector: str) -> List[str]:
+        return [
+            self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
+                                    collector=collector,
+                                    bucket=bucket)
+            for bucket in self.test_config.buckets
+        ]
+
+    def _server_dbs(self, collector: str) -> List[str]:
+        """Return the databases of the initial servers of all clusters."""
+        dbs = []
+        for (cluster_name, servers), initial_nodes in zip(
+                self.cluster_spec.clusters,
+                self.test_config.cluster.initial_nodes,
+        ):
+            cluster = list(filter(lambda name: name.startswith(cluster_name),
+                                  self.test.cbmonitor_clusters))[0]
+            for server in servers[:initial_nodes]:
+                hostname = server.replace('.', '')
+                dbs.append(self.store.build_dbname(cluster=cluster,
+                                                   collector=collector,
+                                                   server=hostname))
+        return dbs
+
+    def _get_values(self, dbs: List[str], metric: str) -> np.ndarray:
+        """Concatenate the values of the metric from all databases."""
+        keys = [(db, metric) for db in dbs]
+        self.store.prefetch(keys)
+        values = [self.store.get_series(*key)[1] for key in keys]
+        if not values:
+            return np.empty(0)
+        return np.concatenate(values)
+
+    def _steady_values(self, dbs: List[str], metric: str) -> np.ndarray:
+        """Concatenate the steady parts of the metric from all databases.
+
+        The warmup and the cooldown are trimmed from every series. A series
+        that never reaches a steady state is used as a whole.
+        """
+        keys = [(db, metric) for db in dbs]
+        self.store.prefetch(keys)
+
+        chunks = []
+        for db, metric in keys:
+            values = self.store.get_series(db, metric)[1]
+            steady = find_steady_state(values)
+            if steady is None:
+                logger.warn('No steady state of {} in {}, using all {} samples'
+                            .format(metric, db, values.size))
+                steady = slice(0, values.size)
+            else:
+                logger.info('Steady state of {} in {}: samples {}-{} of {}'
+                            .format(metric, db, steady.start, steady.stop,
+                                    values.size))
+            chunks.append(values[steady])
+        return np.concatenate(chunks or [[]])
+
+    @staticmethod
+    def _log_confidence_interval(kpi: str, values: np.ndarray):
+        mean, half_width = confidence_interval(values)
+        logger.info('{}: {:.1f} +/- {:.1f} (95% CI)'.format(kpi, mean,
+                                                            half_width))
+
+    def _histogram(self, dbs: List[str], metric: str) -> LogHistogram:
+        """Stream the values of the metric from all databases into a histogram.
+
+        The values are read chunk by chunk and not cached. The quantiles stay
+        exact up to MAX_EXACT_SAMPLES values.
+        """
+        histogram = LogHistogram(max_exact=self.MAX_EXACT_SAMPLES)
+        for db in dbs:
+            for values in self.store.iter_values(db, metric):
+                histogram.add(values)
+        return histogram
+
+    def _percentile(self, dbs: List[str], metric: str,
+                    percentile: Number) -> Tuple[float, float]:
+        """Return the percentile of the metric and its relative error."""
+        histogram = self._histogram(dbs, metric)
+        logger.info('{}th percentile of {} from {} samples, relative error: '
+                    '{:.1%}'.format(percentile, metric, histogram.count,
+                                    histogram.relative_error))
+        return histogram.quantile(percentile), histogram.relative_error
+
+    def _windowed_percentiles(self, dbs: List[str], metric: str,
+                              percentile: Number,
+                              boundaries: List[int] = None,
+                              window: int = NS_PER_HOUR) -> List[float]:
+        """Compute the percentile per time window.
+
+        The windows are either fixed-length (one hour by default) or split by
+        the explicit boundaries, in nanoseconds. Empty windows are skipped.
+        """
+        keys = [(db, metric) for db in dbs]
+        self.store.prefetch(keys)
+        series = [self.store.get_series(*key) for key in keys]
+        if boundaries is None:
+            timestamps = np.concatenate([ts for ts, _ in series] or [[]])
+            boundaries = window_boundaries(timestamps, window)
+
+        percentiles = []
+        for histogram in windowed_histograms(series, boundaries):
+            if histogram.count:
+                percentiles.append(histogram.quantile(percentile))
+        return percentiles
+
+    def add_phase_marker(self, phase: str, timestamp: int):
+        """Store the phase boundary as a point of the phases collector."""
+        for cluster in self.test.cbmonitor_clusters:
+            settings = type('settings', (object,), {
+                'cbmonitor_host': CBMONITOR_HOST,
+                'cluster': cluster,
+            })()
+            if self.test_config.stats_settings.store != 'local':
+                MetadataClient(settings).add_metrics(
+                    [phase], collector=self.PHASE_COLLECTOR)
+            self.store.append({phase: 1}, cluster=cluster,
+                              collector=self.PHASE_COLLECTOR,
+                              timestamp=timestamp)
+
+    def _phase_values(self, dbs: List[str],
+                      metric: str) -> Dict[str, np.ndarray]:
+        """Split the values of the metric by the recorded test phases.
+
+        Every phase lasts until the start of the next one, samples taken
+        before the first phase are ignored.
+        """
+        markers = sorted(self.test.phase_markers, key=lambda marker: marker[1])
+        boundaries = [timestamp for _, timestamp in markers]
+
+        keys = [(db, metric) for db in dbs]
+        self.store.prefetch(keys)
+
+        chunks = [[] for _ in markers]
+        for key in keys:
+            timestamps, values = self.store.get_series(*key)
+            phases = np.searchsorted(boundaries, timestamps, side='right') - 1
+            for i, phase_chunks in enumerate(chunks):
+                phase_chunks.append(values[phases == i])
+        return {phase: np.concatenate(phase_chunks or [[]])
+                for (phase, _), phase_chunks in zip(markers, chunks)}
+
+    def phase_kpis(self) -> Dict[str, Dict[str, float]]:
+        """Compute the averages and the latency percentile per phase."""
+        kpis = {}
+        for kpi, collector, metric in self.PHASE_KPIS:
+            if collector == 'spring_latency' and \
+                    not self.test.COLLECTORS.get('latency'):
+                continue
+            phase_values = self._phase_values(self._bucket_dbs(collector), metric)
+            kpis[kpi] = {}
+            for phase, values in phase_values.items():
+                if not values.size:
+                    continue
+                if kpi.endswith('latency'):
+                    value = np.percentile(values, 99.9)
+                else:
+                    value = np.mean(values)
+                kpis[kpi][phase] = round(float(value), 2)
+        return kpis
+
+    def phase_degradation(self, baseline: str = 'pre_rebalance',
+                          phase: str = 'rebalance') -> Dict[str, float]:
+        """Log the KPIs per phase and the ratios of the phase to the baseline."""
+        kpis = self.phase_kpis()
+        ratios = {}
+        for kpi, values in kpis.items():
+            if values.get(baseline) and phase in values:
+                ratios[kpi] = round(values[phase] / values[baseline], 2)
+
+        logger.info('KPIs by phase: {}'.format(pretty_dict(kpis)))
+        logger.info('Degradation ({} vs. {}): {}'.format(phase, baseline,
+                                                         pretty_dict(ratios)))
+        return ratios
+
+    def degradation_ratios(self, baseline: str = 'pre_rebalance',
+                           phase: str = 'rebalance') -> List[Metric]:
+        """Return the ratios of the phase to the baseline as metrics."""
+        metrics = []
+        for kpi, ratio in sorted(self.phase_degradation(baseline, phase).items()):
+            metric_id = '{}_{}_{}_ratio'.format(self.test_config.name, kpi, phase)
+            title = '{} ratio, {} vs. {}, {}'.format(kpi, phase, baseline,
+                                                     self._title)
+            metric_info = self._metric_info(metric_id, title,
+                                            higher_is_better=kpi == 'ops')
+            metrics.append((ratio, self._snapshots, metric_info))
+        return metrics
+
     def ycsb_queries(self, value: float, name: str, title: str) -> Metric:
         metric_id = '{}_{}'.format(self.test_config.name, name)
         title = '{}, {}'.format(title, self.test_config.showfast.title)
@@ -97,13 +381,21 @@ class MetricHelper:
         return throughput, self._snapshots, metric_info
 
     def _avg_n1ql_throughput(self) -> int:
-        test_time = self.test_config.access_settings.time
+        db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
+                                     collector='n1ql_stats')
+        if self.store.get_series(db, 'query_requests')[1].size:
+            values = self._steady_values([db], 'query_requests')
+            self._log_confidence_interval('Query throughput', values)
+            throughput = float(np.mean(values))
+        else:
+            logger.warn('No query stats, using the lifetime average')
+            test_time = self.test_config.access_settings.time
 
-        query_node = self.cluster_spec.servers_by_role('n1ql')[0]
-        vitals = self.test.rest.get_query_stats(query_node)
-        total_requests = vitals['requests.count']
+            query_node = self.cluster_spec.servers_by_role('n1ql')[0]
+            vitals = self.test.rest.get_query_stats(query_node)
+            total_requests = vitals['requests.count']
 
-        throughput = total_requests / test_time
+            throughput = total_requests / test_time
         return round(throughput, throughput < 1 and 1 or 0)
 
     def bulk_n1ql_throughput(self, time_elapsed: float) -> Metric:
@@ -117,7 +409,7 @@ class MetricHelper:
     def fts_index(self, elapsed_time: float) -> Metric:
         metric_id = self.test_config.name
         title = 'Index build time(sec), {}'.format(self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         index_time = round(elapsed_time, 1)
 
@@ -126,7 +418,7 @@ class MetricHelper:
     def fts_index_size(self, index_size_raw: int) -> Metric:
         metric_id = "{}_indexsize".format(self.test_config.name)
         title = 'Index size (MB), {}'.format(self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         index_size_mb = int(index_size_raw / (1024 ** 2))
 
@@ -150,7 +442,7 @@ class MetricHelper:
         metric_id = '{}_{}'.format(self.test_config.name, "jts_latency")
         metric_id = metric_id.replace('.', '')
         title = "{}, {}".format(prefix, self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
         timings = self._jts_metric(collector="jts_stats", metric="jts_latency")
         lat = round(np.percentile(timings, percentile), 2)
         if lat > 100:
@@ -158,13 +450,7 @@ class MetricHelper:
         return lat, self._snapshots, metric_info
 
     def _jts_metric(self, collector, metric):
-        timings = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector=collector,
-                                         bucket=bucket)
-            timings += self.store.get_values(db, metric=metric)
-        return timings
+        return self._get_values(self._bucket_dbs(collector), metric)
 
     def max_ops(self) -> Metric:
         metric_info = self._metric_info()
@@ -173,39 +459,30 @@ class MetricHelper:
         return throughput, self._snapshots, metric_info
 
     def _max_ops(self) -> int:
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='ns_server',
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric='ops')
+        values = self._steady_values(self._bucket_dbs('ns_server'), 'ops')
+        self._log_confidence_interval('Throughput', values)
 
         return int(np.percentile(values, 90))
 
     def get_collector_values(self, collector):
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector=collector,
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric=collector)
-        return values
+        return self._get_values(self._bucket_dbs(collector), collector)
 
     def count_overthreshold_value_of_collector(self, collector, threshold):
         values = self.get_collector_values(collector)
         return sum(v >= threshold for v in values)
 
     def get_percentile_value_of_collector(self, collector, percentile):
-        values = self.get_collector_values(collector)
-        return np.percentile(values, percentile)
+        return self._percentile(self._bucket_dbs(collector), collector,
+                                percentile)[0]
 
     def xdcr_lag(self, percentile: Number = 95) -> Metric:
         metric_id = '{}_{}th_xdcr_lag'.format(self.test_config.name, percentile)
         title = '{}th percentile replication lag (ms), {}'.format(percentile,
                                                                   self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
-        xdcr_lag = self.get_percentile_value_of_collector('xdcr_lag', percentile)
+        xdcr_lag, metric_info['relativeError'] = self._percentile(
+            self._bucket_dbs('xdcr_lag'), 'xdcr_lag', percentile)
 
         return round(xdcr_lag, 1), self._snapshots, metric_info
 
@@ -233,28 +510,20 @@ class MetricHelper:
         return drain_rate, self._snapshots, metric_info
 
     def avg_disk_write_queue(self) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='ns_server',
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric='disk_write_queue')
+        values = self._get_values(self._bucket_dbs('ns_server'),
+                                  'disk_write_queue')
 
         disk_write_queue = int(np.average(values))
 
         return disk_write_queue, self._snapshots, metric_info
 
     def avg_total_queue_age(self) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='ns_server',
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric='vb_avg_total_queue_age')
+        values = self._get_values(self._bucket_dbs('ns_server'),
+                                  'vb_avg_total_queue_age')
 
         avg_total_queue_age = int(np.average(values))
 
@@ -263,12 +532,8 @@ class MetricHelper:
     def avg_couch_views_ops(self) -> Metric:
         metric_info = self._metric_info()
 
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='ns_server',
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric='couch_views_ops')
+        values = self._get_values(self._bucket_dbs('ns_server'),
+                                  'couch_views_ops')
 
         couch_views_ops = int(np.average(values))
 
@@ -279,30 +544,25 @@ class MetricHelper:
         title = '{}th percentile query latency (ms), {}'.format(percentile,
                                                                 self._title)
         metric_info = self._metric_info(metric_id, title,
-                                        order_by=self.query_id)
+                                        order_by=self.query_id,
+                                        higher_is_better=False)
 
-        latency = self._query_latency(percentile)
+        latency, metric_info['relativeError'] = self._query_latency(percentile)
 
         return latency, self._snapshots, metric_info
 
-    def _query_latency(self, percentile: Number) -> float:
-        values = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='spring_query_latency',
-                                         bucket=bucket)
-            values += self.store.get_values(db, metric='latency_query')
-
-        query_latency = np.percentile(values, percentile)
+    def _query_latency(self, percentile: Number) -> Tuple[float, float]:
+        query_latency, error = self._percentile(
+            self._bucket_dbs('spring_query_latency'), 'latency_query', percentile)
         if query_latency < 100:
-            return round(query_latency, 1)
-        return int(query_latency)
+            return round(query_latency, 1), error
+        return int(query_latency), error
 
     def secondary_scan_latency(self, percentile: Number) -> Metric:
         metric_id = self.test_config.name
         title = '{}th percentile secondary scan latency (ms), {}'.format(percentile,
                                                                          self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         cluster = ""
         for cid in self.test.cbmonitor_clusters:
@@ -311,11 +571,9 @@ class MetricHelper:
                 break
         db = self.store.build_dbname(cluster=cluster,
                                      collector='secondaryscan_latency')
-        timings = self.store.get_values(db, metric='Nth-latency')
-        timings = list(map(int, timings))
-        logger.info("Number of samples are {}".format(len(timings)))
-        scan_latency = np.percentile(timings, percentile) / 1e6
-        scan_latency = round(scan_latency, 2)
+        scan_latency, metric_info['relativeError'] = self._percentile(
+            [db], 'Nth-latency', percentile)
+        scan_latency = round(scan_latency / 1e6, 2)
 
         return scan_latency, self._snapshots, metric_info
 
@@ -330,42 +588,110 @@ class MetricHelper:
         title = '{}th percentile {} {}'.format(percentile,
                                                operation.upper(),
                                                self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
-        latency = self._kv_latency(operation, percentile, collector)
+        latency, metric_info['relativeError'] = self._kv_latency(
+            operation, percentile, collector)
 
         return latency, self._snapshots, metric_info
 
     def _kv_latency(self,
                     operation: str,
                     percentile: Number,
-                    collector: str) -> float:
-        timings = []
+                    collector: str) -> Tuple[float, float]:
         metric = 'latency_{}'.format(operation)
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector=collector,
-                                         bucket=bucket)
-            timings += self.store.get_values(db, metric=metric)
-
-        latency = np.percentile(timings, percentile)
+        latency, error = self._percentile(self._bucket_dbs(collector), metric,
+                                          percentile)
         if latency > 100:
-            return round(latency)
-        return round(latency, 2)
+            return round(latency), error
+        return round(latency, 2), error
+
+    def kv_latency_windows(self,
+                           operation: str,
+                           percentile: Number = 99.9,
+                           boundaries: List[int] = None,
+                           collector: str = 'spring_latency') -> List[float]:
+        """Log and return the latency percentile per hour or per phase."""
+        metric = 'latency_{}'.format(operation)
+        latencies = self._windowed_percentiles(self._bucket_dbs(collector),
+                                               metric, percentile, boundaries)
+        logger.info('{}th percentile {} latency by window: {}'.format(
+            percentile, operation.upper(), [round(latency, 2) for latency in latencies]))
+        return latencies
+
+    def _resource_dbs(self, collector: str,
+                      dimensions: str) -> List[Tuple[str, str]]:
+        """Return the databases of the collector labeled by server."""
+        if dimensions == 'bucket':
+            return [('', db) for db in self._bucket_dbs(collector)]
+
+        _, servers = next(self.cluster_spec.clusters)
+        buckets = [None]
+        if dimensions == 'node':
+            buckets = self.test_config.buckets
+
+        dbs = []
+        for server in servers[:self._num_nodes]:
+            for bucket in buckets:
+                db = self.store.build_dbname(
+                    cluster=self.test.cbmonitor_clusters[0],
+                    collector=collector, bucket=bucket, server=server)
+                dbs.append((server, db))
+        return dbs
+
+    def latency_attribution(self,
+                            operation: str,
+                            percentile: Number = 99,
+                            collector: str = 'spring_latency') -> dict:
+        """Correlate the client latency with the server-side resources.
+
+        The latency percentile and the mean of every resource are computed
+        in fixed windows on the common time axis of the store. Resources
+        that were not collected are skipped.
+        """
+        metric = 'latency_{}'.format(operation)
+        keys = [(db, metric) for db in self._bucket_dbs(collector)]
+        self.store.prefetch(keys)
+        series = [self.store.get_series(*key) for key in keys]
+
+        timestamps = np.concatenate([ts for ts, _ in series] or [[]])
+        if not timestamps.size:
+            return {'correlations': {}, 'spikes': []}
+        boundaries = window_boundaries(timestamps, self.ATTRIBUTION_WINDOW)
+        window_starts = [int(timestamps.min())] + boundaries
+        latency = window_percentiles(series, boundaries, percentile)
+
+        cmd = {'get': 'get_cmd', 'set': 'store_cmd'}.get(operation, operation)
+        resources = {}
+        for resource, resource_collector, resource_metric, dimensions in \
+                self.ATTRIBUTION_RESOURCES:
+            resource_metric = resource_metric.format(cmd=cmd)
+            for server, db in self._resource_dbs(resource_collector,
+                                                 dimensions):
+                resource_series = self.store.get_series(db, resource_metric)
+                if resource_series[1].size:
+                    name = server and '{}@{}'.format(resource, server) or resource
+                    resources[name] = window_means(resource_series, boundaries)
+
+        correlations, spikes = attribute(latency, resources)
+        for spike in spikes:
+            spike['window_start'] = window_starts[spike['window']]
+
+        logger.info('Correlation of {}th percentile {} latency with resources: '
+                    '{}'.format(percentile, operation.upper(),
+                                pretty_dict(correlations)))
+        logger.info('{}th percentile {} latency spikes by window: {}'.format(
+            percentile, operation.upper(), pretty_dict(spikes)))
+        return {'correlations': correlations, 'spikes': spikes}
 
     def observe_latency(self, percentile: Number) -> Metric:
         metric_id = '{}_{}th'.format(self.test_config.name, percentile)
         title = '{}th percentile {}'.format(percentile, self._title)
-        metric_info = self._metric_info(metric_id, title)
-
-        timings = []
-        for bucket in self.test_config.buckets:
-            db = self.store.build_dbname(cluster=self.test.cbmonitor_clusters[0],
-                                         collector='observe',
-                                         bucket=bucket)
-            timings += self.store.get_values(db, metric='latency_observe')
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
-        latency = round(np.percentile(timings, percentile), 2)
+        latency, metric_info['relativeError'] = self._percentile(
+            self._bucket_dbs('observe'), 'latency_observe', percentile)
+        latency = round(latency, 2)
 
         return latency, self._snapshots, metric_info
 
@@ -373,7 +699,7 @@ class MetricHelper:
         metric_id = '{}_avg_cpu'.format(self.test_config.name)
         title = 'Avg. CPU utilization (%)'
         title = '{}, {}'.format(title, self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         cluster = self.test.cbmonitor_clusters[0]
         bucket = self.test_config.buckets[0]
@@ -392,23 +718,15 @@ class MetricHelper:
         title = 'Max. memcached RSS (MB),{}'.format(
             self._title.split(',')[-1]
         )
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         max_rss = 0
-        for (cluster_name, servers), initial_nodes in zip(
-                self.cluster_spec.clusters,
-                self.test_config.cluster.initial_nodes,
-        ):
-            cluster = list(filter(lambda name: name.startswith(cluster_name),
-                                  self.test.cbmonitor_clusters))[0]
-            for server in servers[:initial_nodes]:
-                hostname = server.replace('.', '')
-                db = self.store.build_dbname(cluster=cluster,
-                                             collector='atop',
-                                             server=hostname)
-                values = self.store.get_values(db, metric='memcached_rss')
-                rss = round(max(values) / 1024 ** 2)
-                max_rss = max(max_rss, rss)
+        dbs = self._server_dbs(collector='atop')
+        self.store.prefetch((db, 'memcached_rss') for db in dbs)
+        for db in dbs:
+            values = self.store.get_values(db, metric='memcached_rss')
+            rss = round(max(values) / 1024 ** 2)
+            max_rss = max(max_rss, rss)
 
         return max_rss, self._snapshots, metric_info
 
@@ -417,29 +735,17 @@ class MetricHelper:
         title = 'Avg. memcached RSS (MB),{}'.format(
             self._title.split(',')[-1]
         )
-        metric_info = self._metric_info(metric_id, title)
-
-        rss = []
-        for (cluster_name, servers), initial_nodes in zip(
-                self.cluster_spec.clusters,
-                self.test_config.cluster.initial_nodes,
-        ):
-            cluster = list(filter(lambda name: name.startswith(cluster_name),
-                                  self.test.cbmonitor_clusters))[0]
-            for server in servers[:initial_nodes]:
-                hostname = server.replace('.', '')
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
-                db = self.store.build_dbname(cluster=cluster,
-                                             collector='atop',
-                                             server=hostname)
-                rss += self.store.get_values(db, metric='memcached_rss')
+        rss = self._get_values(self._server_dbs(collector='atop'),
+                               'memcached_rss')
 
         avg_rss = int(np.average(rss) / 1024 ** 2)
 
         return avg_rss, self._snapshots, metric_info
 
     def memory_overhead(self, key_size: int = 20) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
         item_size = key_size + self.test_config.load_settings.size
         user_data = self.test_config.load_settings.items * item_size
@@ -453,13 +759,41 @@ class MetricHelper:
 
         return overhead, self._snapshots, metric_info
 
+    def fragmentation_profile(self) -> Dict[str, dict]:
+        """Log the fragmentation curve and the waste by size band per node."""
+        bands = [size_band(size) for size in SIZE_BANDS + (SIZE_BANDS[-1] + 1, )]
+
+        profile = {}
+        for server, db in self._resource_dbs('memcached_fragmentation', 'node'):
+            timestamps, ratios = self.store.get_series(db, 'fragmentation_ratio')
+            if not ratios.size:
+                continue
+
+            keys = [(db, '{}_{}_bytes'.format(metric, band))
+                    for metric in ('allocated', 'wasted') for band in bands]
+            self.store.prefetch(keys)
+            allocated, wasted = {}, {}
+            for band in bands:
+                allocated[band] = self.store.get_series(
+                    db, 'allocated_{}_bytes'.format(band))[1]
+                wasted[band] = self.store.get_series(
+                    db, 'wasted_{}_bytes'.format(band))[1]
+
+            profile[server] = {
+                'fragmentation': curve_shape(timestamps, ratios),
+                'size_classes': size_class_waste(allocated, wasted),
+            }
+
+        logger.info('Fragmentation profile: {}'.format(pretty_dict(profile)))
+        return profile
+
     def get_indexing_meta(self,
                           value: float,
                           index_type: str,
                           unit: str = "min") -> Metric:
         metric_id = '{}_{}'.format(self.test_config.name, index_type.lower())
         title = '{} index ({}), {}'.format(index_type, unit, self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
         metric_info['category'] = index_type.lower()
 
         value = s2m(value)
@@ -472,7 +806,7 @@ class MetricHelper:
         metric_id = '{}_{}'.format(self.test_config.name,
                                    memory_type.replace(" ", "").lower())
         title = '{} (GB), {}'.format(memory_type, self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         return value, self._snapshots, metric_info
 
@@ -495,7 +829,7 @@ class MetricHelper:
     def backup_size(self, size: float, edition: str) -> Metric:
         metric_id = '{}_size_{}'.format(self.test_config.name, edition)
         title = '{} backup size (GB), {}'.format(edition, self._title)
-        metric_info = self._metric_info(metric_id, title)
+        metric_info = self._metric_info(metric_id, title, higher_is_better=False)
 
         return size, self._snapshots, metric_info
 
@@ -557,12 +891,12 @@ class MetricHelper:
         return throughput, self._snapshots, metric_info
 
     def fragmentation_ratio(self, ratio: float) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
         return ratio, self._snapshots, metric_info
 
     def elapsed_time(self, time_elapsed: float) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
         time_elapsed = s2m(time_elapsed)
 
@@ -599,7 +933,7 @@ class MetricHelper:
         return metric
 
     def failover_time(self, delta: float) -> Metric:
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
         return delta, self._snapshots, metric_info
 
@@ -616,7 +950,7 @@ class MetricHelper:
         return throughput, self._snapshots, metric_info
 
     def multi_scan_diff(self, time_diff: float):
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
 
         time_diff = round(time_diff, 2)
 
@@ -645,36 +979,36 @@ class MetricHelper:
         title_split = self._title.split(sep=",", maxsplit=2)
         title = "Rebalance Time(sec)," + title_split[1]
         metric_id = '{}_rebalance_time'.format(self.test_config.name)
-        metric_info = self._metric_info(metric_id=metric_id, title=title)
+        metric_info = self._metric_info(metric_id=metric_id, title=title,
+                                        higher_is_better=False)
         return time, self._snapshots, metric_info
 
     def function_latency(self, percentile: float, latency_stats: dict) -> Metric:
         """Calculate eventing function latency stats.
 
         We get latency stats in format of- time:number of events processed in that time(samples)
-        In this method we get latency stats then calculate percentile latency using-
-        Calculate total number of samples.
-        Keep adding sample until we get required percentile number.
+        The time is the upper bound of the bucket, the previous time is its
+        lower bound. The percentile is interpolated within its bucket.
         For now it calculates for one function only
         """
-        metric_info = self._metric_info()
+        metric_info = self._metric_info(higher_is_better=False)
         latency = 0
         for name, stats in latency_stats.items():
-            total_samples = sum([sample for time, sample in stats])
-            latency_samples = 0
-            for time, samples in stats:
-                latency_samples += samples
-                if latency_samples >= (total_samples * percentile / 100):
-                    latency = float(time) / 1000
-                    break
-
-        latency = round(latency, 1)
+            highs = [int(time) for time, _ in stats]
+            lows = [0] + highs[:-1]
+            counts = [samples for _, samples in stats]
+            if sum(counts):
+                latency = histogram_percentiles(lows, highs, counts,
+                                                [percentile])[0] / 1000
+
+        latency = round(float(latency), 1)
         return latency, self._snapshots, metric_info
 
     def function_time(self, time: int, time_type: str, initials: str) -> Metric:
         title = initials + ", " + self._title
         metric_id = '{}_{}'.format(self.test_config.name, time_type.lower())
-        metric_info = self._metric_info(metric_id=metric_id, title=title)
+        metric_info = self._metric_info(metric_id=metric_id, title=title,
+                                        higher_is_better=False)
         time = s2m(seconds=time)
 
         return time, self._snapshots, metric_info
@@ -690,7 +1024,8 @@ class MetricHelper:
 
         metric_info = self._metric_info(metric_id,
                                         title,
-                                        order_by)
+                                        order_by,
+                                        higher_is_better=False)
 
         return latency, self._snapshots, metric_info
 
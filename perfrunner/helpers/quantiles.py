@@ -0,0 +1,126 @@
+import math
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+NS_PER_HOUR = 3600 * 10 ** 9
+
+
+class LogHistogram:
+
+    """Estimate quantiles of a stream with a bounded relative error.
+
+    Positive values are counted in logarithmic buckets, bucket i covers
+    (gamma^(i-1), gamma^i] with gamma = (1 + alpha) / (1 - alpha). Any
+    quantile is therefore estimated within alpha of the true value, no matter
+    how many values are added. Zero and negative values share a single bucket
+    and are estimated as zero.
+
+    Histograms with the same accuracy can be merged, so they can be built
+    from chunks of a series and combined across buckets or servers.
+
+    With max_exact set, the raw values are kept until more than max_exact
+    values are added and the quantiles of short series stay exact.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_exact: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        self.buckets = Counter()
+        self.zero_count = 0
+        self.count = 0
+
+        self.max_exact = max_exact
+        self.exact = [] if max_exact else None
+
+    @property
+    def relative_error(self) -> float:
+        if self.exact is not None:
+            return 0.0
+        return self.relative_accuracy
+
+    def _add_to_buckets(self, values: np.ndarray):
+        positive = values[values > 0]
+        self.zero_count += values.size - positive.size
+
+        indices = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        for index, count in zip(*np.unique(indices, return_counts=True)):
+            self.buckets[int(index)] += int(count)
+
+    def _drop_exact(self):
+        for values in self.exact:
+            self._add_to_buckets(values)
+        self.exact = None
+
+    def add(self, values: Iterable[float]):
+        values = np.array(values, dtype=np.float64)  # Copy memory-mapped chunks
+        self.count += values.size
+
+        if self.exact is None:
+            self._add_to_buckets(values)
+            return
+
+        self.exact.append(values)
+        if self.count > self.max_exact:
+            self._drop_exact()
+
+    def merge(self, other: 'LogHistogram'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge histograms of different accuracy')
+        if other.exact is not None:
+            for values in other.exact:
+                self.add(values)
+            return
+
+        if self.exact is not None:
+            self._drop_exact()
+        self.buckets.update(other.buckets)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, percentile: float) -> float:
+        """Return the estimate of the percentile (0-100) like np.percentile."""
+        if not self.count:
+            raise ValueError('Cannot compute a percentile of an empty histogram')
+        if self.exact is not None:
+            return float(np.percentile(np.concatenate(self.exact), percentile))
+
+        rank = percentile / 100 * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+def window_boundaries(timestamps: np.ndarray, window: int) -> List[int]:
+    """Split the time range of the series into windows of fixed length."""
+    if not timestamps.size:
+        return []
+    start, end = int(timestamps.min()), int(timestamps.max())
+    return list(range(start, end, window))[1:]
+
+
+def windowed_histograms(series: Iterable[Tuple[np.ndarray, np.ndarray]],
+                        boundaries: List[int],
+                        relative_accuracy: float = 0.01) -> List[LogHistogram]:
+    """Build one histogram per time window from the given series.
+
+    The boundaries split the time line into len(boundaries) + 1 windows, e.g.
+    the start and the end of a rebalance give the pre-rebalance, rebalance
+    and post-rebalance windows.
+    """
+    histograms = [LogHistogram(relative_accuracy)
+                  for _ in range(len(boundaries) + 1)]
+    for timestamps, values in series:
+        windows = np.searchsorted(boundaries, timestamps, side='right')
+        for window, histogram in enumerate(histograms):
+            histogram.add(values[windows == window])
+    return histograms
@@ -7,6 +7,7 @@ import requests
 
 from logger import logger
 from perfrunner.helpers.misc import pretty_dict, uhex
+from perfrunner.helpers.stats import compare, load_baseline
 from perfrunner.settings import SHOWFAST_HOST, ClusterSpec, TestConfig
 
 JSON = Dict[str, Any]
@@ -61,6 +62,20 @@ class ShowFastReporter(Reporter):
             'value': value,
         }
 
+    def _attach_verdict(self, benchmark: JSON, higher_is_better: bool):
+        baseline = load_baseline(self.test_config.showfast.baseline)
+        if benchmark['metric'] not in baseline:
+            return
+
+        comparison = compare(baseline[benchmark['metric']],
+                             [benchmark['value']],
+                             self.test_config.showfast.threshold,
+                             higher_is_better)
+        benchmark.update({
+            'effectSize': comparison['effect_size'],
+            'verdict': comparison['verdict'],
+        })
+
     @staticmethod
     def _log_benchmark(benchmark: JSON):
         logger.info('Dry run: {}'.format(pretty_dict(benchmark)))
@@ -75,8 +90,14 @@ class ShowFastReporter(Reporter):
              value: Union[float, int],
              snapshots: List[str],
              metric: JSON):
+        higher_is_better = metric.pop('higherIsBetter', True)
+        relative_error = metric.pop('relativeError', None)
         metric['id'] = '{}_{}'.format(metric['id'], self.cluster_spec.name)
         benchmark = self._generate_benchmark(metric['id'], value, snapshots)
+        if relative_error is not None:
+            benchmark['relativeError'] = relative_error
+        if self.test_config.showfast.baseline:
+            self._attach_verdict(benchmark, higher_is_better)
 
         if self.test_config.stats_settings.post_to_sf:
             self._post_benchmark(benchmark)
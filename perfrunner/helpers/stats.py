@@ -0,0 +1,169 @@
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+T_QUANTILES = (  # Two-sided 95% quantiles of Student's t by degrees of freedom
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+    2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+    2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+    2.042,
+)
+
+Z_QUANTILE = 1.960  # Beyond the table
+
+IMPROVEMENT = 'improvement'
+NO_CHANGE = 'no change'
+REGRESSION = 'regression'
+
+
+def t_quantile(dof: float) -> float:
+    """Return the two-sided 95% quantile of Student's t distribution."""
+    dof = int(dof)
+    if dof < 1:
+        return math.inf
+    if dof < len(T_QUANTILES):
+        return T_QUANTILES[dof]
+    return Z_QUANTILE
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """Return the mean, the median and the 95% confidence interval."""
+    values = np.asarray(values, dtype=np.float64)
+    std = float(np.std(values, ddof=1)) if values.size > 1 else 0.0
+    mean = float(np.mean(values))
+    half_width = t_quantile(values.size - 1) * std / math.sqrt(values.size) \
+        if values.size > 1 else 0.0
+    return {
+        'runs': int(values.size),
+        'mean': mean,
+        'median': float(np.median(values)),
+        'std': std,
+        'ci_low': mean - half_width,
+        'ci_high': mean + half_width,
+    }
+
+
+def effect_size(baseline: Sequence[float], values: Sequence[float]) -> float:
+    """Return Cohen's d of the values against the baseline.
+
+    If neither sample has any spread, the relative change of the means is
+    returned instead.
+    """
+    baseline = np.asarray(baseline, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    diff = np.mean(values) - np.mean(baseline)
+
+    dof = baseline.size + values.size - 2
+    squares = np.sum((baseline - np.mean(baseline)) ** 2) + \
+        np.sum((values - np.mean(values)) ** 2)
+    var = dof > 0 and squares / dof
+    if var > 0:
+        return float(diff / math.sqrt(var))
+    if np.mean(baseline):
+        return float(diff / abs(np.mean(baseline)))
+    return 0.0
+
+
+def is_significant(baseline: Sequence[float], values: Sequence[float]) -> bool:
+    """Run Welch's t-test at the 5% level.
+
+    A single run is compared with the prediction interval of the baseline.
+    """
+    baseline = np.asarray(baseline, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if baseline.size < 2:
+        return False
+
+    var_b = np.var(baseline, ddof=1) / baseline.size
+    var_v = np.var(values, ddof=1) / values.size if values.size > 1 else \
+        np.var(baseline, ddof=1)  # A single run varies like a baseline run
+    se = math.sqrt(var_b + var_v)
+    diff = abs(np.mean(values) - np.mean(baseline))
+    if not se:
+        return diff > 0
+
+    if values.size > 1:
+        dof = (var_b + var_v) ** 2 / sum((
+            var_b ** 2 / (baseline.size - 1),
+            var_v ** 2 / (values.size - 1),
+        ))
+    else:
+        dof = baseline.size - 1
+    return diff / se > t_quantile(dof)
+
+
+def verdict(baseline: Sequence[float],
+            values: Sequence[float],
+            threshold: float,
+            higher_is_better: bool = True) -> str:
+    """Classify the change that is significant and exceeds the threshold (%).
+
+    Only the magnitude of the threshold is used, the direction of the metric
+    is given explicitly.
+    """
+    mean_b, mean_v = np.mean(baseline), np.mean(values)
+    if not mean_b or not is_significant(baseline, values):
+        return NO_CHANGE
+
+    change = 100 * (mean_v - mean_b) / abs(mean_b)
+    if abs(change) < abs(threshold):
+        return NO_CHANGE
+    if (change > 0) == higher_is_better:
+        return IMPROVEMENT
+    return REGRESSION
+
+
+def find_change_point(values: Sequence[float],
+                      min_size: int = 2) -> Optional[int]:
+    """Find the index where the mean of the series shifts, if any.
+
+    The split maximizing the t-statistic between the two sides is taken and
+    kept only if the difference is significant.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    best, best_score = None, 0.0
+    for i in range(min_size, values.size - min_size + 1):
+        left, right = values[:i], values[i:]
+        se = math.sqrt(sum(np.var(side, ddof=1) / side.size
+                           for side in (left, right)))
+        diff = abs(np.mean(right) - np.mean(left))
+        score = diff / se if se else (math.inf if diff else 0.0)
+        if score > best_score:
+            best, best_score = i, score
+
+    if best is not None and is_significant(values[:best], values[best:]):
+        return best
+    return None
+
+
+def compare(baseline: dict, values: Sequence[float], threshold: float,
+            higher_is_better: bool = True) -> dict:
+    """Compare the runs with a baseline entry, the values of the baseline runs."""
+    return {
+        'verdict': verdict(baseline['values'], values, threshold,
+                           higher_is_better),
+        'effect_size': round(effect_size(baseline['values'], values), 2),
+    }
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, baseline: Dict[str, dict]):
+    with open(path, 'w') as fh:
+        json.dump(baseline, fh, indent=4, sort_keys=True)
+
+
+def pool_runs(benchmarks: Iterable[dict]) -> Dict[str, List[float]]:
+    """Group the values of ShowFast benchmarks by metric."""
+    runs = {}
+    for benchmark in benchmarks:
+        runs.setdefault(benchmark['metric'], []).append(benchmark['value'])
+    return runs
@@ -0,0 +1,81 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from perfrunner.helpers.stats import t_quantile
+
+MIN_SAMPLES = 60  # Shorter series are used as they are
+
+NUM_BATCHES = 10
+
+
+def rolling_stats(values: np.ndarray,
+                  window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the mean and the standard deviation of every full window."""
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.cumsum(np.insert(values, 0, 0))
+    squares = np.cumsum(np.insert(values ** 2, 0, 0))
+
+    means = (sums[window:] - sums[:-window]) / window
+    variances = (squares[window:] - squares[:-window]) / window - means ** 2
+    return means, np.sqrt(np.maximum(variances, 0))
+
+
+def find_steady_state(values: np.ndarray,
+                      window: int = None,
+                      tolerance: float = 0.1,
+                      min_fraction: float = 0.5) -> Optional[slice]:
+    """Find the part of the series after the warmup and before the cooldown.
+
+    The reference level is the median of the rolling mean over the middle half
+    of the series, so brief dips and spikes do not move it. A window is steady
+    if its mean is within the tolerance of the reference level (or within the
+    noise of the rolling mean for noisy series). The steady state spans from
+    the middle of the first to the middle of the last steady window, unsteady
+    windows in between are kept.
+
+    None is returned if the steady state covers less than min_fraction of the
+    series.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size < MIN_SAMPLES:
+        return slice(0, values.size)
+
+    window = window or max(values.size // 20, 10)
+    means, stds = rolling_stats(values, window)
+
+    middle = slice(means.size // 4, 3 * means.size // 4)
+    level, spread = np.median(means[middle]), np.median(stds[middle])
+
+    noise = 3 * spread / np.sqrt(window)  # Of the rolling mean
+    steady = np.abs(means - level) <= max(tolerance * abs(level), noise)
+    if not steady.any():
+        return None
+
+    first = int(np.argmax(steady))
+    last = int(means.size - np.argmax(steady[::-1]) - 1)
+
+    # A steady window marks its middle, except at the edges of the series
+    start = first and first + window // 2
+    stop = values.size if last == means.size - 1 else last + window // 2
+    if stop - start < min_fraction * values.size:
+        return None
+    return slice(start, stop)
+
+
+def confidence_interval(values: np.ndarray) -> Tuple[float, float]:
+    """Return the mean and the half-width of its 95% confidence interval.
+
+    Consecutive samples are correlated, so the interval is computed from the
+    means of contiguous batches rather than from the samples themselves.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    num_batches = min(NUM_BATCHES, values.size)
+    if num_batches < 2:
+        return float(np.mean(values)) if values.size else 0.0, 0.0
+
+    batch_means = [batch.mean()
+                   for batch in np.array_split(values, num_batches)]
+    std_error = np.std(batch_means, ddof=1) / np.sqrt(num_batches)
+    return float(np.mean(batch_means)), \
+        float(t_quantile(num_batches - 1) * std_error)
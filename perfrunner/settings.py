@@ -167,6 +167,7 @@ class ShowFastSettings:
         self.sub_category = options.get('sub_category', '')
         self.order_by = options.get('orderby', '')
         self.build_label = options.get('build_label', '')
+        self.baseline = options.get('baseline', '')
         self.threshold = int(options.get("threshold", self.THRESHOLD))
 
 
@@ -235,6 +236,24 @@ class StatsSettings:
 
     POST_CPU = 0
 
+    SCHEDULER = 'process'  # alt: asyncio
+
+    BUFFERED = 0
+    COMPRESS = 0  # gzip the payloads of the buffered writer
+
+    STORE = 'cbmonitor'  # alt: local
+    STORE_DIR = 'perfstore'
+
+    ARCHIVE_DIR = ''  # Empty to skip archiving
+
+    REMOTE_MODE = 'fabric'  # alt: agent
+
+    SAMPLER = 'shell'  # alt: procfs
+
+    PERF_COUNTERS = 0
+
+    NS_SERVER_MODE = 'last'  # alt: incremental
+
     CLIENT_PROCESSES = []
     SERVER_PROCESSES = ['beam.smp',
                         'cbft',
@@ -247,12 +266,30 @@ class StatsSettings:
         self.enabled = int(options.get('enabled', self.ENABLED))
         self.post_to_sf = int(options.get('post_to_sf', self.POST_TO_SF))
 
-        self.interval = int(options.get('interval', self.INTERVAL))
+        self.interval = float(options.get('interval', self.INTERVAL))
         self.lat_interval = float(options.get('lat_interval',
                                               self.LAT_INTERVAL))
 
         self.post_cpu = int(options.get('post_cpu', self.POST_CPU))
 
+        self.scheduler = options.get('scheduler', self.SCHEDULER)
+
+        self.buffered = int(options.get('buffered', self.BUFFERED))
+        self.compress = int(options.get('compress', self.COMPRESS))
+
+        self.store = options.get('store', self.STORE)
+        self.store_dir = options.get('store_dir', self.STORE_DIR)
+
+        self.archive_dir = options.get('archive_dir', self.ARCHIVE_DIR)
+
+        self.remote_mode = options.get('remote_mode', self.REMOTE_MODE)
+
+        self.sampler = options.get('sampler', self.SAMPLER)
+
+        self.perf_counters = int(options.get('perf_counters', self.PERF_COUNTERS))
+
+        self.ns_server_mode = options.get('ns_server_mode', self.NS_SERVER_MODE)
+
         self.client_processes = self.CLIENT_PROCESSES + \
             options.get('client_processes', '').split()
         self.server_processes = self.SERVER_PROCESSES + \
@@ -395,6 +432,7 @@ class PhaseSettings:
 
     WORKERS = 0
     QUERY_WORKERS = 0
+    QUERY_CONCURRENCY = 0
     N1QL_WORKERS = 0
     WORKLOAD_INSTANCES = 1
 
@@ -481,6 +519,8 @@ class PhaseSettings:
                                              self.QUERY_WORKERS))
         self.query_throughput = float(options.get('query_throughput',
                                                   self.QUERY_THROUGHPUT))
+        self.query_concurrency = int(options.get('query_concurrency',
+                                                 self.QUERY_CONCURRENCY))
 
         # N1QL settings
         self.n1ql_gen = options.get('n1ql_gen')
@@ -6,6 +6,7 @@ from typing import Callable, Iterable, List, Optional
 from logger import logger
 
 from perfrunner.helpers import local
+from perfrunner.helpers.archive import update_phase_markers
 from perfrunner.helpers.cluster import ClusterManager
 from perfrunner.helpers.memcached import MemcachedHelper
 from perfrunner.helpers.metrics import MetricHelper
@@ -55,6 +56,9 @@ class PerfTest:
         self.cbmonitor_snapshots = []
         self.cbmonitor_clusters = []
 
+        self.phase_markers = []  # (phase, timestamp in ns)
+        self.archives = []  # Bundles of the raw data
+
         if self.test_config.test_case.use_workers:
             self.worker_manager = WorkerManager(cluster_spec, test_config,
                                                 verbose)
@@ -94,6 +98,13 @@ class PerfTest:
     def eventing_nodes(self) -> List[str]:
         return self.rest.get_active_nodes_by_role(self.master_node, 'eventing')
 
+    def mark_phase(self, phase: str, timestamp: float = None):
+        """Record the start of a test phase, the timestamp is in seconds."""
+        timestamp = int((timestamp or time.time()) * 10 ** 9)
+        logger.info('Starting phase: {}'.format(phase))
+        self.phase_markers.append((phase, timestamp))
+        self.metrics.add_phase_marker(phase, timestamp)
+
     def tear_down(self):
         if self.test_config.test_case.use_workers:
             self.worker_manager.download_celery_logs()
@@ -290,6 +301,8 @@ class PerfTest:
     def report_kpi(self, *args, **kwargs):
         if self.test_config.stats_settings.enabled:
             self._report_kpi(*args, **kwargs)
+            for path in self.archives:
+                update_phase_markers(path, self.phase_markers)
 
     def _report_kpi(self, *args, **kwargs):
         pass
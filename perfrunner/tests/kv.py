@@ -91,9 +91,12 @@ class DGMCompactedTest(DGMTest):
 
 class ReadLatencyDGMTest(KVTest):
 
-    COLLECTORS = {'disk': True, 'latency': True, 'net': False}
+    COLLECTORS = {'disk': True, 'latency': True, 'memcached_stats': True,
+                  'net': False}
 
     def _report_kpi(self):
+        self.metrics.kv_latency_windows(operation='get')
+        self.metrics.latency_attribution(operation='get')
         self.reporter.post(
             *self.metrics.kv_latency(operation='get')
         )
@@ -103,6 +106,8 @@ class MixedLatencyDGMTest(ReadLatencyDGMTest):
 
     def _report_kpi(self):
         for operation in ('get', 'set'):
+            self.metrics.kv_latency_windows(operation=operation)
+            self.metrics.latency_attribution(operation=operation)
             self.reporter.post(
                 *self.metrics.kv_latency(operation=operation)
             )
@@ -263,7 +268,7 @@ class FragmentationTest(PerfTest):
     fragmentation.
     """
 
-    COLLECTORS = {'net': False}
+    COLLECTORS = {'fragmentation': True, 'net': False}
 
     @with_stats
     def load_and_append(self):
@@ -286,6 +291,7 @@ class FragmentationTest(PerfTest):
         return ratio
 
     def _report_kpi(self):
+        self.metrics.fragmentation_profile()
         ratio = self.calc_fragmentation_ratio()
 
         self.reporter.post(
@@ -322,6 +328,7 @@ class PathoGenTest(FragmentationTest):
             pg.run()
 
     def _report_kpi(self):
+        self.metrics.fragmentation_profile()
         self.reporter.post(
             *self.metrics.avg_memcached_rss()
         )
@@ -50,6 +50,11 @@ class RebalanceTest(PerfTest):
             *self.metrics.rebalance_time(self.rebalance_time)
         )
 
+    def _report_degradation(self, baseline: str = 'pre_rebalance',
+                            phase: str = 'rebalance'):
+        for metric in self.metrics.degradation_ratios(baseline, phase):
+            self.reporter.post(*metric)
+
     @timeit
     def _rebalance(self, services):
         clusters = self.cluster_spec.clusters
@@ -98,8 +103,11 @@ class RebalanceTest(PerfTest):
 
     @with_stats
     def rebalance(self, services=None):
+        self.mark_phase('pre_rebalance')
         self.pre_rebalance()
+        self.mark_phase('rebalance')
         self.rebalance_time = self._rebalance(services)
+        self.mark_phase('post_rebalance')
         self.post_rebalance()
 
 
@@ -107,12 +115,16 @@ class RebalanceKVTest(RebalanceTest):
 
     ALL_HOSTNAMES = True
 
-    COLLECTORS = {'latency': True}
+    COLLECTORS = {'latency': True, 'ns_server_per_node': True}
 
     def post_rebalance(self):
         super().post_rebalance()
         self.worker_manager.abort()
 
+    def _report_kpi(self, *args):
+        self._report_degradation()
+        super()._report_kpi()
+
     def run(self):
         self.load()
         self.wait_for_persistence()
@@ -219,11 +231,18 @@ class FailoverTest(RebalanceTest):
     def _failover(self):
         pass
 
+    @with_stats
     def failover(self):
+        self.mark_phase('pre_failover')
         self.pre_rebalance()
         self._failover()
         self.post_rebalance()
 
+    def mark_failover(self, t_start: float, t_end: float = None):
+        self.mark_phase('failover', t_start)
+        if t_end:
+            self.mark_phase('post_failover', t_end)
+
     def run(self):
         self.load()
         self.wait_for_persistence()
@@ -246,10 +265,12 @@ class HardFailoverTest(FailoverTest):
         if t_end and t_start:
             t_start = self.convert_time(t_start)
             t_end = self.convert_time(t_end)
+            self.mark_failover(t_start, t_end)
             delta = int(1000 * (t_end - t_start))  # s -> ms
             self.reporter.post(
                 *self.metrics.failover_time(delta)
             )
+            self._report_degradation('pre_failover', 'failover')
 
     def _failover(self, *args):
         clusters = self.cluster_spec.clusters
@@ -275,10 +296,12 @@ class GracefulFailoverTest(FailoverTest):
         if t_end and t_start:
             t_start = self.convert_time(t_start)
             t_end = self.convert_time(t_end)
+            self.mark_failover(t_start, t_end)
             delta = int(1000 * (t_end - t_start))  # s -> ms
             self.reporter.post(
                 *self.metrics.failover_time(delta)
             )
+            self._report_degradation('pre_failover', 'failover')
 
     def _failover(self, *args):
         clusters = self.cluster_spec.clusters
@@ -305,10 +328,12 @@ class AutoFailoverTest(FailoverTest):
         if t_end and t_start:
             t_start = self.convert_time(t_start)
             t_end = self.convert_time(t_end)
+            self.mark_failover(t_start, t_end)
             delta = int(1000 * (t_end - t_start))  # s -> ms
             self.reporter.post(
                 *self.metrics.failover_time(delta)
             )
+            self._report_degradation('pre_failover', 'failover')
 
     def _failover(self, *args):
         clusters = self.cluster_spec.clusters
@@ -330,10 +355,13 @@ class FailureDetectionTest(FailoverTest):
 
         if t_failover:
             t_failover = self.convert_time(t_failover)
+            self.mark_phase('failure', self.t_failure)
+            self.mark_failover(t_failover)
             delta = round(t_failover - self.t_failure, 1)
             self.reporter.post(
                 *self.metrics.failover_time(delta)
             )
+            self._report_degradation('pre_failover', 'failure')
 
     def _failover(self, *args):
         clusters = self.cluster_spec.clusters
@@ -1,8 +1,8 @@
-import csv
 import json
 import subprocess
 import time
 
+from cbagent.collectors.secondary_latency import read_statsfile
 from logger import logger
 from perfrunner.helpers.cbmonitor import timeit, with_stats
 from perfrunner.helpers.local import (
@@ -471,15 +471,9 @@ class InitialIncrementalMovingScanThroughputTest(InitialIncrementalScanThroughpu
         id:1, rows:0, duration:8632734534, Nth-latency:16686556
         id:1, rows:0, duration:3403693509, Nth-latency:6859285
         """
-        duration = 0
-        lines = 0
-        with open(self.SECONDARY_STATS_FILE, 'r') as csvfile:
-            csv_reader = csv.reader(csvfile, delimiter=',')
-            for row in csv_reader:
-                duration += int(row[2].split(":")[1])
-                lines += 1
+        durations = read_statsfile(self.SECONDARY_STATS_FILE)['duration']
         interval, concurrency = self.get_config()
-        return lines * interval / (duration / 1000000000 / concurrency)
+        return durations.size * interval / (durations.sum() / 1000000000 / concurrency)
 
     def calc_throughput(self) -> float:
         """Calculate average throughput from list of throughput's."""
@@ -11,7 +11,7 @@ class XdcrTest(PerfTest):
 
     CLUSTER_NAME = 'perf'
 
-    COLLECTORS = {'xdcr_lag': True, 'xdcr_stats': True}
+    COLLECTORS = {'net_ports': True, 'xdcr_lag': True, 'xdcr_stats': True}
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
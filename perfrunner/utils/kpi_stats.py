@@ -0,0 +1,141 @@
+import re
+from argparse import ArgumentParser
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+from logger import logger
+from perfrunner.helpers.misc import pretty_dict
+from perfrunner.helpers.stats import (
+    compare,
+    find_change_point,
+    load_baseline,
+    pool_runs,
+    save_baseline,
+    summarize,
+)
+from perfrunner.settings import ShowFastSettings, TestConfig
+from perfrunner.utils.hidefast import get_benchmarks
+
+
+def build_key(build: str) -> List[int]:
+    return [int(number) for number in re.findall(r'\d+', build)]
+
+
+def history(benchmarks: List[dict], metric: str) -> Dict[str, float]:
+    """Return the median value of the metric by build, oldest build first."""
+    runs = {}
+    for benchmark in benchmarks:
+        if benchmark['metric'] == metric:
+            runs.setdefault(benchmark['build'], []).append(benchmark['value'])
+    return OrderedDict((build, float(np.median(runs[build])))
+                       for build in sorted(runs, key=build_key))
+
+
+def read_thresholds(test_files: List[str]) -> Dict[str, int]:
+    """Return the showfast.threshold of every test config by test name."""
+    thresholds = {}
+    for test_file in test_files:
+        test_config = TestConfig()
+        test_config.parse(test_file)
+        thresholds[test_config.name] = test_config.showfast.threshold
+    return thresholds
+
+
+def metric_threshold(metric: str, thresholds: Dict[str, int],
+                     default: float) -> float:
+    """Use the threshold of the test that reports the metric.
+
+    The metric IDs start with the test name, the longest matching name wins.
+    """
+    tests = [test for test in thresholds if metric.startswith(test)]
+    if tests:
+        return thresholds[max(tests, key=len)]
+    return default
+
+
+def analyze(benchmarks: List[dict], build: str, baseline: Dict[str, dict],
+            threshold: float,
+            thresholds: Dict[str, int] = None,
+            lower_is_better: List[str] = None) -> Dict[str, dict]:
+    runs = pool_runs(b for b in benchmarks if b['build'] == build)
+
+    results = {}
+    for metric, values in sorted(runs.items()):
+        result = summarize(values)
+        if metric in baseline:
+            higher_is_better = not any(metric.startswith(prefix)
+                                       for prefix in lower_is_better or [])
+            result.update(compare(baseline[metric], values,
+                                  metric_threshold(metric, thresholds or {},
+                                                   threshold),
+                                  higher_is_better))
+
+        builds = history(benchmarks, metric)
+        change_point = find_change_point(list(builds.values()))
+        if change_point is not None:
+            result['change_point'] = list(builds)[change_point]
+
+        logger.info('{}: {}'.format(metric, pretty_dict(result)))
+        results[metric] = result
+    return results
+
+
+def get_args():
+    parser = ArgumentParser()
+
+    parser.add_argument('-c', '--component', dest='component',
+                        required=True,
+                        help='ShowFast component')
+    parser.add_argument('--category', dest='category',
+                        required=True,
+                        help='ShowFast category')
+    parser.add_argument('-b', '--build', dest='build',
+                        required=True,
+                        help='build of the repeated runs')
+    parser.add_argument('--baseline', dest='baseline',
+                        default='baseline.json',
+                        help='path to the baseline file')
+    parser.add_argument('--threshold', dest='threshold',
+                        default=ShowFastSettings.THRESHOLD,
+                        type=float,
+                        help='smallest relevant change, in percent')
+    parser.add_argument('-t', '--tests', dest='test_files',
+                        nargs='*',
+                        default=[],
+                        help='test configs with the thresholds of the metrics')
+    parser.add_argument('-l', '--lower-is-better', dest='lower_is_better',
+                        nargs='*',
+                        default=[],
+                        help='prefixes of the metrics where lower values are '
+                             'better, like latency or rebalance time')
+    parser.add_argument('--save-baseline', dest='save_baseline',
+                        action='store_true',
+                        help='store the runs of the build as the new baseline')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    benchmarks = [b for b in get_benchmarks(args.component, args.category)
+                  if not b['hidden']]
+    baseline = load_baseline(args.baseline)
+
+    thresholds = read_thresholds(args.test_files)
+
+    analyze(benchmarks, args.build, baseline, args.threshold, thresholds,
+            args.lower_is_better)
+
+    if args.save_baseline:
+        for metric, values in pool_runs(b for b in benchmarks
+                                        if b['build'] == args.build).items():
+            baseline[metric] = {'values': values}
+        save_baseline(args.baseline, baseline)
+        logger.info('Saved the baseline to {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Optional
+
+from cbagent.stores import LocalStore
+from logger import logger
+from perfrunner.helpers.archive import (
+    CLUSTER_SPEC,
+    STORE_DIR,
+    TEST_CONFIG,
+    extract_bundle,
+    find_bundles,
+)
+from perfrunner.helpers.metrics import MetricHelper
+from perfrunner.helpers.misc import pretty_dict
+from perfrunner.settings import ClusterSpec, TestConfig
+
+KPIS = (  # Collector, metric, method, arguments
+    ('ns_server', 'ops', 'max_ops', ()),
+    ('ns_server', 'disk_write_queue', 'avg_disk_write_queue', ()),
+    ('ns_server', 'vb_avg_total_queue_age', 'avg_total_queue_age', ()),
+    ('ns_server', 'cpu_utilization_rate', 'cpu_utilization', ()),
+    ('atop', 'memcached_rss', 'avg_memcached_rss', ()),
+    ('atop', 'memcached_rss', 'max_memcached_rss', ()),
+    ('spring_latency', 'latency_get', 'kv_latency', ('get', )),
+    ('spring_latency', 'latency_set', 'kv_latency', ('set', )),
+    ('spring_query_latency', 'latency_query', 'query_latency', (90, )),
+    ('observe', 'latency_observe', 'observe_latency', (95, )),
+    ('xdcr_lag', 'xdcr_lag', 'xdcr_lag', ()),
+)
+
+
+class ArchivedTest:
+
+    """Stand in for a finished test, the KPIs are computed from a bundle."""
+
+    def __init__(self, manifest: dict, test_config: TestConfig,
+                 cluster_spec: ClusterSpec):
+        self.test_config = test_config
+        self.cluster_spec = cluster_spec
+
+        self.build = manifest['build']
+        self.COLLECTORS = manifest['collectors']
+        self.cbmonitor_clusters = manifest['clusters']
+        self.cbmonitor_snapshots = manifest['clusters']
+        self.phase_markers = [tuple(marker)
+                              for marker in manifest['phase_markers']]
+
+
+def recompute(bundle: str, test_config_file: Optional[str]) -> Dict[str, float]:
+    """Compute all KPIs that the series in the bundle support."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manifest = extract_bundle(bundle, tmp_dir)
+
+        store_dir = os.path.join(tmp_dir, STORE_DIR)
+
+        test_config = TestConfig()
+        test_config.parse(test_config_file or os.path.join(tmp_dir, TEST_CONFIG))
+        test_config.name = manifest['test']
+        if not test_config.config.has_section('stats'):
+            test_config.config.add_section('stats')
+        test_config.config.set('stats', 'store', 'local')
+        test_config.config.set('stats', 'store_dir', store_dir)
+
+        cluster_spec = ClusterSpec()
+        cluster_spec.parse(os.path.join(tmp_dir, CLUSTER_SPEC))
+        cluster_spec.name = manifest['cluster']
+
+        metrics = MetricHelper(ArchivedTest(manifest, test_config, cluster_spec))
+
+        store = LocalStore(store_dir)
+        available = set()
+        for db in store.list_dbs():
+            index = store.read_index(db)
+            available.update((index['collector'], metric)
+                             for metric in index['metrics'])
+
+        kpis = {}
+        for collector, metric, method, args in KPIS:
+            if (collector, metric) not in available:
+                continue
+            try:
+                value, _, metric_info = getattr(metrics, method)(*args)
+            except (IndexError, KeyError, ValueError) as e:
+                logger.warn('Failed to compute {}: {}'.format(method, e))
+                continue
+            except SystemExit:  # Already logged by logger.interrupt
+                continue
+            kpis[metric_info['id']] = value
+        return kpis
+
+
+def get_args():
+    parser = ArgumentParser()
+
+    parser.add_argument('-a', '--archive-dir', dest='archive_dir',
+                        default='archive',
+                        help='directory with the bundles')
+    parser.add_argument('-t', '--test', dest='test_config_file',
+                        help='test config, the archived one by default')
+    parser.add_argument('-o', '--output', dest='output',
+                        default='recomputed.json',
+                        help='file with the KPIs by bundle')
+    parser.add_argument('-j', '--jobs', dest='jobs',
+                        type=int,
+                        help='number of bundles processed in parallel')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    bundles = find_bundles(args.archive_dir)
+    logger.info('Recomputing the KPIs of {} bundles'.format(len(bundles)))
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for bundle, kpis in zip(bundles,
+                                executor.map(recompute, bundles,
+                                             repeat(args.test_config_file))):
+            logger.info('{}: {}'.format(bundle, pretty_dict(kpis)))
+            results[os.path.basename(bundle)] = kpis
+
+    with open(args.output, 'w') as fh:
+        json.dump(results, fh, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
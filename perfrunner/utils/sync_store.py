@@ -0,0 +1,89 @@
+from argparse import ArgumentParser
+from collections import defaultdict
+from typing import Dict
+
+from cbagent.metadata_client import MetadataClient
+from cbagent.stores import LocalStore, PerfStore
+from logger import logger
+from perfrunner.settings import CBMONITOR_HOST
+
+
+def register_metrics(host: str, index: dict):
+    settings = type('settings', (object,), {
+        'cbmonitor_host': host,
+        'cluster': index['cluster'],
+    })()
+    mc = MetadataClient(settings)
+
+    mc.add_cluster()
+    if index['server']:
+        mc.add_server(index['server'])
+    if index['bucket']:
+        mc.add_bucket(index['bucket'])
+    if index['index']:
+        mc.add_index(index['index'])
+
+    mc.add_metrics(index['metrics'],
+                   bucket=index['bucket'],
+                   index=index['index'],
+                   server=index['server'],
+                   collector=index['collector'])
+
+
+def read_points(local_store: LocalStore, db: str, index: dict) -> Dict[int, dict]:
+    points = defaultdict(dict)
+    for metric in index['metrics']:
+        timestamps, values = local_store.get_series(db, metric)
+        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+            points[timestamp][metric] = value
+    return points
+
+
+def sync(store_dir: str, host: str, cluster: str = None):
+    local_store = LocalStore(store_dir)
+    store = PerfStore(host, buffered=True, spill_file='sync_store.spill.gz')
+
+    for db in local_store.list_dbs():
+        index = local_store.read_index(db)
+        if cluster and index['cluster'] != cluster:
+            continue
+
+        logger.info('Uploading {}'.format(db))
+        register_metrics(host, index)
+
+        points = read_points(local_store, db, index)
+        for timestamp in sorted(points):
+            store.append(points[timestamp],
+                         cluster=index['cluster'],
+                         server=index['server'],
+                         bucket=index['bucket'],
+                         index=index['index'],
+                         collector=index['collector'],
+                         timestamp=timestamp)
+
+    store.close()
+
+
+def get_args():
+    parser = ArgumentParser()
+
+    parser.add_argument('-d', '--store-dir', dest='store_dir',
+                        default='perfstore',
+                        help='directory of the local time series store')
+    parser.add_argument('--cbmonitor-host', dest='host',
+                        default=CBMONITOR_HOST,
+                        help='cbmonitor host')
+    parser.add_argument('-c', '--cluster', dest='cluster',
+                        help='upload the series of a single cluster')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+
+    sync(store_dir=args.store_dir, host=args.host, cluster=args.cluster)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,12 @@ setup(
             'go_dependencies = perfrunner.utils.go_dependencies:main',
             'hidefast = perfrunner.utils.hidefast:main',
             'install = perfrunner.utils.install:main',
+            'kpi_stats = perfrunner.utils.kpi_stats:main',
             'perfrunner = perfrunner.__main__:main',
+            'recompute = perfrunner.utils.recompute:main',
             'recovery = perfrunner.utils.recovery:main',
             'spring = spring.__main__:main',
+            'sync_store = perfrunner.utils.sync_store:main',
             'templater = perfrunner.utils.templater:main',
             'trigger = perfrunner.utils.trigger:main',
             'verify_logs = perfrunner.utils.verify_logs:main',
@@ -1,11 +1,15 @@
+import asyncio
 import os
 import signal
 import time
+from itertools import cycle
 from multiprocessing import Event, Lock, Process, Value
 from threading import Timer
 from typing import Callable, List, Tuple, Union
 
+import requests
 import twisted
+from aiohttp import BasicAuth, ClientError, ClientSession, TCPConnector
 from decorator import decorator
 from numpy import random
 from psutil import cpu_count
@@ -13,7 +17,7 @@ from twisted.internet import reactor
 
 from logger import logger
 from perfrunner.helpers.sync import SyncHotWorkload
-from spring.cbgen import CBAsyncGen, CBGen, SubDocGen
+from spring.cbgen import CBAsyncGen, CBGen, SubDocGen, error_tracker
 from spring.docgen import (
     ArrayIndexingDocument,
     Document,
@@ -570,6 +574,8 @@ class WorkerFactory:
 class ViewWorkerFactory:
 
     def __new__(cls, workload_settings):
+        if getattr(workload_settings, 'query_concurrency', 0):
+            return AsyncViewWorker, workload_settings.query_workers
         return ViewWorker, workload_settings.query_workers
 
 
@@ -589,6 +595,11 @@ class ViewWorker(Worker):
             self.new_queries = ViewQueryGenByType(workload_settings.index_type,
                                                   workload_settings.query_params)
 
+    def next_query(self, curr_items_spot: int, deleted_spot: int):
+        key = self.existing_keys.next(curr_items_spot, deleted_spot)
+        doc = self.docs.next(key)
+        return self.new_queries.next(doc)
+
     @with_sleep
     def do_batch(self):
         curr_items_spot = \
@@ -597,9 +608,8 @@ class ViewWorker(Worker):
             self.deleted_items.value + self.ws.deletes * self.ws.workers
 
         for _ in range(self.BATCH_SIZE):
-            key = self.existing_keys.next(curr_items_spot, deleted_spot)
-            doc = self.docs.next(key)
-            ddoc_name, view_name, query = self.new_queries.next(doc)
+            ddoc_name, view_name, query = self.next_query(curr_items_spot,
+                                                          deleted_spot)
 
             latency = self.cb.view_query(ddoc_name, view_name, query=query)
 
@@ -627,6 +637,116 @@ class ViewWorker(Worker):
         self.dump_stats()
 
 
+class AsyncViewWorker(ViewWorker):
+
+    """Keep many view queries in flight from a single worker process.
+
+    Queries are spread across the view ports of all data nodes using pooled
+    keep-alive connections. Rows are streamed and discarded, the time to the
+    first chunk and the total latency are recorded separately.
+    """
+
+    TIMEOUT = 60  # seconds
+
+    def init_db(self):
+        pass  # The queries go through aiohttp, no SDK connection is needed
+
+    def init_creds(self):
+        pass
+
+    def get_view_endpoints(self) -> List[str]:
+        host = self.ts.node.split(':')[0]
+        api = 'http://{}:8091/pools/default/buckets/{}'.format(host,
+                                                               self.ts.bucket)
+        bucket = requests.get(url=api, auth=self.auth).json()
+        return [node['couchApiBase'] for node in bucket['nodes']]
+
+    @property
+    def auth(self) -> Tuple[str, str]:
+        return self.ts.bucket, self.ts.password
+
+    async def view_query(self,
+                         session: ClientSession,
+                         base_url: str,
+                         ddoc_name: str,
+                         view_name: str,
+                         query) -> Tuple[float, float]:
+        url = '{}/_design/{}/_view/{}?{}'.format(base_url, ddoc_name,
+                                                 view_name, query.encoded)
+        first_row = None
+        t0 = time.time()
+        async with session.get(url, timeout=self.TIMEOUT) as response:
+            while True:
+                chunk = await response.content.readany()
+                if not chunk:
+                    break
+                if first_row is None:
+                    first_row = time.time() - t0
+            if response.status != 200:
+                raise ClientError('Bad response: {}'.format(response.status))
+        return first_row, time.time() - t0
+
+    async def run_queries(self, session: ClientSession, endpoints: cycle):
+        while not self.time_to_stop():
+            t0 = time.time()
+
+            curr_items_spot = \
+                self.curr_items.value - self.ws.creates * self.ws.workers
+            deleted_spot = \
+                self.deleted_items.value + self.ws.deletes * self.ws.workers
+            ddoc_name, view_name, query = self.next_query(curr_items_spot,
+                                                          deleted_spot)
+            try:
+                first_row, latency = await self.view_query(
+                    session, next(endpoints), ddoc_name, view_name, query)
+            except (ClientError, asyncio.TimeoutError) as e:
+                error_tracker.track('view_query', e)
+            else:
+                self.reservoir.update(operation='query', value=latency)
+                if first_row is not None:  # Empty response
+                    self.reservoir.update(operation='query_first_row',
+                                          value=first_row)
+
+            if self.target_time is not None:
+                delta = self.target_time - (time.time() - t0)
+                if delta > 0:
+                    await asyncio.sleep(self.CORRECTION_FACTOR * delta)
+
+    async def run_all(self):
+        endpoints = cycle(self.get_view_endpoints())
+        connector = TCPConnector(limit=self.ws.query_concurrency)
+        async with ClientSession(connector=connector,
+                                 auth=BasicAuth(*self.auth)) as session:
+            await asyncio.gather(*[
+                self.run_queries(session, endpoints)
+                for _ in range(self.ws.query_concurrency)
+            ])
+
+    def run(self, sid, lock, curr_ops, curr_items, deleted_items, *args):
+        if self.ws.query_throughput < float('inf'):
+            self.target_time = float(self.ws.query_concurrency) * \
+                self.ws.query_workers / self.ws.query_throughput
+        else:
+            self.target_time = None
+        self.sid = sid
+        self.curr_items = curr_items
+        self.deleted_items = deleted_items
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            logger.info('Started: {}-{}'.format(self.NAME, self.sid))
+            loop.run_until_complete(self.run_all())
+        except KeyboardInterrupt:
+            logger.info('Interrupted: {}-{}'.format(self.NAME, self.sid))
+        else:
+            logger.info('Finished: {}-{}'.format(self.NAME, self.sid))
+        finally:
+            loop.close()
+
+        self.dump_stats()
+
+
 class N1QLWorkerFactory:
 
     def __new__(cls, workload_settings):
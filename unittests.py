@@ -1,12 +1,75 @@
 import glob
+import io
 import json
+import os
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
 from collections import defaultdict, namedtuple
 from multiprocessing import Value
+from queue import Queue
 from unittest import TestCase
 
+import numpy as np
 import snappy
 
+from cbagent.collectors.libstats.agent import SAMPLER, AgentChannel
+from cbagent.collectors.libstats.netstats import (
+    parse_ss,
+    resolve_hosts,
+    service_group,
+)
+from cbagent.collectors.libstats.procstats import ProcStats, parse_sample
+from cbagent.collectors.libstats.syscalls import (
+    SyscallStats,
+    parse_perf_intervals,
+)
+from cbagent.collectors.libstats.threadstats import parse_threads
+from cbagent.collectors.memcached_stats import (
+    Fragmentation,
+    MemcachedStats,
+    decode_stats,
+    parse_histograms,
+    parse_size_classes,
+    size_band,
+)
+from cbagent.collectors.ns_server import NSServerPerNode
+from cbagent.collectors.secondary_latency import (
+    SecondaryLatencyStats,
+    StatsFileTail,
+    parse_statsfile,
+)
+from cbagent.histograms import histogram_percentiles
+from cbagent.overhead import Overhead
+from cbagent.scheduler import TimerWheel
+from cbagent.stores import LocalStore
+from perfrunner.helpers.archive import extract_bundle, update_phase_markers
+from perfrunner.helpers.attribution import (
+    attribute,
+    window_means,
+    window_percentiles,
+)
+from perfrunner.helpers.metrics import MetricHelper, SeriesCache
+from perfrunner.helpers.quantiles import LogHistogram, windowed_histograms
+from perfrunner.helpers.reporter import ShowFastReporter
+from perfrunner.helpers.stats import (
+    IMPROVEMENT,
+    NO_CHANGE,
+    REGRESSION,
+    compare,
+    find_change_point,
+    save_baseline,
+    summarize,
+    verdict,
+)
+from perfrunner.helpers.steady_state import (
+    confidence_interval,
+    find_steady_state,
+)
 from perfrunner.settings import ClusterSpec, TestConfig
+from perfrunner.utils.kpi_stats import metric_threshold
 from perfrunner.workloads.bigfun.query_gen import new_queries
 from perfrunner.workloads.tcmalloc import KeyValueIterator, LargeIterator
 from spring import docgen
@@ -649,3 +712,657 @@ class PipelineTest(TestCase):
             with open(pipeline) as fh:
                 test_cases = json.load(fh)
                 self.assertEqual(stages, set(test_cases), pipeline)
+
+
+class SchedulerTest(TestCase):
+
+    def test_timer_wheel(self):
+        wheel = TimerWheel(tick=0.1, num_slots=10)
+        for deadline in 0.05, 0.25, 1.25, 2.5:
+            wheel.schedule(deadline, item=deadline)
+
+        expired = [item for _, item in wheel.advance(now=0.3)]
+        self.assertEqual(expired, [0.05, 0.25])
+
+        self.assertEqual(wheel.advance(now=1.0), [])
+
+        expired = [item for _, item in wheel.advance(now=3.0)]
+        self.assertEqual(expired, [1.25, 2.5])
+
+    def test_overhead_histogram(self):
+        overhead = Overhead('ns_server', track_process=False)
+        for duration in 0.005, 0.02, 0.02, 12:
+            overhead.add_sample(duration, missed_intervals=int(duration // 10))
+        overhead.add_error()
+
+        summary = overhead.summary()
+        self.assertEqual(summary['ns_server_samples_le_10ms'], 1)
+        self.assertEqual(summary['ns_server_samples_le_50ms'], 2)
+        self.assertEqual(summary['ns_server_samples_gt_5000ms'], 1)
+        self.assertEqual(summary['ns_server_sample_time_max'], 12000)
+        self.assertEqual(summary['ns_server_missed_intervals'], 1)
+        self.assertEqual(summary['ns_server_errors'], 1)
+        self.assertNotIn('ns_server_cpu', summary)
+
+        summary = overhead.summary(writer_stats={'points_dropped': 3})
+        self.assertEqual(summary['ns_server_samples_le_10ms'], 0)
+        self.assertEqual(summary['ns_server_missed_intervals'], 1)
+        self.assertEqual(summary['ns_server_points_dropped'], 3)
+
+
+class LocalStoreTest(TestCase):
+
+    def test_append_and_read(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            for timestamp, value in (3, 30), (1, 10), (2, 20):
+                store.append({'ops': value, 'state': 'healthy'},
+                             cluster='east', bucket='bucket-1',
+                             collector='ns_server', timestamp=timestamp)
+            store.close()
+
+            db = store.build_dbname(cluster='east', bucket='bucket-1',
+                                    collector='ns_server')
+            self.assertEqual(store.list_dbs(), [db])
+
+            timestamps, values = LocalStore(root).get_series(db, 'ops')
+            self.assertEqual(timestamps.tolist(), [1, 2, 3])
+            self.assertEqual(values.tolist(), [10, 20, 30])
+            self.assertEqual(store.get_values(db, 'state'), [])
+
+    def test_append_series(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            store.append({'ops': 10}, cluster='east', collector='ns_server',
+                         timestamp=1)
+            store.append_series('ops', np.array([2, 3]), np.array([20, 30]),
+                                cluster='east', collector='ns_server')
+            store.close()
+
+            db = store.build_dbname(cluster='east', collector='ns_server')
+            self.assertEqual(store.read_index(db)['collector'], 'ns_server')
+            self.assertEqual(store.get_values(db, 'ops'), [10, 20, 30])
+
+    def test_concurrent_writers(self):
+        with tempfile.TemporaryDirectory() as root:
+            first, second = LocalStore(root), LocalStore(root)
+            first.append({'ops': 10}, cluster='east', timestamp=1)
+            second.append({'cpu': 50}, cluster='east', timestamp=1)
+            first.append({'ops': 20, 'mem': 1}, cluster='east', timestamp=2)
+            first.close()
+            second.close()
+
+            db = first.build_dbname(cluster='east')
+            self.assertEqual(sorted(first.read_index(db)['metrics']),
+                             ['cpu', 'mem', 'ops'])
+            self.assertEqual(first.get_values(db, 'ops'), [10, 20])
+            self.assertEqual(first.get_values(db, 'cpu'), [50])
+            self.assertEqual(first.get_values(db, 'mem'), [1])
+
+    def test_series_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            for bucket in 'bucket-1', 'bucket-2':
+                store.append({'ops': 10}, cluster='east', bucket=bucket,
+                             collector='ns_server', timestamp=1)
+            store.close()
+
+            cache = SeriesCache(LocalStore(root))
+            keys = [(db, 'ops') for db in store.list_dbs()]
+            cache.prefetch(keys)
+            self.assertEqual(sorted(cache.series), sorted(keys))
+            self.assertIs(cache.get_series(*keys[0]), cache.series[keys[0]])
+            self.assertEqual(cache.get_values(*keys[1]), [10])
+
+    def test_phase_kpis(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            for timestamp, ops, cpu in (5, 500, 90), (10, 100, 20), (15, 100, 30), \
+                    (20, 50, 60), (25, 50, 80), (30, 100, 10):
+                store.append({'ops': ops, 'cpu_utilization_rate': cpu},
+                             cluster='east', bucket='bucket-1',
+                             collector='ns_server', timestamp=timestamp)
+            store.close()
+
+            metrics = MetricHelper.__new__(MetricHelper)
+            metrics.store = SeriesCache(LocalStore(root))
+            metrics.test_config = namedtuple('TestConfig', 'buckets name showfast')(
+                ['bucket-1'], 'rebalance_kv',
+                namedtuple('ShowFast', 'title order_by')('Rebalance-in', ''),
+            )
+            metrics.test = namedtuple(
+                'Test', 'COLLECTORS cbmonitor_clusters cbmonitor_snapshots phase_markers'
+            )(
+                {}, ['east'], ['east'],
+                [('rebalance', 20), ('pre_rebalance', 10), ('post_rebalance', 30)],
+            )
+
+            kpis = metrics.phase_kpis()
+            self.assertEqual(kpis['ops'], {'pre_rebalance': 100,
+                                           'rebalance': 50,
+                                           'post_rebalance': 100})
+            self.assertEqual(kpis['cpu_utilization'], {'pre_rebalance': 25,
+                                                       'rebalance': 70,
+                                                       'post_rebalance': 10})
+            self.assertEqual(kpis['disk_write_queue'], {})
+            self.assertNotIn('get_latency', kpis)
+
+            self.assertEqual(metrics.phase_degradation(),
+                             {'ops': 0.5, 'cpu_utilization': 2.8})
+
+            (cpu, _, cpu_info), (ops, _, ops_info) = metrics.degradation_ratios()
+            self.assertEqual((cpu, ops), (2.8, 0.5))
+            self.assertEqual(ops_info['id'], 'rebalance_kv_ops_rebalance_ratio')
+            self.assertFalse(cpu_info['higherIsBetter'])
+            self.assertTrue(ops_info['higherIsBetter'])
+
+
+class NSServerTest(TestCase):
+
+    def test_per_node_stats(self):
+        node_stats = {
+            '10.1.0.1': {'ops': 300, 'mem_used': 100, 'disk_write_queue': 5},
+            '10.1.0.2': {'ops': 100, 'mem_used': 100, 'disk_write_queue': 0},
+            '10.1.0.3': {},
+        }
+        with tempfile.TemporaryDirectory() as root:
+            collector = NSServerPerNode.__new__(NSServerPerNode)
+            collector.store = LocalStore(root)
+            collector.cluster = 'east'
+            collector.executor = None
+            collector.get_buckets = lambda: ['bucket-1']
+            collector.get_kv_nodes = lambda: sorted(node_stats)
+            collector._get_node_stats = lambda bucket, server: (
+                bucket, server, dict(node_stats[server]))
+            collector.sample()
+            collector.store.close()
+
+            self.assertEqual(len(collector.store.list_dbs()), 3)
+            db = collector.store.build_dbname(cluster='east', server='10.1.0.1',
+                                              bucket='bucket-1',
+                                              collector=collector.COLLECTOR)
+            self.assertEqual(collector.store.get_values(db, 'ops'), [300])
+
+            db = collector.store.build_dbname(cluster='east', bucket='bucket-1',
+                                              collector=collector.COLLECTOR)
+            self.assertEqual(collector.store.get_values(db, 'ops_max'), [300])
+            self.assertEqual(collector.store.get_values(db, 'ops_imbalance'), [1.5])
+            self.assertEqual(collector.store.get_values(db, 'mem_used_imbalance'), [1])
+            self.assertEqual(
+                collector.store.get_values(db, 'disk_write_queue_imbalance'), [2])
+
+
+class ArchiveTest(TestCase):
+
+    def test_update_phase_markers(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'east.tar.gz')
+            with tarfile.open(path, 'w:gz') as tar:
+                content = json.dumps({'version': 1, 'phase_markers': []}).encode()
+                info = tarfile.TarInfo('manifest.json')
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+
+            update_phase_markers(path, [('failover', 1), ('post_failover', 2)])
+            manifest = extract_bundle(path, os.path.join(tmp_dir, 'bundle'))
+            self.assertEqual(manifest['phase_markers'],
+                             [['failover', 1], ['post_failover', 2]])
+
+
+class ProcStatsTest(TestCase):
+
+    SAMPLE = """==> uptime
+{uptime} 100.00
+==> diskstats
+   8       0 sda {reads} 0 {sectors} 0 0 0 0 0 0 {io_ms} 0
+==> net_dev
+Inter-|   Receive
+  eth0: {bytes} 10 0 0 0 0 0 0 {bytes} 10 0 0 0 0 0 0
+==> tcp
+   0: 0100007F:1F90 00000000:0000 01 00000000:00000000
+==> meminfo
+MemFree:        1024 kB
+==> pid memcached
+1 (mc d) S 1 1 1 0 -1 0 0 0 0 0 {ticks} 0 0 0
+VmSize:\t    2048 kB
+VmRSS:\t    1024 kB"""
+
+    def test_rates(self):
+        sampler = ProcStats(hosts=['h'], workers=[], user='', password='')
+        sampler.devices = {'h': {'data': 'sda'}}
+        sampler.ifaces = {'h': 'eth0'}
+        sampler.clk_tck = {'h': 100}
+
+        values = {'uptime': 10, 'reads': 0, 'sectors': 0, 'io_ms': 0,
+                  'bytes': 0, 'ticks': 0}
+        self.assertEqual(sampler.compute_samples(
+            'h', self.SAMPLE.format(**values), server=True), {})
+
+        values = {'uptime': 12, 'reads': 200, 'sectors': 4000, 'io_ms': 1000,
+                  'bytes': 2000, 'ticks': 100}
+        samples = sampler.compute_samples(
+            'h', self.SAMPLE.format(**values), server=True)['h']
+
+        self.assertEqual(samples['atop'], {'memcached_rss': 1024 ** 2,
+                                           'memcached_vsize': 2 * 1024 ** 2,
+                                           'memcached_cpu': 50})
+        self.assertEqual(samples['iostat']['data_rps'], 100)
+        self.assertEqual(samples['iostat']['data_rbps'], 2000 * 512)
+        self.assertEqual(samples['iostat']['data_util'], 50)
+        self.assertEqual(samples['net']['in_bytes_per_sec'], 1000)
+        self.assertEqual(samples['net']['ESTABLISHED'], 1)
+        self.assertEqual(samples['meminfo'], {'MemFree': 1024 ** 2})
+
+    def test_perf_intervals(self):
+        lines = [
+            '# started on Mon Jan  1 00:00:00 2018',
+            '1.000,100,,syscalls:sys_enter_pread64,1000,100.00',
+            '1.000,<not supported>,,syscalls:sys_enter_fsync,0,100.00',
+            '2.000,300,,syscalls:sys_enter_pread64,1000,100.00',
+            '2.000,40,,syscalls:sys_enter_fsync,1000,100.00',
+            '3.000,5,,syscalls:sys_enter_pread64,1000,100.00',
+        ]
+        self.assertEqual(parse_perf_intervals(lines),
+                         {'pread64': 300, 'fsync': 40})
+        self.assertEqual(parse_perf_intervals(lines[:3]), {})
+
+    def test_syscall_rates(self):
+        sampler = SyscallStats(hosts=['h'], workers=[], user='', password='')
+        prev = {'uptime': 10, 'io': {'memcached': {'syscr': 100, 'rchar': 10}},
+                'perf': {}}
+        curr = {'uptime': 12, 'io': {'memcached': {'syscr': 300, 'rchar': 5}},
+                'perf': {'memcached': {'pread64': 50}}}
+        self.assertEqual(sampler.compute_rates(prev, curr), {
+            'memcached_syscr': 100,
+            'memcached_pread64': 50,
+        })
+
+    def test_thread_groups(self):
+        lines = [
+            '11 (mc:worker_0) S 1 1 1 0 -1 0 0 0 0 0 7 3 0 0|100 200 5|10 2',
+            '12 (mc:worker_1) S 1 1 1 0 -1 0 0 0 0 0 1 1 0 0|100 300 5|20 4',
+            '13 (mc:auxio) S 1 1 1 0 -1 0 0 0 0 0 1 1 0 0|100 300 5|',
+            '14 (mc:nonio) S 1 1 1 0 -1 0 0 0 0 0 1 1 0 0||3 4',
+            '15 (mc:nonio) S 1 1|100 300 5|3 4',
+        ]
+        threads = parse_threads(lines)
+        self.assertEqual(sorted(threads), ['11', '12'])
+        self.assertEqual(threads['11']['group'], 'mc_worker')
+        self.assertEqual(threads['11']['cpu_ticks'], 10)
+        self.assertEqual(threads['12']['runq_wait_ns'], 300)
+        self.assertEqual(threads['12']['involuntary'], 4)
+
+    def test_service_ports(self):
+        lines = [
+            'State  Recv-Q Send-Q Local Address:Port  Peer Address:Port',
+            'ESTAB  0      512    10.1.0.1:11210      10.1.0.9:40000',
+            '\t cubic bytes_acked:1000 bytes_received:200 retrans:0/3',
+            'ESTAB  10     0      [::ffff:10.1.0.1]:50000 10.2.0.1:11210',
+            '\t cubic bytes_acked:5000 bytes_received:100',
+        ]
+        connections = parse_ss(lines)
+        self.assertEqual(len(connections), 2)
+
+        kv, xdcr = connections.values()
+        self.assertEqual(kv['retrans'], 3)
+        self.assertEqual(xdcr['local'], ('10.1.0.1', 50000))
+        self.assertEqual(service_group(kv, {'10.1.0.1'}), 'kv')
+        self.assertEqual(service_group(xdcr, {'10.1.0.1'}), 'xdcr')
+        self.assertEqual(service_group(xdcr, {'10.1.0.1', '10.2.0.1'}), 'kv')
+
+        self.assertEqual(resolve_hosts(['localhost', '10.1.0.1']),
+                         {'127.0.0.1', '10.1.0.1'})
+
+
+class AgentTest(TestCase):
+
+    def test_sampler(self):
+        sampler = subprocess.Popen([sys.executable, '-u', '-c', SAMPLER],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   universal_newlines=True)
+        for request in (
+            {'id': 1, 'processes': ['python'], 'interval': 60},
+            {'id': 2, 'cmd': 'echo hello'},
+        ):
+            sampler.stdin.write(json.dumps(request) + '\n')
+        sampler.stdin.flush()
+
+        responses = {}
+        for _ in range(2):
+            response = json.loads(sampler.stdout.readline())
+            responses[response['id']] = response
+        sampler.stdin.close()
+        sampler.wait()
+        sampler.stdout.close()
+
+        sample = parse_sample(responses[1]['stdout'])
+        self.assertGreater(sample['uptime'], 0)
+        self.assertIn('MemTotal', sample['meminfo'])
+        self.assertGreater(sample['processes']['python']['cpu_ticks'], 0)
+        self.assertIn('hello', responses[2]['stdout'])
+
+    def test_late_response(self):
+        channel = AgentChannel('10.1.0.1', 'root', 'couchbase')
+        current, stream = Queue(maxsize=1), Queue(maxsize=1)
+        channel.pending = {2: current, 3: stream}  # Request 1 timed out
+        channel.streams = {(('memcached', ), 5): 3}
+
+        channel.read_responses(None, [
+            json.dumps({'id': request_id, 'stdout': stdout, 'rc': 0}) + '\n'
+            for request_id, stdout in ((1, 'stale'), (3, 'first'), (2, 'fresh'),
+                                       (3, 'second'))
+        ])
+        self.assertEqual(channel.receive(2, current), 'fresh')
+        self.assertEqual(channel.receive(3, stream), 'second')
+
+        queue = channel.pending[4] = Queue(maxsize=1)
+        with self.assertRaises(socket.timeout):
+            channel.receive(4, queue, timeout=0.01)
+        self.assertNotIn(4, channel.pending)
+
+
+class SecondaryLatencyTest(TestCase):
+
+    def test_tail(self):
+        with tempfile.NamedTemporaryFile(mode='w') as fh:
+            tail = StatsFileTail(fh.name)
+            fh.write('id:1, rows:0, duration:8632734534, Nth-latency:16686556\n'
+                     'id:1, rows:0, duration:340369')
+            fh.flush()
+            stats = parse_statsfile(tail.read())
+            self.assertEqual(stats['duration'].tolist(), [8632734534])
+            self.assertEqual(stats['Nth-latency'].tolist(), [16686556])
+
+            fh.write('3509, Nth-latency:6859285\n')
+            fh.flush()
+            stats = parse_statsfile(tail.read())
+            self.assertEqual(stats['duration'].tolist(), [3403693509])
+            self.assertEqual(stats['Nth-latency'].tolist(), [6859285])
+
+            self.assertEqual(parse_statsfile(tail.read())['duration'].size, 0)
+
+    def test_bulk_append(self):
+        with tempfile.NamedTemporaryFile(mode='w') as fh, \
+                tempfile.TemporaryDirectory() as root:
+            collector = SecondaryLatencyStats.__new__(SecondaryLatencyStats)
+            collector.store = LocalStore(root)
+            collector.tail = StatsFileTail(fh.name)
+            collector.cluster = 'east'
+            collector.interval = 1
+            collector.last_sample = None
+            collector.metrics = set()
+
+            fh.write('id:1, rows:0, duration:300, Nth-latency:10\n'
+                     'id:1, rows:0, duration:200, Nth-latency:20\n')
+            fh.flush()
+            collector.sample()
+            collector.store.close()
+
+            db = collector.store.build_dbname(cluster='east',
+                                              collector=collector.COLLECTOR)
+            timestamps, values = collector.store.get_series(db, 'Nth-latency')
+            self.assertEqual(values.tolist(), [10, 20])
+            self.assertEqual(timestamps.size, 2)
+            self.assertLess(timestamps[0], timestamps[1])
+
+
+class MemcachedStatsTest(TestCase):
+
+    def test_histogram_percentiles(self):
+        stats = {'bg_wait_0,10': '50', 'bg_wait_10,20': '40',
+                 'bg_wait_20,40': '10', 'ep_num_workers': '8'}
+        histograms = parse_histograms(stats)
+        self.assertEqual(list(histograms), ['bg_wait'])
+
+        bounds = sorted(histograms['bg_wait'])
+        lows, highs = zip(*bounds)
+        counts = [histograms['bg_wait'][b] for b in bounds]
+        percentiles = histogram_percentiles(lows, highs, counts, [50, 70, 95])
+        self.assertEqual(percentiles.tolist(), [10, 15, 30])
+
+    def test_bytes_stats(self):
+        collector = MemcachedStats.__new__(MemcachedStats)
+        collector.histograms = {}
+        for bg_wait in b'10', b'60':
+            stats = decode_stats({b'bg_wait_0,10': bg_wait,
+                                  b'bg_wait_10,20': b'0',
+                                  b'ep_num_workers': b'8'})
+            samples = collector.compute_stats('10.1.0.1', 'bucket-1', stats)
+        self.assertEqual(samples['ep_num_workers'], 8)
+        self.assertEqual(samples['bg_wait_50th'], 5)
+
+    def test_empty_buckets(self):
+        percentiles = histogram_percentiles([0, 100, 200], [100, 200, 500],
+                                            [10, 0, 30], [25, 50, 100])
+        self.assertEqual(percentiles.tolist(), [100, 300, 500])
+
+    def test_size_classes(self):
+        jemalloc = '''
+Merged arenas stats:
+bins:    size ind  allocated  nmalloc  curregs  curslabs  regs  pgs   util
+            8   0        800      200      100         1   512    1  0.195
+                     ---
+           96   7       9600      300      100         2   128    3  0.390
+large:    size ind  allocated  nmalloc  curlextents
+'''
+        self.assertEqual(parse_size_classes(jemalloc),
+                         {8: (800, 3296), 96: (9600, 14976)})
+
+        tcmalloc = 'class   1 [        8 bytes ] :     1000 objs;   0.0 MiB;   0.0 cum MiB'
+        self.assertEqual(parse_size_classes(tcmalloc), {8: (0, 8000)})
+
+        self.assertEqual(size_band(96), 'le_128')
+        self.assertEqual(size_band(20000), 'gt_16384')
+
+    def test_fragmentation(self):
+        stats = decode_stats({
+            b'mem_used': b'750',
+            b'total_heap_bytes': b'1000',
+            b'detailed': b'class   1 [        8 bytes ] :     1000 objs;',
+        })
+        collector = Fragmentation.__new__(Fragmentation)
+        samples = collector.compute_stats('10.1.0.1', 'bucket-1', stats)
+        self.assertEqual(samples['fragmentation_ratio'], 25)
+        self.assertEqual(samples['wasted_le_64_bytes'], 8000)
+
+
+class QuantilesTest(TestCase):
+
+    def test_relative_error(self):
+        values = np.random.lognormal(mean=0, sigma=2, size=10 ** 5)
+        histogram, other = LogHistogram(), LogHistogram()
+        histogram.add(values[:50000])
+        other.add(values[50000:])
+        histogram.merge(other)
+
+        self.assertEqual(histogram.count, values.size)
+        for percentile in 50, 90, 99, 99.9:
+            expected = np.percentile(values, percentile)
+            estimate = histogram.quantile(percentile)
+            self.assertLess(abs(estimate / expected - 1), 0.02)
+
+    def test_max_exact(self):
+        values = np.random.lognormal(mean=0, sigma=2, size=1000)
+        histogram = LogHistogram(max_exact=1000)
+        histogram.add(values[:500])
+        histogram.add(values[500:])
+        self.assertEqual(histogram.quantile(99), np.percentile(values, 99))
+        self.assertEqual(histogram.relative_error, 0)
+
+        histogram.add([1.0])
+        self.assertIsNone(histogram.exact)
+        self.assertEqual(histogram.count, 1001)
+        self.assertEqual(histogram.relative_error, 0.01)
+
+    def test_streamed_percentile(self):
+        values = np.random.lognormal(mean=0, sigma=2, size=1000)
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            store.CHUNK_SIZE = 300
+            store.append_series('latency_get', np.arange(1000), values,
+                                cluster='east', bucket='bucket-1',
+                                collector='spring_latency')
+            db = store.list_dbs()[0]
+            self.assertEqual([chunk.size for chunk in
+                              store.iter_values(db, 'latency_get')],
+                             [300, 300, 300, 100])
+
+            metrics = MetricHelper.__new__(MetricHelper)
+            metrics.store = SeriesCache(store)
+            metrics.MAX_EXACT_SAMPLES = 500
+            latency, error = metrics._percentile([db], 'latency_get', 99)
+            self.assertLess(abs(latency / np.percentile(values, 99) - 1), 0.02)
+            self.assertEqual(error, 0.01)
+            self.assertEqual(metrics.store.series, {})
+
+    def test_windows(self):
+        timestamps = np.arange(10) * 10 ** 9
+        values = np.arange(10, dtype=float)
+        histograms = windowed_histograms([(timestamps, values)],
+                                         boundaries=[3 * 10 ** 9, 7 * 10 ** 9])
+        self.assertEqual([h.count for h in histograms], [3, 4, 3])
+        self.assertEqual(histograms[0].quantile(0), 0)
+
+
+class SteadyStateTest(TestCase):
+
+    def test_warmup_and_cooldown(self):
+        np.random.seed(0)
+        values = np.concatenate([
+            np.linspace(0, 1000, 100),
+            np.random.normal(1000, 20, 800),
+            np.linspace(1000, 0, 100),
+        ])
+        steady = find_steady_state(values)
+        self.assertLessEqual(abs(steady.start - 100), 20)
+        self.assertLessEqual(abs(steady.stop - 900), 20)
+
+        mean, half_width = confidence_interval(values[steady])
+        self.assertLess(abs(mean - 1000), half_width + 5)
+        self.assertLess(half_width, 20)
+
+    def test_periodic_dips(self):
+        np.random.seed(0)
+        values = np.random.normal(1000, 20, 1200)
+        for start in range(60, 1200, 120):
+            values[start:start + 3] = 100
+        values[:60] = np.linspace(0, 1000, 60)
+
+        steady = find_steady_state(values)
+        self.assertLessEqual(abs(steady.start - 60), 20)
+        self.assertGreaterEqual(steady.stop, 1180)
+
+    def test_slow_decay(self):
+        np.random.seed(0)
+        values = np.linspace(1000, 900, 1000) + np.random.normal(0, 20, 1000)
+        self.assertEqual(find_steady_state(values), slice(0, 1000))
+
+    def test_no_steady_state(self):
+        self.assertIsNone(find_steady_state(np.linspace(0, 1000, 1000)))
+
+    def test_steady_values(self):
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalStore(root)
+            store.append_series('ops', np.arange(1000),
+                                np.linspace(0, 1000, 1000), cluster='east',
+                                bucket='bucket-1', collector='ns_server')
+            store.append_series('ops', np.arange(1000),
+                                np.random.normal(1000, 20, 1000), cluster='east',
+                                bucket='bucket-2', collector='ns_server')
+            dbs = store.list_dbs()
+
+            metrics = MetricHelper.__new__(MetricHelper)
+            metrics.store = SeriesCache(store)
+            self.assertEqual(metrics._steady_values(dbs, 'ops').size, 2000)
+
+
+class StatsTest(TestCase):
+
+    def test_verdict(self):
+        baseline = [100, 102, 98, 101, 99]
+        self.assertEqual(verdict(baseline, [80, 81, 79], threshold=-10),
+                         REGRESSION)
+        self.assertEqual(verdict(baseline, [80, 81, 79], threshold=-10,
+                                 higher_is_better=False),
+                         IMPROVEMENT)
+        self.assertEqual(verdict(baseline, [99, 101, 100], threshold=-10),
+                         NO_CHANGE)
+        self.assertEqual(verdict(baseline, [95, 96, 94], threshold=-10),
+                         NO_CHANGE)
+
+    def test_latency_regression(self):
+        baseline = {'values': [1.0, 1.1, 0.9, 1.0, 1.0]}
+        self.assertEqual(compare(baseline, [1.5, 1.4, 1.6], threshold=-10,
+                                 higher_is_better=False)['verdict'],
+                         REGRESSION)
+        self.assertEqual(compare(baseline, [1.5, 1.4, 1.6], threshold=-10,
+                                 higher_is_better=True)['verdict'],
+                         IMPROVEMENT)
+
+    def test_reporter_verdict(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'baseline.json')
+            save_baseline(path, {
+                'kv_95th_get_cluster': {'values': [1.0, 1.1, 0.9, 1.0, 1.0]},
+            })
+
+            reporter = ShowFastReporter.__new__(ShowFastReporter)
+            reporter.build = '5.5.0-1000'
+            reporter.cluster_spec = namedtuple('ClusterSpec', 'name')('cluster')
+            reporter.test_config = namedtuple('TestConfig', 'showfast stats_settings')(
+                namedtuple('ShowFast', 'baseline threshold')(path, -10),
+                namedtuple('StatsSettings', 'post_to_sf')(False),
+            )
+            benchmarks = []
+            reporter._log_benchmark = benchmarks.append
+
+            metric = {'id': 'kv_95th_get', 'title': '95th percentile GET latency',
+                      'orderBy': '', 'higherIsBetter': False}
+            reporter.post(1.5, [], metric)
+            self.assertEqual(benchmarks[0]['verdict'], REGRESSION)
+            self.assertNotIn('higherIsBetter', metric)
+
+    def test_summarize(self):
+        self.assertEqual(summarize([5])['ci_low'], 5)
+        self.assertEqual(summarize([5])['ci_high'], 5)
+        summary = summarize([4, 5, 6])
+        self.assertLess(summary['ci_low'], 5)
+        self.assertGreater(summary['ci_high'], 5)
+
+    def test_metric_threshold(self):
+        thresholds = {'kv_95th': 10, 'kv_95th_get': 5, 'kv_max_ops': -10}
+        self.assertEqual(metric_threshold('kv_95th_get_set_cluster',
+                                          thresholds, -10), 5)
+        self.assertEqual(metric_threshold('kv_95th_cluster', thresholds, -10), 10)
+        self.assertEqual(metric_threshold('rebalance_cluster', thresholds, -5), -5)
+
+    def test_change_point(self):
+        values = [100, 101, 99, 100, 102, 80, 81, 79, 80]
+        self.assertEqual(find_change_point(values), 5)
+        self.assertIsNone(find_change_point([100, 101, 99, 100, 102, 100]))
+
+
+class AttributionTest(TestCase):
+
+    def test_spikes(self):
+        np.random.seed(0)
+        timestamps = np.arange(60000) * 10 ** 7
+        latency = np.random.exponential(1, timestamps.size)
+        disk = np.random.normal(10, 1, 600)
+        cpu = np.random.normal(50, 5, 600)
+        for window in 100, 300, 450:
+            latency[window * 100:(window + 1) * 100] += 20
+            disk[window] += 30
+
+        boundaries = list(range(10 ** 9, 600 * 10 ** 9, 10 ** 9))
+        resources = {
+            name: window_means((np.arange(600) * 10 ** 9, values), boundaries)
+            for name, values in (('disk', disk), ('cpu', cpu))
+        }
+        latency = window_percentiles([(timestamps, latency)], boundaries, 99)
+        correlations, spikes = attribute(latency, resources)
+
+        self.assertGreater(correlations['disk'], 0)
+        self.assertEqual([spike['window'] for spike in spikes], [100, 300, 450])
+        self.assertEqual({spike['resource'] for spike in spikes}, {'disk'})